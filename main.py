@@ -5,6 +5,7 @@ Marvel Collector Bot - Main Entry Point
 Enhanced with performance optimization to prevent slowdowns
 """
 import asyncio
+import atexit
 from datetime import datetime
 import gc
 import logging
@@ -86,6 +87,7 @@ from modules.drop import (
     free_command,
     handle_message,
     jackpot_command,
+    message_pipeline,
     set_all_droptime_command,
     user_msgs,
 )
@@ -149,8 +151,8 @@ from modules.sell import (
 )
 from modules.session_manager import cleanup_session
 from modules.srarity import rarity_callback, srarity_command
-from modules.start import back_callback, help_callback, new_chat_members, start_command
-from modules.stats import stats_command
+from modules.start import back_callback, help_callback, left_chat_member, new_chat_members, start_command
+from modules.stats import stats_command, fetch_report_command
 from modules.status import status_command
 from modules.store import (
     buy_command,
@@ -166,6 +168,8 @@ from modules.store import (
 from modules.suggest import suggest_callback, suggest_command
 from modules.suggest import suggest_callback, suggest_command
 from modules.tdgoal import tdgoal_callback, tdgoal_command, track_collect_drop
+from modules.daily_counters import get_daily_counters
+from modules.drop_persistence import get_drop_persistence
 from modules.tokens import (
     balance_command,
     basket_command,
@@ -312,6 +316,22 @@ async def startup_initialization():
     except Exception as e:
         print(f"⚠️ Warning: Failed to initialize infinity stones system: {e}")
     
+    # Restore today's /tdtop counters and keep checkpointing them
+    try:
+        counters = get_daily_counters()
+        await counters.restore(get_database())
+        asyncio.create_task(counters.run_checkpoints())
+        atexit.register(counters.checkpoint_file)
+    except Exception as e:
+        print(f"⚠️ Warning: Failed to restore daily counters: {e}")
+    
+    # Bring back droptimes, counters, jackpots and live drops from the last run
+    try:
+        revived = await get_drop_persistence().start()
+        print(f"✅ Restored drop state for {revived} chats")
+    except Exception as e:
+        print(f"⚠️ Warning: Failed to restore drop state: {e}")
+    
     print("✅ Database initialized successfully")
     print("✅ Bot is ready to handle commands!")
     return True
@@ -396,6 +416,11 @@ async def new_members_handler(client: Client, message: Message):
     """Handle new chat members using the start module"""
     await new_chat_members(client, message)
 
+@app.on_message(filters.left_chat_member)
+async def left_member_handler(client: Client, message: Message):
+    """Handle members leaving using the start module"""
+    await left_chat_member(client, message)
+
 @app.on_callback_query(filters.regex("^help$"))
 async def help_handler(client: Client, callback_query: CallbackQuery):
     """Handle help callback using the start module"""
@@ -514,6 +539,12 @@ async def stats_handler(client: Client, message: Message):
     """Handle /stats command using the stats module"""
     await stats_command(client, message)
 
+@app.on_message(filters.command("fetchreport", prefixes=["/", ".", "!"]))
+@require_database
+async def fetch_report_handler(client: Client, message: Message):
+    """Handle /fetchreport command (per-call-site user fetch bytes and latency)"""
+    await fetch_report_command(client, message)
+
 @app.on_message(filters.command("search", prefixes=["/", ".", "!"]))
 @auto_register_user
 @require_database
@@ -550,7 +581,7 @@ async def daily_handler(client: Client, message: Message):
     # Track daily claim for tdgoal
     try:
         user_id = message.from_user.id
-        await track_collect_drop(user_id)
+        await track_collect_drop(user_id, source='daily')
     except Exception as e:
         print(f"tdgoal track_collect_drop error: {e}")
 
@@ -1278,14 +1309,7 @@ async def cancel_supreme_buy_callback_handler(client: Client, callback_query: Ca
 
 @app.on_message(filters.group)
 async def group_message_counter(client: Client, message: Message):
-    # Check ban status before counting messages
-    db = get_database()
-    user_id = message.from_user.id if message.from_user else None
-    if user_id:
-        from modules.ban_manager import check_user_ban_status
-        is_banned, _ = await check_user_ban_status(user_id, db)
-        if is_banned:
-            return  # Do not count messages from banned users
+    # Ban checks happen in the ingestion workers, not on the update path
     await handle_message(client, message)
 
 
@@ -1339,5 +1363,9 @@ if __name__ == "__main__":
     loop = asyncio.get_event_loop()
     loop.run_until_complete(startup_initialization())
     print("🔄 Starting bot...")
-    
+
     app.run()
+    # Finish queued group messages, flush write-behind logs and close the pool once the bot has stopped
+    loop.run_until_complete(message_pipeline.stop())
+    loop.run_until_complete(get_drop_persistence().close())
+    loop.run_until_complete(close_database())
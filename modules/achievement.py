@@ -37,20 +37,7 @@ async def achievement_command(client: Client, message: Message):
             return
         
         # Get user's collected characters count (all characters ever collected, including duplicates)
-        import json
-        collection_history = user.get('collection_history', [])
-        if isinstance(collection_history, str):
-            try:
-                collection_history = json.loads(collection_history)
-            except Exception:
-                collection_history = []
-        if collection_history is None:
-            collection_history = []
-        collected_count = 0
-        for entry in collection_history:
-            if isinstance(entry, dict) and entry.get('source') == 'collected':
-                collected_count += 1
-        unique_collection_count = collected_count
+        unique_collection_count = await db.count_collection_events(user_id)
         
         # Get claimed achievements
         claimed_achievements = user.get('claimed_achievements', [])
@@ -91,25 +78,12 @@ async def achievement_callback(client: Client, callback_query: CallbackQuery):
             pass
 
         # Get user data
-        import json
         user = await db.get_user(user_id)
         if not user:
             await callback_query.answer("❌ User not found!", show_alert=True)
             return
         # Get user's collected characters count (all characters ever collected, including duplicates)
-        collection_history = user.get('collection_history', [])
-        if isinstance(collection_history, str):
-            try:
-                collection_history = json.loads(collection_history)
-            except Exception:
-                collection_history = []
-        if collection_history is None:
-            collection_history = []
-        collected_count = 0
-        for entry in collection_history:
-            if isinstance(entry, dict) and entry.get('source') == 'collected':
-                collected_count += 1
-        unique_collection_count = collected_count
+        unique_collection_count = await db.count_collection_events(user_id)
         # Get claimed achievements
         claimed_achievements = user.get('claimed_achievements', [])
         if isinstance(claimed_achievements, str):
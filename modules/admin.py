@@ -61,7 +61,7 @@ async def sudo_command(client: Client, message: Message):
     db = get_database()
     
     # Check if user is already sudo
-    existing_user = await db.get_user(target_user_id)
+    existing_user = await db.get_user(target_user_id, fields=('sudo',))
     if existing_user and existing_user.get('sudo', False):
         await message.reply_text(f"✅ {target_user.first_name} is already a sudo admin!")
         return
@@ -113,7 +113,7 @@ async def og_command(client: Client, message: Message):
     db = get_database()
     
     # Check if user is already OG
-    existing_user = await db.get_user(target_user_id)
+    existing_user = await db.get_user(target_user_id, fields=('og',))
     if existing_user and existing_user.get('og', False):
         await message.reply_text(f"✅ {target_user.first_name} is already an OG admin!")
         return
@@ -161,7 +161,7 @@ async def view_admins_command(client: Client, message: Message):
     ogs = await (await db.users.find({'og': True})).to_list(length=None)
     msg = "<b>Marvel Collector Bot Admins 👑</b>\n\n"
     msg += "<b>👑 Owner:</b>\n"
-    owner_user = await db.get_user(OWNER_ID)
+    owner_user = await db.get_user(OWNER_ID, fields=('first_name',))
     if owner_user:
         owner_name = owner_user.get('first_name', 'Unknown')
         owner_id = owner_user.get('user_id', 'No ID')
@@ -267,7 +267,7 @@ async def send_info_panel(client, message_or_callback, user_id):
         
         is_admin = False
         if viewer_id:
-            viewer_data = await db.get_user(viewer_id)
+            viewer_data = await db.get_user(viewer_id, fields=('sudo', 'og'))
             if viewer_data:
                 is_admin = is_owner(viewer_id) or viewer_data.get('sudo') or viewer_data.get('og')
         
@@ -323,7 +323,7 @@ async def info_callback(client: Client, callback_query: CallbackQuery):
 
     # Check if user is admin
     viewer_id = callback_query.from_user.id
-    viewer_data = await db.get_user(viewer_id)
+    viewer_data = await db.get_user(viewer_id, fields=('sudo', 'og'))
     is_admin = False
     if viewer_data:
         is_admin = is_owner(viewer_id) or viewer_data.get('sudo') or viewer_data.get('og')
@@ -3,8 +3,8 @@ from pyrogram.enums import ChatType
 from pyrogram import Client, filters
 from modules.postgres_database import get_database, get_rarity_emoji
 from modules.decorators import is_owner, is_og
+from modules.expiry_scheduler import get_expiry_scheduler
 from datetime import datetime, timedelta, timezone
-import asyncio
 import os
 
 AUCTION_GROUP_ID = -1002621009797
@@ -121,15 +121,16 @@ async def auction_command(client: Client, message: Message):
     except Exception as e:
         print(f"Failed to pin auction message: {e}")
     await message.reply_text(f"✅ Auction created and announced in group!\nAuction ID: <code>{auction_id}</code>")
-    asyncio.create_task(end_auction_after(client, char_id, auction_id, end_time))
+    # end_time is naive UTC
+    get_expiry_scheduler().schedule_at(
+        end_time.replace(tzinfo=timezone.utc).timestamp(), end_auction, client, char_id, auction_id,
+        key=('auction', char_id)
+    )
 
-async def end_auction_after(client, char_id, auction_id, end_time):
-    now = datetime.utcnow()
-    wait_time = (end_time - now).total_seconds()
-    if wait_time > 0:
-        await asyncio.sleep(wait_time)
+async def end_auction(client, char_id, auction_id):
+    """Close an auction at its end time (run by the expiry scheduler)"""
     auction = ACTIVE_AUCTIONS.get(char_id)
-    if not auction or not auction['active']:
+    if not auction or not auction['active'] or auction['auction_id'] != auction_id:
         return
     auction['active'] = False
     char = auction['character']
@@ -203,8 +204,8 @@ async def bid_command(client: Client, message: Message):
         await message.reply_text("❌ <b>You are already the highest bidder. Wait for someone else to outbid you!</b>")
         return
     if datetime.utcnow() >= auction['end_time']:
+        # Left active so end_auction still settles it
         await message.reply_text("❌ <b>This auction has already ended!</b>")
-        auction['active'] = False
         return
     user = await db.get_user(user_id)
     if not user or user.get('wallet', 0) < amount:
@@ -346,4 +347,5 @@ async def cancel_auction_command(client: Client, message: Message):
         await db.update_user_wallet(auction['highest_bidder'], auction['highest_bid'])
     auction['active'] = False
     del ACTIVE_AUCTIONS[char_id]
+    get_expiry_scheduler().cancel(('auction', char_id))
     await message.reply_text(f"✅ Auction for character {char_id} has been cancelled and bidders refunded.")
@@ -1,9 +1,11 @@
 from datetime import datetime, timedelta
 from typing import Dict, Optional, Tuple
-import asyncio
 from collections import defaultdict
 import logging
 
+from .ban_registry import get_ban_registry
+from .expiry_scheduler import get_expiry_scheduler
+
 logger = logging.getLogger(__name__)
 
 class BanManager:
@@ -14,16 +16,38 @@ class BanManager:
         # Structure: {user_id: (ban_end_time, ban_reason)}
         self.temporary_bans: Dict[int, Tuple[datetime, str]] = {}
         self.ban_reasons: Dict[int, str] = {}
-        
-        # Start cleanup task
-        asyncio.create_task(self._cleanup_expired_bans())
+    
+    def _schedule_expiry(self, user_id: int, ban_end_time: datetime):
+        # Lifted exactly at the end time by the shared expiry scheduler
+        get_expiry_scheduler().schedule_at(
+            ban_end_time.timestamp(), self._expire_ban, user_id, key=('ban', user_id)
+        )
+    
+    def _expire_ban(self, user_id: int):
+        ban = self.temporary_bans.get(user_id)
+        if ban is not None and datetime.now() >= ban[0]:
+            self.remove_temporary_ban(user_id)
     
     def add_temporary_ban(self, user_id: int, duration_minutes: int = 10, reason: str = "Spam detected"):
         """Add a temporary ban to memory"""
         ban_end_time = datetime.now() + timedelta(minutes=duration_minutes)
         self.temporary_bans[user_id] = (ban_end_time, reason)
         self.ban_reasons[user_id] = reason
+        self._schedule_expiry(user_id, ban_end_time)
         logger.info(f"Temporary ban added for user {user_id} until {ban_end_time}")
+        return ban_end_time
+    
+    def apply_temporary_ban(self, user_id: int, until: float, reason: str = "Temporary ban"):
+        """Mirror a temporary ban made by another bot process (`until` is a Unix time)"""
+        ban_end_time = datetime.fromtimestamp(until)
+        if ban_end_time <= datetime.now():
+            return
+        current = self.temporary_bans.get(user_id)
+        if current is not None and current[0] >= ban_end_time - timedelta(seconds=1):
+            return  # our own ban coming back over the channel, or a longer one
+        self.temporary_bans[user_id] = (ban_end_time, reason)
+        self.ban_reasons[user_id] = reason
+        self._schedule_expiry(user_id, ban_end_time)
     
     def remove_temporary_ban(self, user_id: int):
         """Remove a temporary ban from memory"""
@@ -31,6 +55,7 @@ class BanManager:
             del self.temporary_bans[user_id]
         if user_id in self.ban_reasons:
             del self.ban_reasons[user_id]
+        get_expiry_scheduler().cancel(('ban', user_id))
         logger.info(f"Temporary ban removed for user {user_id}")
     
     def is_temporarily_banned(self, user_id: int) -> Tuple[bool, Optional[str]]:
@@ -105,30 +130,6 @@ class BanManager:
             logger.info(f"Force cleaned up {len(expired_users)} expired temporary bans")
         
         return len(expired_users)
-    
-    async def _cleanup_expired_bans(self):
-        """Periodically clean up expired temporary bans"""
-        while True:
-            try:
-                current_time = datetime.now()
-                expired_users = []
-                
-                for user_id, (ban_end_time, _) in self.temporary_bans.items():
-                    if current_time >= ban_end_time:
-                        expired_users.append(user_id)
-                
-                for user_id in expired_users:
-                    self.remove_temporary_ban(user_id)
-                
-                if expired_users:
-                    logger.info(f"Cleaned up {len(expired_users)} expired temporary bans")
-                
-                # Run cleanup every 30 seconds for more responsive unbanning
-                await asyncio.sleep(30)
-                
-            except Exception as e:
-                logger.error(f"Error in ban cleanup: {e}")
-                await asyncio.sleep(30)  # Wait 30 seconds before retrying
 
 # Global ban manager instance
 ban_manager = BanManager()
@@ -153,6 +154,13 @@ async def check_user_ban_status(user_id: int, db) -> Tuple[bool, Optional[str]]:
     
     return False, None
 
+def is_banned_in_memory(user_id: int) -> bool:
+    """Ban check that never waits on the database: temporary bans plus the permanent-ban registry
+    (a user counts as not banned while the registry can't be trusted)"""
+    if ban_manager.is_temporarily_banned(user_id)[0]:
+        return True
+    return bool(get_ban_registry().is_banned(user_id))
+
 async def ban_user(user_id: int, db, permanent: bool = False, duration_minutes: int = 10, reason: str = "Spam detected"):
     """
     Ban a user - temporary (in memory) or permanent (in database)
@@ -166,9 +174,12 @@ async def ban_user(user_id: int, db, permanent: bool = False, duration_minutes:
                 return True
         else:
             # Temporary ban - store in memory
-            ban_manager.add_temporary_ban(user_id, duration_minutes, reason)
+            ban_end_time = ban_manager.add_temporary_ban(user_id, duration_minutes, reason)
             # Also log in database for tracking
             await db.ban_user(user_id, permanent=False, duration_minutes=duration_minutes)
+            # Other bot processes keep their own temporary bans; tell them
+            if getattr(db, 'pool', None) is not None:
+                await get_ban_registry().publish(db.pool, f"temp:{user_id}:{ban_end_time.timestamp()}")
             return True
     except Exception as e:
         logger.error(f"Error banning user {user_id}: {e}")
@@ -179,7 +190,9 @@ async def unban_user(user_id: int, db):
     Unban a user from both temporary and permanent bans
     """
     try:
-        # Remove temporary ban if exists
+        # Remove temporary ban if exists (in every bot process)
+        if user_id in ban_manager.temporary_bans and getattr(db, 'pool', None) is not None:
+            await get_ban_registry().publish(db.pool, f"untemp:{user_id}")
         ban_manager.remove_temporary_ban(user_id)
         
         # Check if user exists in database first
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'bans_changed'
+
+
+class BanRegistry:
+    """Process-wide set of permanently banned user IDs.
+
+    `load` reads every banned ID once; after that a trigger on users sends
+    `<user_id>:t` / `<user_id>:f` over LISTEN/NOTIFY whenever is_banned
+    flips, from whichever process made the change, and the set is updated in
+    place. Temporary bans (kept in memory by ban_manager) travel over the
+    same channel as `temp:<user_id>:<until>` / `untemp:<user_id>`, so every
+    bot process enforces them. `is_banned` is a set lookup; it returns None
+    while nothing is loaded, or when the listener has been down for more
+    than `max_age` seconds, and callers fall back to the database then.
+    """
+
+    def __init__(self, max_age: int = 600):
+        self.max_age = max_age
+        self._banned: set = set()
+        self.loaded_at = None
+        self._pool = None
+        self._listener = None
+        self._listen_task: Optional[asyncio.Task] = None
+        self._load_lock = asyncio.Lock()
+        self.notifications = 0
+        self.lookups = 0
+
+    def __len__(self):
+        return len(self._banned)
+
+    @property
+    def listening(self) -> bool:
+        return self._listener is not None and not self._listener.is_closed()
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    def is_stale(self) -> bool:
+        if self.loaded_at is None:
+            return True
+        return not self.listening and time.time() - self.loaded_at > self.max_age
+
+    # --- Loading ---
+
+    async def load(self, pool):
+        """Replace the set with every banned user in the database"""
+        async with self._load_lock:
+            async with pool.acquire() as conn:
+                rows = await conn.fetch("SELECT user_id FROM users WHERE is_banned = TRUE")
+            self._banned = {row['user_id'] for row in rows}
+            self.loaded_at = time.time()
+        logger.info(f"Ban registry loaded with {len(self._banned)} banned users")
+
+    def start_listening(self, postgres_uri: str, pool, retry_delay: int = 10):
+        """Keep a LISTEN connection open; reconnects (and reloads) if it drops"""
+        self._pool = pool
+        if self._listen_task is None or self._listen_task.done():
+            self._listen_task = asyncio.create_task(self._listen(postgres_uri, retry_delay))
+
+    async def _listen(self, postgres_uri: str, retry_delay: int):
+        while True:
+            try:
+                self._listener = await asyncpg.connect(postgres_uri)
+                await self._listener.add_listener(NOTIFY_CHANNEL, self._on_notify)
+                # Bans changed while we weren't listening are picked up here
+                await self.load(self._pool)
+                while not self._listener.is_closed():
+                    await asyncio.sleep(retry_delay)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ban registry listener error: {e}")
+            finally:
+                if self._listener is not None and not self._listener.is_closed():
+                    await self._listener.close()
+                self._listener = None
+            await asyncio.sleep(retry_delay)
+
+    async def stop_listening(self):
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            try:
+                await self._listen_task
+            except asyncio.CancelledError:
+                pass
+            self._listen_task = None
+
+    def _on_notify(self, connection, pid, channel, payload: str):
+        self.notifications += 1
+        try:
+            self.apply(payload)
+        except (ValueError, IndexError) as e:
+            logger.error(f"Ignoring malformed ban notification {payload!r}: {e}")
+
+    def apply(self, payload: str):
+        """Apply one bans_changed payload"""
+        kind, _, rest = payload.partition(':')
+        if kind == 'temp':
+            user_id, until = rest.split(':')
+            from .ban_manager import ban_manager
+            ban_manager.apply_temporary_ban(int(user_id), float(until))
+        elif kind == 'untemp':
+            from .ban_manager import ban_manager
+            ban_manager.remove_temporary_ban(int(rest))
+        elif rest == 't':
+            self._banned.add(int(kind))
+        else:
+            self._banned.discard(int(kind))
+
+    async def publish(self, pool, payload: str):
+        """Tell every bot process (this one included) about a ban change"""
+        try:
+            async with pool.acquire() as conn:
+                await conn.execute("SELECT pg_notify($1, $2)", NOTIFY_CHANNEL, payload)
+        except Exception as e:
+            logger.error(f"Error publishing ban change {payload!r}: {e}")
+
+    # --- Updates made by this process (applied before the notification arrives) ---
+
+    def add(self, user_id: int):
+        self._banned.add(user_id)
+
+    def discard(self, user_id: int):
+        self._banned.discard(user_id)
+
+    def clear(self):
+        self._banned.clear()
+
+    # --- Reads ---
+
+    def is_banned(self, user_id: int) -> Optional[bool]:
+        """True/False from memory, or None when the registry can't be trusted"""
+        if self.is_stale():
+            return None
+        self.lookups += 1
+        return user_id in self._banned
+
+    def stats(self) -> dict:
+        return {
+            'banned': len(self._banned),
+            'loaded': self.loaded,
+            'listening': self.listening,
+            'notifications': self.notifications,
+            'lookups': self.lookups,
+        }
+
+
+_ban_registry = BanRegistry()
+
+
+def get_ban_registry() -> BanRegistry:
+    """Get the process-wide permanent ban registry"""
+    return _ban_registry
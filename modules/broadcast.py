@@ -2,65 +2,89 @@ from pyrogram import Client, filters
 from pyrogram.types import Message
 from modules.decorators import owner_only
 from modules.postgres_database import get_database
+from modules.broadcast_engine import BroadcastEngine, create_broadcast, get_unfinished_broadcast
 import asyncio
 
-REMOVED_GROUPS_FILE = "removed_groups.txt"
+# The broadcast being sent right now, if any ('engine' and 'task')
+_active = {}
 
-async def _broadcast_to_targets(client, targets, send_func, content_args, summary, is_group=False, db=None):
-    success, failed = 0, 0
-    removed_groups = []
-    for target_id in targets:
-        try:
-            if is_group:
-                try:
-                    chat = await client.get_chat(target_id)
-                    if chat.type not in ["group", "supergroup"]:
-                        continue
-                except Exception:
-                    # Only log the invalid group, do NOT remove from DB
-                    removed_groups.append(str(target_id))
-                    failed += 1
-                    continue
-            await send_func(target_id, **content_args)
-            success += 1
-        except Exception as e:
-            failed += 1
-        await asyncio.sleep(0.05)  # avoid hitting flood limits
-    summary['success'] += success
-    summary['failed'] += failed
-    # Export removed group IDs if any
-    if removed_groups:
-        async with asyncio.Lock():
-            with open(REMOVED_GROUPS_FILE, "a") as f:
-                for gid in removed_groups:
-                    f.write(gid + "\n")
+def _summary(stats):
+    return (
+        f"Success: {stats['success']}\nFailed: {stats['failed']}\n"
+        f"Unreachable (recorded as dead chats): {stats['dead']}"
+    )
+
+async def _run_broadcast(client, message: Message, broadcast: dict):
+    engine = BroadcastEngine(client, get_database().pool, broadcast)
+    _active['engine'] = engine
+    try:
+        stats = await engine.run()
+        await message.reply(f"Broadcast finished!\n{_summary(stats)}")
+    except asyncio.CancelledError:
+        pass  # stopped by /broadcast stop or shutdown; progress is saved
+    except Exception as e:
+        await message.reply(f"Broadcast interrupted: {e}\nUse /broadcast resume to continue.")
+    finally:
+        _active.clear()
+
+def _start(client, message: Message, broadcast: dict):
+    _active['task'] = asyncio.create_task(_run_broadcast(client, message, broadcast))
 
 @Client.on_message(filters.command("broadcast", prefixes=["/", ".", "!"]) & filters.private)
 @owner_only
 async def broadcast_command(client: Client, message: Message):
     db = get_database()
+    args = message.command[1:] if message.command else []
+    action = args[0].lower() if len(args) == 1 and not message.reply_to_message else None
+    if action == "status":
+        engine = _active.get('engine')
+        if engine:
+            stats = engine.stats()
+            await message.reply(f"Broadcast {stats['broadcast_id']} running.\n{_summary(stats)}\nFloodWaits: {stats['flood_waits']}")
+        else:
+            await message.reply("No broadcast is running.")
+        return
+    if action == "stop":
+        task = _active.get('task')
+        if task:
+            task.cancel()
+            await message.reply("Broadcast stopped. Use /broadcast resume to continue it.")
+        else:
+            await message.reply("No broadcast is running.")
+        return
+    if _active:
+        await message.reply("A broadcast is already running. Use /broadcast status or /broadcast stop.")
+        return
+    if action == "resume":
+        broadcast = await get_unfinished_broadcast(db.pool)
+        if not broadcast:
+            await message.reply("There is no unfinished broadcast to resume.")
+            return
+        await message.reply(f"Resuming broadcast {broadcast['broadcast_id']}...")
+        _start(client, message, broadcast)
+        return
     if not message.reply_to_message and not (message.text and len(message.command) > 1):
         await message.reply("Reply to a message or use /broadcast <text> to broadcast.")
         return
 
     # Determine content to send
     content_args = {}
-    send_func = client.send_message
+    method = "send_message"
     if message.reply_to_message:
         if message.reply_to_message.text:
             content_args['text'] = message.reply_to_message.text
         elif message.reply_to_message.photo:
-            send_func = client.send_photo
+            method = "send_photo"
             content_args['photo'] = message.reply_to_message.photo.file_id
             if message.reply_to_message.caption:
                 content_args['caption'] = message.reply_to_message.caption
         elif message.reply_to_message.video:
-            send_func = client.send_video
+            method = "send_video"
             content_args['video'] = message.reply_to_message.video.file_id
             if message.reply_to_message.caption:
                 content_args['caption'] = message.reply_to_message.caption
         elif message.reply_to_message.document:
-            send_func = client.send_document
+            method = "send_document"
             content_args['document'] = message.reply_to_message.document.file_id
             if message.reply_to_message.caption:
                 content_args['caption'] = message.reply_to_message.caption
@@ -71,18 +95,12 @@ async def broadcast_command(client: Client, message: Message):
         # /broadcast <text>
         content_args['text'] = message.text.split(None, 1)[1]
 
-    await message.reply("Broadcast started. This may take a while...")
-
-    # Get all user IDs and group IDs
-    user_ids = await db.get_all_user_ids()
-    group_ids = await db.get_all_group_ids()
-    summary = {'success': 0, 'failed': 0}
-
-    # Broadcast to users and groups
-    await _broadcast_to_targets(client, user_ids, send_func, content_args, summary)
-    await _broadcast_to_targets(client, group_ids, send_func, content_args, summary, is_group=True, db=db)
-
-    await message.reply(f"Broadcast finished!\nSuccess: {summary['success']}\nFailed: {summary['failed']}")
+    broadcast = await create_broadcast(db.pool, message.from_user.id, method, content_args)
+    await message.reply(
+        f"Broadcast {broadcast['broadcast_id']} started. This may take a while...\n"
+        "Use /broadcast status to check on it or /broadcast stop to pause it."
+    )
+    _start(client, message, broadcast)
 
 def register_broadcast_handler(app: Client):
     app.add_handler(broadcast_command) 
\ No newline at end of file
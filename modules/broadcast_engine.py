@@ -0,0 +1,264 @@
+import asyncio
+import json
+import logging
+import time
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from pyrogram.errors import (
+    ChannelInvalid, ChannelPrivate, ChatIdInvalid, ChatWriteForbidden, FloodWait, InputUserDeactivated,
+    UserIsBlocked,
+)
+
+logger = logging.getLogger(__name__)
+
+# Errors after which a chat can't receive anything from the bot. PeerIdInvalid isn't one of them:
+# it also comes up for reachable users the session hasn't met yet, so it counts as a plain failure.
+DEAD_CHAT_ERRORS = (
+    UserIsBlocked, InputUserDeactivated, ChatWriteForbidden, ChannelPrivate, ChatIdInvalid, ChannelInvalid,
+)
+# Dead chats are skipped for this long, then tried again (users unblock, bots get re-added)
+DEAD_CHAT_RETRY = timedelta(days=30)
+MAX_FLOOD_RETRIES = 5
+
+# One keyset-ordered target query per lane: $1 = last ID done (NULL to start), $2 = page size
+LANES = {
+    'users': '''
+        SELECT u.user_id AS chat_id FROM users u
+        WHERE ($1::bigint IS NULL OR u.user_id > $1)
+          AND NOT EXISTS (
+              SELECT 1 FROM dead_chats d WHERE d.chat_id = u.user_id AND d.detected_at > NOW() - $3::interval
+          )
+        ORDER BY u.user_id
+        LIMIT $2
+    ''',
+    'groups': '''
+        SELECT t.chat_id FROM (
+            SELECT chat_id FROM chat_settings WHERE $1::bigint IS NULL OR chat_id > $1
+            UNION
+            SELECT chat_id FROM group_members WHERE $1::bigint IS NULL OR chat_id > $1
+        ) t
+        WHERE t.chat_id < 0
+          AND NOT EXISTS (
+              SELECT 1 FROM dead_chats d WHERE d.chat_id = t.chat_id AND d.detected_at > NOW() - $3::interval
+          )
+        ORDER BY t.chat_id
+        LIMIT $2
+    ''',
+}
+
+
+class TokenBucket:
+    """`rate` sends per second on average, with bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _Lane:
+    def __init__(self, name: str, after: Optional[int], done: bool):
+        self.name = name
+        self.after = after
+        self.done = done
+        self.queued = after
+        self.pending: Dict[int, None] = {}  # IDs queued or in flight, ascending
+        self.paused_until = 0.0
+        self.queue: Optional[asyncio.Queue] = None
+
+    def checkpoint(self) -> Optional[int]:
+        """Largest ID such that every target up to it has been handled"""
+        if self.pending:
+            return next(iter(self.pending)) - 1
+        return self.queued
+
+
+class BroadcastEngine:
+    """Sends one broadcast to every user and group, resumably.
+
+    Targets are read from Postgres in keyset-ordered pages (users and groups
+    are separate lanes, each with its own bounded queue and `concurrency`
+    senders), so memory stays flat however many chats there are. All sends
+    share one token bucket kept under Telegram's global bot limit; each chat
+    gets a single message, so the per-chat limit only matters for retries.
+    A FloodWait pauses the lane that hit it for the requested time and the
+    message is retried, while the other lane keeps going. Every
+    `checkpoint_interval` seconds the progress of each lane (the last ID
+    below which everything is done), the counters and newly found dead chats
+    are written to the broadcasts and dead_chats tables; a broadcast that was
+    interrupted is resumed from its row (chats that completed out of order
+    above the checkpoint, at most the in-flight window, get it again).
+    """
+
+    def __init__(self, client, pool, broadcast: dict, rate: float = 25.0, concurrency: int = 8,
+                 page_size: int = 500, checkpoint_interval: float = 5.0):
+        self.pool = pool
+        self.broadcast_id = broadcast['broadcast_id']
+        self.send = getattr(client, broadcast['method'])
+        content = broadcast['content']
+        self.content = json.loads(content) if isinstance(content, str) else dict(content)
+        self.bucket = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.checkpoint_interval = checkpoint_interval
+        self.lanes = [_Lane(name, broadcast[f'{name}_after'], broadcast[f'{name}_done']) for name in LANES]
+        self.success = broadcast['success']
+        self.failed = broadcast['failed']
+        self.dead = broadcast['dead']
+        self.flood_waits = 0
+        self._dead_found: List[tuple] = []
+
+    async def run(self) -> dict:
+        """Send to every remaining target; returns the final stats"""
+        status = 'running'  # left as is if we crash, so the broadcast can be resumed
+        checkpointer = asyncio.create_task(self._checkpoint_loop())
+        lanes = [asyncio.create_task(self._run_lane(lane)) for lane in self.lanes if not lane.done]
+        try:
+            await asyncio.gather(*lanes)
+            status = 'finished'
+        except asyncio.CancelledError:
+            status = 'stopped'
+            raise
+        finally:
+            for task in lanes:
+                task.cancel()
+            checkpointer.cancel()
+            await asyncio.gather(checkpointer, *lanes, return_exceptions=True)
+            await self.save(status)
+        return self.stats()
+
+    async def _run_lane(self, lane: _Lane):
+        lane.queue = asyncio.Queue(maxsize=self.page_size)
+        producer = asyncio.create_task(self._produce(lane))
+        senders = [asyncio.create_task(self._send_loop(lane)) for _ in range(self.concurrency)]
+        try:
+            await producer
+            await lane.queue.join()
+        finally:
+            for task in senders:
+                task.cancel()
+            producer.cancel()
+            await asyncio.gather(producer, *senders, return_exceptions=True)
+        lane.done = True
+
+    async def _produce(self, lane: _Lane):
+        after = lane.after
+        while True:
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch(LANES[lane.name], after, self.page_size, DEAD_CHAT_RETRY)
+            if not rows:
+                return
+            for row in rows:
+                lane.pending[row['chat_id']] = None
+                lane.queued = row['chat_id']
+                await lane.queue.put(row['chat_id'])
+            after = rows[-1]['chat_id']
+
+    async def _send_loop(self, lane: _Lane):
+        while True:
+            chat_id = await lane.queue.get()
+            try:
+                await self._deliver(lane, chat_id)
+                lane.pending.pop(chat_id, None)  # a cancelled send stays pending, so resume retries it
+            finally:
+                lane.queue.task_done()
+
+    async def _deliver(self, lane: _Lane, chat_id: int):
+        for _ in range(MAX_FLOOD_RETRIES):
+            delay = lane.paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.bucket.acquire()
+            try:
+                await self.send(chat_id, **self.content)
+                self.success += 1
+                return
+            except FloodWait as e:
+                self.flood_waits += 1
+                lane.paused_until = max(lane.paused_until, time.monotonic() + e.value)
+                logger.warning(f"Broadcast {self.broadcast_id}: FloodWait {e.value}s, pausing {lane.name}")
+            except DEAD_CHAT_ERRORS as e:
+                self.dead += 1
+                self._dead_found.append((chat_id, type(e).__name__))
+                return
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"Broadcast {self.broadcast_id}: sending to {chat_id} failed: {e}")
+                return
+        self.failed += 1
+
+    async def _checkpoint_loop(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            await self.save('running')
+
+    async def save(self, status: str):
+        """Write progress, counters and newly found dead chats"""
+        dead, self._dead_found = self._dead_found, []
+        users, groups = self.lanes
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    if dead:
+                        await conn.executemany('''
+                            INSERT INTO dead_chats (chat_id, reason) VALUES ($1, $2)
+                            ON CONFLICT (chat_id) DO UPDATE SET reason = EXCLUDED.reason, detected_at = NOW()
+                        ''', dead)
+                    await conn.execute('''
+                        UPDATE broadcasts
+                        SET status = $2, users_after = $3, users_done = $4, groups_after = $5, groups_done = $6,
+                            success = $7, failed = $8, dead = $9, updated_at = NOW()
+                        WHERE broadcast_id = $1
+                    ''', self.broadcast_id, status, users.checkpoint(), users.done, groups.checkpoint(),
+                        groups.done, self.success, self.failed, self.dead)
+        except asyncio.CancelledError:
+            self._dead_found.extend(dead)
+            raise
+        except Exception as e:
+            self._dead_found.extend(dead)
+            logger.error(f"Error saving broadcast {self.broadcast_id} checkpoint: {e}")
+
+    def stats(self) -> dict:
+        return {
+            'broadcast_id': self.broadcast_id,
+            'success': self.success,
+            'failed': self.failed,
+            'dead': self.dead,
+            'flood_waits': self.flood_waits,
+            'queued': sum(len(lane.pending) for lane in self.lanes),
+            'lanes': {lane.name: {'after': lane.checkpoint(), 'done': lane.done} for lane in self.lanes},
+        }
+
+
+async def create_broadcast(pool, started_by: int, method: str, content: dict) -> dict:
+    """Record a new broadcast and return its row"""
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow('''
+            INSERT INTO broadcasts (started_by, method, content) VALUES ($1, $2, $3::jsonb)
+            RETURNING *
+        ''', started_by, method, json.dumps(content))
+    return dict(row)
+
+
+async def get_unfinished_broadcast(pool) -> Optional[dict]:
+    """The latest broadcast that was interrupted or stopped before reaching every target"""
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow('''
+            SELECT * FROM broadcasts WHERE status IN ('running', 'stopped')
+            ORDER BY broadcast_id DESC LIMIT 1
+        ''')
+    return dict(row) if row else None
@@ -0,0 +1,348 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'characters_changed'
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase a character name and collapse its whitespace"""
+    return ' '.join((name or '').lower().split())
+
+
+class CharacterCatalog:
+    """Process-wide in-memory snapshot of the characters table.
+
+    `warm` loads every row once at startup; after that a trigger on
+    characters sends the changed ID over LISTEN/NOTIFY and only that row is
+    re-read, so the snapshot tracks uploads, edits and deletes from any
+    process. Rows are indexed by ID, rarity, is_video and normalized name.
+    While the listener is connected the snapshot is authoritative and reads
+    never touch Postgres; otherwise misses fall back to one shared query per
+    ID and the whole table is reloaded every `max_age` seconds.
+    """
+
+    def __init__(self, max_age: int = 1800):
+        self.max_age = max_age
+        self.loaded_at = None
+        self.version = 0
+        self._rows: Dict[int, dict] = {}
+        self._by_rarity: Dict[str, Dict[int, None]] = {}
+        self._videos: Dict[int, None] = {}
+        self._by_name: Dict[str, Dict[int, None]] = {}
+        self._names: Dict[int, str] = {}
+        self._sorted: Dict[object, tuple] = {}  # memoised ordered views: key -> (version, rows)
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self._load_lock = asyncio.Lock()
+        self._pool = None
+        self._listener = None
+        self._listen_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.notifications = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def listening(self) -> bool:
+        return self._listener is not None and not self._listener.is_closed()
+
+    @property
+    def authoritative(self) -> bool:
+        return self.loaded_at is not None and self.listening
+
+    # --- Loading ---
+
+    def is_stale(self) -> bool:
+        if self.loaded_at is None:
+            return True
+        return not self.listening and time.time() - self.loaded_at > self.max_age
+
+    async def ensure_loaded(self, pool):
+        """Load the snapshot if it is empty, or stale while notifications are down"""
+        if not self.is_stale():
+            return
+        async with self._load_lock:
+            if self.is_stale():
+                await self.warm(pool)
+
+    async def warm(self, pool):
+        """Replace the snapshot with every row of the characters table"""
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("SELECT * FROM characters")
+        self._rows = {}
+        self._by_rarity = {}
+        self._videos = {}
+        self._by_name = {}
+        self._names = {}
+        for row in rows:
+            self._index(dict(row))
+        self.loaded_at = time.time()
+        self.version += 1
+        logger.info(f"Character catalog loaded with {len(rows)} characters")
+
+    def start_listening(self, postgres_uri: str, pool, retry_delay: int = 10):
+        """Keep a LISTEN connection open; reconnects (and reloads) if it drops.
+
+        Calling it again (e.g. after the pool was recreated) just points the
+        refreshes at the new pool.
+        """
+        self._pool = pool
+        if self._listen_task is None or self._listen_task.done():
+            self._listen_task = asyncio.create_task(self._listen(postgres_uri, retry_delay))
+
+    async def _listen(self, postgres_uri: str, retry_delay: int):
+        while True:
+            try:
+                self._listener = await asyncpg.connect(postgres_uri)
+                await self._listener.add_listener(NOTIFY_CHANNEL, self._on_notify)
+                # Anything changed while we weren't listening is picked up here
+                await self.warm(self._pool)
+                while not self._listener.is_closed():
+                    await asyncio.sleep(retry_delay)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Character catalog listener error: {e}")
+            finally:
+                if self._listener is not None and not self._listener.is_closed():
+                    await self._listener.close()
+                self._listener = None
+            await asyncio.sleep(retry_delay)
+
+    async def stop_listening(self):
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            try:
+                await self._listen_task
+            except asyncio.CancelledError:
+                pass
+            self._listen_task = None
+
+    def _on_notify(self, connection, pid, channel, payload: str):
+        self.notifications += 1
+        if payload == '*':
+            asyncio.create_task(self._reload())
+        else:
+            asyncio.create_task(self.refresh(self._pool, [int(payload)]))
+
+    async def _reload(self):
+        try:
+            await self.warm(self._pool)
+        except Exception as e:
+            logger.error(f"Error reloading character catalog: {e}")
+
+    async def refresh(self, pool, character_ids: Iterable[int]):
+        """Re-read some rows from the database (rows that are gone are dropped)"""
+        ids = list(dict.fromkeys(character_ids))
+        try:
+            async with pool.acquire() as conn:
+                rows = await conn.fetch("SELECT * FROM characters WHERE character_id = ANY($1::int[])", ids)
+        except Exception as e:
+            logger.error(f"Error refreshing characters {ids}: {e}")
+            for character_id in ids:
+                self.remove(character_id)  # fall back to a database read on next access
+            return
+        found = {row['character_id']: dict(row) for row in rows}
+        for character_id in ids:
+            if character_id in found:
+                self.put(found[character_id])
+            else:
+                self.remove(character_id)
+
+    # --- Maintenance ---
+
+    def put(self, row: dict):
+        """Insert or replace one character"""
+        if not row or row.get('character_id') is None:
+            return
+        self._unindex(row['character_id'])
+        self._index(row)
+        self.version += 1
+
+    def remove(self, character_id: int):
+        if self._unindex(character_id):
+            self.version += 1
+
+    def invalidate(self, character_id: int = None):
+        """Drop one row (or force a full reload) so the next read goes to the database"""
+        if character_id is None:
+            self.loaded_at = None
+        else:
+            self.remove(character_id)
+
+    def _index(self, row: dict):
+        character_id = row['character_id']
+        self._rows[character_id] = row
+        self._by_rarity.setdefault(row.get('rarity'), {})[character_id] = None
+        if row.get('is_video') in (True, 'true'):
+            self._videos[character_id] = None
+        name = normalize_name(row.get('name'))
+        self._names[character_id] = name
+        self._by_name.setdefault(name, {})[character_id] = None
+
+    def _unindex(self, character_id: int) -> bool:
+        row = self._rows.pop(character_id, None)
+        if row is None:
+            return False
+        ids = self._by_rarity.get(row.get('rarity'))
+        if ids is not None:
+            ids.pop(character_id, None)
+            if not ids:
+                del self._by_rarity[row.get('rarity')]
+        self._videos.pop(character_id, None)
+        name = self._names.pop(character_id, None)
+        ids = self._by_name.get(name)
+        if ids is not None:
+            ids.pop(character_id, None)
+            if not ids:
+                del self._by_name[name]
+        return True
+
+    # --- Lookups by ID ---
+
+    async def get(self, pool, character_id: int) -> Optional[dict]:
+        row = self._rows.get(character_id)
+        if row is not None or self.authoritative:
+            self.hits += 1
+            return row
+        return (await self._load(pool, [character_id])).get(character_id)
+
+    async def get_many(self, pool, character_ids: Iterable[int]) -> Dict[int, dict]:
+        """Rows for the given IDs (missing IDs are simply absent)"""
+        found = {}
+        missing = []
+        for character_id in dict.fromkeys(character_ids):
+            row = self._rows.get(character_id)
+            if row is not None or self.authoritative:
+                self.hits += 1
+                if row is not None:
+                    found[character_id] = row
+            else:
+                missing.append(character_id)
+        if missing:
+            found.update(await self._load(pool, missing))
+        return found
+
+    async def _load(self, pool, character_ids) -> Dict[int, dict]:
+        # Misses while the snapshot isn't authoritative; concurrent misses share a query
+        found = {}
+        waiting = {}
+        owned = {}
+        for character_id in character_ids:
+            pending = self._inflight.get(character_id)
+            if pending is not None:
+                self.coalesced += 1
+                waiting[character_id] = pending
+            else:
+                self.misses += 1
+                owned[character_id] = self._inflight[character_id] = asyncio.get_running_loop().create_future()
+        if owned:
+            try:
+                async with pool.acquire() as conn:
+                    rows = await conn.fetch(
+                        "SELECT * FROM characters WHERE character_id = ANY($1::int[])", list(owned)
+                    )
+            except Exception as e:
+                for character_id, future in owned.items():
+                    self._inflight.pop(character_id, None)
+                    future.set_exception(e)
+                    future.exception()  # waiters re-raise it; don't warn when there are none
+                raise
+            loaded = {row['character_id']: dict(row) for row in rows}
+            for character_id, future in owned.items():
+                self._inflight.pop(character_id, None)
+                row = loaded.get(character_id)
+                if row is not None:
+                    self.put(row)
+                    found[character_id] = row
+                future.set_result(row)
+        for character_id, future in waiting.items():
+            row = await asyncio.shield(future)
+            if row is not None:
+                found[character_id] = row
+        return found
+
+    # --- Snapshot queries (call ensure_loaded first) ---
+
+    def _ordered(self, key, ids: Callable[[], Iterable[int]], sort_key: Callable = None) -> List[dict]:
+        cached = self._sorted.get(key)
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+        rows = [self._rows[i] for i in ids()]
+        rows.sort(key=sort_key or (lambda r: r['character_id']))
+        self._sorted[key] = (self.version, rows)
+        return rows
+
+    def all(self) -> List[dict]:
+        """Every character, ordered by ID"""
+        return self._ordered('all', lambda: self._rows)
+
+    def by_rarity(self, rarity: str, order_by: str = 'character_id') -> List[dict]:
+        """Characters of one rarity, ordered by ID or by name"""
+        sort_key = (lambda r: (r.get('name') or '', r['character_id'])) if order_by == 'name' else None
+        return self._ordered(('rarity', rarity, order_by), lambda: self._by_rarity.get(rarity, ()), sort_key)
+
+    def videos(self) -> List[dict]:
+        return self._ordered('videos', lambda: self._videos)
+
+    def by_name(self, name: str) -> List[dict]:
+        """Characters whose normalized name equals `name` (normalized here too)"""
+        return [self._rows[i] for i in self._by_name.get(normalize_name(name), ())]
+
+    def search_name(self, query: str) -> List[dict]:
+        """Characters whose normalized name contains `query`, ordered by ID"""
+        query = normalize_name(query)
+        return [row for row in self.all() if query in self._names[row['character_id']]]
+
+    def peek(self, character_id: int) -> Optional[dict]:
+        """The snapshot row for an ID, without any database fallback"""
+        return self._rows.get(character_id)
+
+    def normalized_name(self, character_id: int) -> Optional[str]:
+        return self._names.get(character_id)
+
+    def count(self, rarity: str = None) -> int:
+        if rarity is None:
+            return len(self._rows)
+        return len(self._by_rarity.get(rarity, ()))
+
+    def rarity_counts(self) -> Dict[str, int]:
+        return {rarity: len(ids) for rarity, ids in self._by_rarity.items()}
+
+    def latest(self, limit: int = 5) -> List[dict]:
+        return self.all()[-limit:][::-1]
+
+    def filter(self, predicate: Callable[[dict], bool], key: str = None) -> List[dict]:
+        """Characters matching `predicate`, ordered by ID; pass a `key` to reuse the result until the catalog changes"""
+        if key is None:
+            return [row for row in self.all() if predicate(row)]
+        return self._ordered(('filter', key), lambda: [row['character_id'] for row in self.all() if predicate(row)])
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'size': len(self._rows),
+            'version': self.version,
+            'listening': self.listening,
+            'notifications': self.notifications,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
+
+
+_character_catalog = CharacterCatalog()
+
+
+def get_character_catalog() -> CharacterCatalog:
+    """Get the process-wide character catalog"""
+    return _character_catalog
@@ -0,0 +1,72 @@
+import random
+from typing import Dict, Iterable, List, Optional
+
+from modules.character_catalog import CharacterCatalog, get_character_catalog
+
+
+class CharacterIdIndex:
+    """Per-rarity character arrays for uniform random picks without ORDER BY RANDOM().
+
+    The arrays are the catalog's own by-rarity views, picked up again
+    whenever the catalog version changes, so the index sees every upload,
+    edit and delete the catalog does (from any process, via LISTEN/NOTIFY)
+    and holds no rows of its own. Picks are uniform over every character
+    whose rarity passes the filter, exactly like sorting the filtered table
+    by RANDOM(), and multi-picks are without replacement.
+    """
+
+    def __init__(self, catalog: CharacterCatalog = None):
+        self.catalog = catalog or get_character_catalog()
+        self._version = None
+        self._pools: Dict[str, List[dict]] = {}
+
+    def __len__(self):
+        return sum(len(pool) for pool in self._pools.values())
+
+    # --- Loading ---
+
+    async def ensure_loaded(self, pool):
+        """Load the catalog if needed and pick up its current arrays"""
+        await self.catalog.ensure_loaded(pool)
+        self.sync()
+
+    def sync(self):
+        """Re-read the per-rarity arrays if the catalog changed since the last sync"""
+        if self._version == self.catalog.version:
+            return
+        self._pools = {
+            rarity: self.catalog.by_rarity(rarity)
+            for rarity in self.catalog.rarity_counts() if rarity is not None
+        }
+        self._version = self.catalog.version
+
+    # --- Sampling ---
+
+    def sample(self, rarities: Optional[Iterable[str]] = None, excluded: Optional[Iterable[str]] = None,
+               count: int = 1, rng=random) -> List[dict]:
+        """Pick up to `count` distinct catalog rows uniformly from the matching rarities"""
+        if count <= 0:
+            return []
+        wanted = set(rarities) if rarities is not None else set(self._pools)
+        wanted -= set(excluded or ())
+        pools = [self._pools[r] for r in wanted if r in self._pools]
+        total = sum(len(p) for p in pools)
+        if not total:
+            return []
+        picked = []
+        for offset in rng.sample(range(total), min(count, total)):
+            # Map the flat offset onto its rarity array (at most 13 pools)
+            for pool in pools:
+                if offset < len(pool):
+                    picked.append(pool[offset])
+                    break
+                offset -= len(pool)
+        return picked
+
+
+_character_id_index = CharacterIdIndex()
+
+
+def get_character_id_index() -> CharacterIdIndex:
+    """Get the process-wide character ID index"""
+    return _character_id_index
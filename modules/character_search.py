@@ -0,0 +1,163 @@
+import re
+from bisect import bisect_right
+from collections import OrderedDict
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+
+from modules.character_catalog import CharacterCatalog, get_character_catalog, normalize_name
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def trigrams(text: str) -> set:
+    """pg_trgm-style trigrams: each word padded with two spaces in front and one behind"""
+    grams = set()
+    for word in _WORD_RE.findall(text.lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def page_by_id(rows: List[dict], cursor: str, limit: int) -> Tuple[List[dict], str]:
+    """Keyset page of ID-ordered rows: `cursor` is the last ID already shown"""
+    try:
+        after = int(cursor) if cursor else None
+    except ValueError:
+        after = None
+    start = bisect_right(rows, after, key=itemgetter('character_id')) if after is not None else 0
+    page = rows[start:start + limit]
+    next_cursor = str(page[-1]['character_id']) if page and start + limit < len(rows) else ""
+    return page, next_cursor
+
+
+class CharacterSearchIndex:
+    """Ranked fuzzy name search over the character catalog.
+
+    Names are indexed by pg_trgm-style trigrams (the same similarity the
+    `idx_characters_name_trgm` GIN index uses); the padded leading trigrams
+    double as a word-prefix index. A match
+    is any name that contains the query, has a word starting with it, or is
+    at least `threshold` similar; exact and prefix matches rank first.
+    Ranked results are kept per normalized query in a small LRU until the
+    catalog changes, so the keystrokes of one inline query, and paging
+    through its results, do no work beyond a bisect. Pages are keyset based:
+    the cursor is the sort key of the last row shown.
+    """
+
+    def __init__(self, catalog: CharacterCatalog, threshold: float = 0.3, cache_size: int = 256):
+        self.catalog = catalog
+        self.threshold = threshold
+        self.cache_size = cache_size
+        self._version = None
+        self._grams: Dict[str, set] = {}
+        self._name_grams: Dict[int, int] = {}
+        self._results: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _sync(self):
+        # Rebuilt from scratch when the catalog changes; character edits are rare
+        if self._version == self.catalog.version:
+            return
+        grams: Dict[str, set] = {}
+        name_grams = {}
+        for row in self.catalog.all():
+            character_id = row['character_id']
+            row_grams = trigrams(self.catalog.normalized_name(character_id) or '')
+            name_grams[character_id] = len(row_grams)
+            for gram in row_grams:
+                grams.setdefault(gram, set()).add(character_id)
+        self._grams = grams
+        self._name_grams = name_grams
+        self._results.clear()
+        self._version = self.catalog.version
+
+    def _score(self, query: str, name: str, similarity: float) -> float:
+        if name == query:
+            return 3.0
+        score = similarity
+        if name.startswith(query):
+            score += 1.5
+        elif any(word.startswith(query) for word in name.split()):
+            score += 1.0
+        elif query in name:
+            score += 0.5
+        return score
+
+    def search(self, query: str) -> Tuple[List[tuple], List[dict]]:
+        """Every match for `query`, best first, as (sort keys, rows); a key is (-score, id)"""
+        self._sync()
+        query = normalize_name(query)
+        cached = self._results.get(query)
+        if cached is not None:
+            self.hits += 1
+            self._results.move_to_end(query)
+            return cached
+        self.misses += 1
+        query_grams = trigrams(query)
+        shared: Dict[int, int] = {}
+        for gram in query_grams:
+            for character_id in self._grams.get(gram, ()):
+                shared[character_id] = shared.get(character_id, 0) + 1
+        if len(query) < 3:
+            # Too short for a trigram to cover a match inside a word
+            candidates = (row['character_id'] for row in self.catalog.all())
+        else:
+            candidates = shared
+        ranked = []
+        for character_id in candidates:
+            name = self.catalog.normalized_name(character_id)
+            if name is None:
+                continue
+            common = shared.get(character_id, 0)
+            union = len(query_grams) + self._name_grams.get(character_id, 0) - common
+            similarity = common / union if union else 0.0
+            if similarity < self.threshold and query not in name:
+                continue
+            score = round(self._score(query, name, similarity), 4)
+            ranked.append(((-score, character_id), self.catalog.peek(character_id)))
+        ranked.sort(key=lambda item: item[0])
+        result = ([key for key, _ in ranked], [row for _, row in ranked])
+        self._results[query] = result
+        if len(self._results) > self.cache_size:
+            self._results.popitem(last=False)
+        return result
+
+    def page(self, query: str, cursor: str, limit: int) -> Tuple[List[dict], str, int]:
+        """One page of matches after `cursor`; returns (rows, next_cursor, total)"""
+        keys, rows = self.search(query)
+        start = 0
+        key = self.parse_cursor(cursor)
+        if key is not None:
+            start = bisect_right(keys, key)
+        page = rows[start:start + limit]
+        next_cursor = ""
+        if page and start + limit < len(rows):
+            score, character_id = keys[start + len(page) - 1]
+            next_cursor = f"{-score}:{character_id}"
+        return page, next_cursor, len(rows)
+
+    @staticmethod
+    def parse_cursor(cursor: str) -> Optional[tuple]:
+        try:
+            score, character_id = cursor.split(':')
+            return (-float(score), int(character_id))
+        except (AttributeError, ValueError):
+            return None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'cached_queries': len(self._results),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_character_search = CharacterSearchIndex(get_character_catalog())
+
+
+def get_character_search() -> CharacterSearchIndex:
+    """Get the process-wide character name search index"""
+    return _character_search
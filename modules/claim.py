@@ -9,6 +9,7 @@ if os.environ.get('USE_POSTGRESQL', 'false').lower() == 'true':
 else:
     from .database import get_database, get_rarity_emoji, RARITIES, RARITY_EMOJIS, get_rarity_display
 from .decorators import check_banned
+from .daily_counters import get_daily_counters
 
 # Hardcoded locked rarities for claim
 LOCKED_RARITIES = [
@@ -98,7 +99,8 @@ async def claim_command(client: Client, message: Message):
             )
             return
         # Add character to user's collection
-        await db.add_character_to_user(user_id, character['character_id'])
+        await db.add_character_to_user(user_id, character['character_id'], source='claim')
+        get_daily_counters().increment(user_id, message.from_user.first_name)
         # Update last claim time (skip for owner)
         if not is_owner:
             await db.update_user(user_id, {'last_claim': datetime.now()})
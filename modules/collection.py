@@ -4,13 +4,14 @@ import os
 
 # Import database based on configuration
 from modules.postgres_database import get_database
+from modules.collection_view import get_collection_views, page_slice
 import random
 import re
-from collections import Counter
 import asyncio
 from datetime import datetime
 
 ITEMS_PER_PAGE = 10
+LARGE_COLLECTION = 5000  # unique characters; bigger collections are paged in SQL instead of cached
 
 # Separate rarity definitions
 RARITY_DATA = {
@@ -83,6 +84,30 @@ def get_rarity_level(rarity_full: str) -> int:
             return data["level"]
     return 0  # Default fallback
 
+async def _get_collection_view(db, user_id: int):
+    """(view, None) from the view cache, or (None, summary) for a collection too big to hold in memory"""
+    views = get_collection_views()
+    if views.peek(user_id) is None and hasattr(db, 'get_user_collection_summary'):
+        summary = await db.get_user_collection_summary(user_id)
+        if summary['unique'] > LARGE_COLLECTION:
+            return None, summary
+    return await views.get(db, user_id), None
+
+# Display orders a user can pick; applied when reading, the stored collection is never reordered
+SORT_KEYS = {
+    "rarity": lambda c: (-get_rarity_level(c['rarity']), c['character_id']),
+    "name": lambda c: ((c['name'] or '').lower(), c['character_id']),
+    "recent": lambda c: -c['acquired'],
+}
+
+def _view_rows(view, mode, rarity_filter, sort=None):
+    """The view's rows in display order: the user's sort, else highest rarity first in detailed mode, else by ID"""
+    if sort is None and mode == "detailed" and not rarity_filter:
+        sort = "rarity"
+    if sort in SORT_KEYS:
+        return view.rows(rarity_filter, order=sort, key=SORT_KEYS[sort])
+    return view.rows(rarity_filter)
+
 async def collection_command(client, message: Message):
     """Handle /mycollection command (Pyrogram version)"""
     try:
@@ -137,10 +162,11 @@ async def collection_command(client, message: Message):
         preferences = await db.get_user_preferences(user_id)
         mode = preferences.get('mode', 'default')
         rarity_filter = preferences.get('filter', None)
+        sort = preferences.get('sort', None)
 
-        # Get unique character count using optimized method
-        collection = await db.get_user_collection(user_id)
-        unique_count = len(collection)
+        # Unique count from the cached collection view (reused by the page below)
+        view, summary = await _get_collection_view(db, user_id)
+        unique_count = len(view) if view is not None else summary['unique']
 
         # Create keyboard with inline query button
         keyboard = InlineKeyboardMarkup([
@@ -156,7 +182,8 @@ async def collection_command(client, message: Message):
             mode=mode,
             rarity_filter=rarity_filter,
             reply_markup=keyboard,
-            from_user=message.from_user
+            from_user=message.from_user,
+            sort=sort
         )
     except Exception as e:
         print(f"Error in collection_command: {e}")
@@ -199,25 +226,34 @@ async def batch_fetch_characters(db, char_ids, batch_size=500):
         char_docs = [doc for batch in results for doc in batch]
         return char_docs
 
-async def show_collection_page(client, message, user_id: int, page: int, mode='default', rarity_filter=None, reply_markup=None, from_user=None, callback_query=None):
+async def show_collection_page(client, message, user_id: int, page: int, mode='default', rarity_filter=None, reply_markup=None, from_user=None, callback_query=None, cursor=None, sort=None):
     """Show a page of the user's collection (Pyrogram version)"""
     try:
         db = get_database()
         # Get user data using PostgreSQL-compatible method
         if hasattr(db, 'pool'):  # PostgreSQL
-            user_data = await db.get_user(user_id)
+            user_data = await db.get_user(user_id, fields=['first_name', 'favorite_character'])
         else:  # MongoDB
             user_data = await db.users.find_one({"user_id": user_id}, {"user_id": 1, "first_name": 1, "favorite_character": 1})
         
-        collection = await db.get_user_collection(user_id)
-        total_items = len(collection)
-        if rarity_filter:
-            collection = [c for c in collection if c['rarity'] == rarity_filter]
-        total_pages = max(1, (len(collection) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
-        page = max(1, min(page, total_pages))
-        start_idx = (page - 1) * ITEMS_PER_PAGE
-        end_idx = min(start_idx + ITEMS_PER_PAGE, len(collection))
-        current_page_items = collection[start_idx:end_idx]
+        view, summary = await _get_collection_view(db, user_id)
+        cursors = None
+        if view is not None:
+            total_items = len(view)
+            collection = _view_rows(view, mode, rarity_filter, sort)
+            current_page_items, page, total_pages = page_slice(collection, page, ITEMS_PER_PAGE)
+        else:
+            # Huge collection: fetch only this page by keyset; totals come from the summary
+            total_items = summary['unique']
+            filtered_total = summary['rarities'].get(rarity_filter, 0) if rarity_filter else total_items
+            total_pages = max(1, (filtered_total + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
+            page = max(1, min(page, total_pages)) if cursor else 1
+            # Name order has no compact keyset cursor, so it pages by ID here
+            result = await db.get_user_collection_page(
+                user_id, mode, rarity_filter, cursor, ITEMS_PER_PAGE, sort if sort in ("rarity", "recent") else None
+            )
+            collection = current_page_items = result['items']
+            cursors = (result['prev'], result['next'])
         display_name = from_user.first_name if from_user else user_data.get('first_name', 'User')
         text = _create_collection_message(
             display_name,
@@ -228,7 +264,7 @@ async def show_collection_page(client, message, user_id: int, page: int, mode='d
             mode=mode,
             rarity_filter=rarity_filter
         )
-        keyboard = _create_keyboard(page, total_pages, user_id, total_items)
+        keyboard = _create_keyboard(page, total_pages, user_id, total_items, cursors)
         reply_markup = keyboard
         # Only fetch favorite_character if needed
         favorite_id = None
@@ -236,54 +272,19 @@ async def show_collection_page(client, message, user_id: int, page: int, mode='d
             favorite_id = user_data.get('favorite_character')
         favorite_char = None
         if favorite_id:
-            # Use batch fetch for favorite character
-            if hasattr(db, 'pool'):  # PostgreSQL
-                async with db.pool.acquire() as conn:
-                    char_docs = await conn.fetch(
-                        "SELECT character_id, name, rarity, file_id, img_url, is_video FROM characters WHERE character_id = $1",
-                        favorite_id
-                    )
-                    char_docs = [dict(char) for char in char_docs]
-            else:  # MongoDB
-                char_docs = await db.characters.find({"character_id": favorite_id}, {"character_id": 1, "name": 1, "rarity": 1, "file_id": 1, "img_url": 1, "is_video": 1}).to_list(length=1)
-            
-            if char_docs:
-                # Check if user actually owns this character (use full collection, not filtered)
-                full_collection = await db.get_user_collection(user_id)
-                if favorite_id in [char['character_id'] for char in full_collection]:
-                    favorite_char = char_docs[0]
-                else:
-                    # User doesn't own this character anymore, clear favorite
-                    await db.update_user(user_id, {'favorite_character': None})
-                    favorite_id = None
-                    favorite_char = None
-            else:
-                # Character doesn't exist in database, clear favorite
+            # The favorite must still be owned (and still exist); the view has both
+            if view is not None:
+                favorite_char = view.row(favorite_id)
+            elif await db.get_owned_character_counts(user_id, [favorite_id]):
+                favorite_char = await db.get_character(favorite_id)
+            if favorite_char is None:
                 await db.update_user(user_id, {'favorite_character': None})
                 favorite_id = None
-                favorite_char = None
         if not favorite_id and collection:
             # If no favorite is set, set a random character as favorite and save it
             # Use the full collection (before rarity filter) for random selection
-            full_collection = await db.get_user_collection(user_id)
-            if full_collection:
-                random_char = random.choice(full_collection)
-                await db.update_user(user_id, {'favorite_character': random_char['character_id']})
-                # Get the full character data for display
-                if hasattr(db, 'pool'):  # PostgreSQL
-                    async with db.pool.acquire() as conn:
-                        char_docs = await conn.fetch(
-                            "SELECT character_id, name, rarity, file_id, img_url, is_video FROM characters WHERE character_id = $1",
-                            random_char['character_id']
-                        )
-                        char_docs = [dict(char) for char in char_docs]
-                else:  # MongoDB
-                    char_docs = await db.characters.find({"character_id": random_char['character_id']}, {"character_id": 1, "name": 1, "rarity": 1, "file_id": 1, "img_url": 1, "is_video": 1}).to_list(length=1)
-                
-                if char_docs:
-                    favorite_char = char_docs[0]
-        elif not favorite_id:
-            favorite_char = None
+            favorite_char = random.choice(view.rows() if view is not None else current_page_items)
+            await db.update_user(user_id, {'favorite_character': favorite_char['character_id']})
         if favorite_char:
             is_video = favorite_char.get('is_video', False)
             if is_video:
@@ -449,7 +450,8 @@ async def handle_smode_callback(client, callback_query: CallbackQuery):
         # Keep the current mode when changing rarity filter
         preferences = {
             "mode": current_preferences.get('mode', 'default'),
-            "filter": rarity
+            "filter": rarity,
+            "sort": current_preferences.get('sort', None)
         }
         await db.update_user_preferences(user_id, preferences)
 
@@ -477,12 +479,14 @@ async def handle_smode_callback(client, callback_query: CallbackQuery):
         if mode == "detailed":
             preferences = {
                 "mode": mode,
-                "filter": current_preferences.get('filter', None)
+                "filter": current_preferences.get('filter', None),
+                "sort": current_preferences.get('sort', None)
             }
         elif mode == "default":
             preferences = {
                 "mode": "default",
-                "filter": None
+                "filter": None,
+                "sort": current_preferences.get('sort', None)
             }
         await db.update_user_preferences(user_id, preferences)
         mode_name = "Dᴇᴛᴀɪʟᴇᴅ Mᴏᴅᴇ" if mode == "detailed" else "Dᴇғᴀᴜʟᴛ Mᴏᴅᴇ"
@@ -498,11 +502,12 @@ async def handle_collection_callback(client, callback_query: CallbackQuery):
         return
     
     if query.data.startswith("c_"):
-        # Parse callback data: c_<page>_<owner_user_id>
+        # Parse callback data: c_<page>_<owner_user_id>[_<cursor>]
         parts = query.data.split("_")
         if len(parts) >= 3:
             page = int(parts[1])
             owner_user_id = int(parts[2])
+            cursor = parts[3] if len(parts) >= 4 else None
             
             # Check if the user clicking is the collection owner
             if query.from_user.id != owner_user_id:
@@ -522,7 +527,9 @@ async def handle_collection_callback(client, callback_query: CallbackQuery):
                 mode=mode,
                 rarity_filter=rarity_filter,
                 from_user=query.from_user,
-                callback_query=query
+                callback_query=query,
+                sort=preferences.get('sort', None),
+                cursor=cursor
             )
         else:
             # Handle old format for backward compatibility
@@ -539,7 +546,8 @@ async def handle_collection_callback(client, callback_query: CallbackQuery):
                 mode=mode,
                 rarity_filter=rarity_filter,
                 from_user=query.from_user,
-                callback_query=query
+                callback_query=query,
+                sort=preferences.get('sort', None)
             )
     
     elif query.data.startswith("s_"):
@@ -547,28 +555,13 @@ async def handle_collection_callback(client, callback_query: CallbackQuery):
         await sort_collection(client, query.message, query.from_user.id, sort_type, callback_query=query)
 
 async def sort_collection(client, message, user_id: int, sort_type: str, callback_query=None):
-    db = get_database()
-    user_data = await db.get_user(user_id)
-
-    if not user_data or not user_data.get('characters', []):
+    """Save the display order as a collection preference and show the first page in it"""
+    if sort_type not in SORT_KEYS and sort_type != "id":
         return
-
-    char_ids = user_data['characters']
-    characters = []
-
-    for char_id in char_ids:
-        char = await db.get_character(char_id)
-        if char:
-            characters.append(char)
-
-    if sort_type == "name":
-        characters.sort(key=lambda x: x['name'].lower())
-    elif sort_type == "rarity":
-        characters.sort(key=lambda x: get_rarity_level(x['rarity']), reverse=True)
-
-    # Update user's character order
-    new_char_ids = [char['character_id'] for char in characters]
-    await db.update_user(user_id, {'characters': new_char_ids})
+    db = get_database()
+    preferences = await db.get_user_preferences(user_id)
+    preferences['sort'] = None if sort_type == "id" else sort_type
+    await db.update_user_preferences(user_id, preferences)
 
     # Show first page of sorted collection
     await show_collection_page(
@@ -576,8 +569,11 @@ async def sort_collection(client, message, user_id: int, sort_type: str, callbac
         message,
         user_id,
         page=1,
-        from_user=message.from_user,
-        callback_query=callback_query
+        mode=preferences.get('mode', 'default'),
+        rarity_filter=preferences.get('filter', None),
+        from_user=callback_query.from_user if callback_query else message.from_user,
+        callback_query=callback_query,
+        sort=preferences['sort']
     )
 
 def _create_collection_message(first_name, total_chars, page, total_pages, characters, mode='default', rarity_filter=None):
@@ -626,9 +622,19 @@ def _create_collection_message(first_name, total_chars, page, total_pages, chara
         print(f"Error creating collection message: {e}")
         return "<b>❌ Error displaying collection!</b>"
 
-def _create_keyboard(page, total_pages, user_id, total_items):
+def _create_keyboard(page, total_pages, user_id, total_items, cursors=None):
     keyboard = []
-    if total_pages > 1:
+    if cursors:
+        # Keyset-paged collection: the buttons carry the cursor of the neighbouring page
+        prev_cursor, next_cursor = cursors
+        nav_row = []
+        if prev_cursor:
+            nav_row.append(InlineKeyboardButton("⬅️ ᴘʀᴇᴠɪᴏᴜs", callback_data=f"c_{max(page-1, 1)}_{user_id}_{prev_cursor}"))
+        if next_cursor:
+            nav_row.append(InlineKeyboardButton("ɴᴇxᴛ ➡️", callback_data=f"c_{page+1}_{user_id}_{next_cursor}"))
+        if nav_row:
+            keyboard.append(nav_row)
+    elif total_pages > 1:
         nav_row = []
         if page > 1:
             nav_row.append(InlineKeyboardButton("⬅️ ᴘʀᴇᴠɪᴏᴜs", callback_data=f"c_{page-1}_{user_id}"))
@@ -692,14 +698,30 @@ async def handle_inline_query(client, inline_query: InlineQuery):
 
     user_id = int(m.group(1))
     search_str = m.group(2).strip() if m.group(2) else ''
-    try:
-        offset = int(inline_query.offset) if inline_query.offset else 0
-    except ValueError:
-        offset = 0
+    items_per_page = 50
 
     db = get_database()
-    user_data = await db.get_user(user_id)
-    if not user_data or not user_data.get('characters'):
+    user_data = await db.get_user(user_id, fields=['first_name'])
+    view, summary = await _get_collection_view(db, user_id) if user_data else (None, None)
+    if summary is not None:
+        # Too big to hold in memory: page through matches by keyset in SQL, the offset is the cursor
+        cursor = inline_query.offset if (inline_query.offset or '').startswith('a') else None
+        page = await db.get_user_collection_page(
+            user_id, cursor=cursor, page_size=items_per_page, search=search_str or None
+        )
+        chars = page['items']
+        next_offset = page['next'] or ""
+    elif view:
+        # Filter by search string (memoised on the view while the user pages through results)
+        filtered = view.search(search_str)
+        try:
+            offset = int(inline_query.offset) if inline_query.offset else 0
+        except ValueError:
+            offset = 0
+        end_idx = min(offset + items_per_page, len(filtered))
+        chars = filtered[offset:end_idx]
+        next_offset = str(end_idx) if end_idx < len(filtered) else ""
+    else:
         await inline_query.answer([
             InlineQueryResultArticle(
                 id="no_results",
@@ -712,34 +734,9 @@ async def handle_inline_query(client, inline_query: InlineQuery):
         ], cache_time=1)
         return
 
-    # Deduplicate and count characters
-    char_ids = user_data['characters']
-    char_counts = Counter(char_ids)
-    # Batch fetch all character details
-    char_docs = await batch_fetch_characters(db, list(char_counts.keys()), batch_size=500)
-    id_to_char = {c['character_id']: c for c in char_docs}
-    collection = []
-    for char_id, count in char_counts.items():
-        char = id_to_char.get(char_id)
-        if char:
-            char = dict(char)  # copy
-            char['count'] = count
-            collection.append(char)
-
     user_name = user_data.get('first_name', 'User')
-    # Filter by search string
-    if search_str:
-        s = search_str.lower()
-        filtered = [c for c in collection if s in c['name'].lower() or s in c['rarity'].lower()]
-    else:
-        filtered = collection
-
-    # Pagination
-    items_per_page = 50
-    start_idx = offset
-    end_idx = min(start_idx + items_per_page, len(filtered))
     results = []
-    for char in filtered[start_idx:end_idx]:
+    for char in chars:
         rarity_emoji = RARITY_DATA.get(char['rarity'], {}).get('emoji', '⭐')
         count_display = f" [x{char['count']}]" if char.get('count', 1) > 1 else ""
         caption = (
@@ -786,7 +783,6 @@ async def handle_inline_query(client, inline_query: InlineQuery):
                 )
             )
 
-    next_offset = str(end_idx) if end_idx < len(filtered) else ""
     if not results:
         results.append(InlineQueryResultArticle(
             id="no_results",
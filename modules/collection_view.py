@@ -0,0 +1,242 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from modules.character_catalog import CharacterCatalog, get_character_catalog
+
+VIEW_FIELDS = ('character_id', 'name', 'rarity', 'img_url', 'file_id', 'is_video')
+
+
+class CollectionView:
+    """One user's collection, counted and joined with the catalog once.
+
+    `counts` keeps the owned IDs in acquisition order; `rows` are the
+    joined display rows (catalog fields plus `count`) ordered by character
+    ID. Rarity filters, other orderings and inline searches are computed on
+    first use and kept on the view, so re-rendering a page or paging through
+    results is a slice. If the catalog changes underneath (a rename, a
+    re-rarity) the rows are re-joined from `counts` without going back to
+    the database.
+    """
+
+    __slots__ = ('user_id', 'counts', 'total', 'built_at', '_catalog', '_version', '_rows', '_filtered', '_searches')
+
+    def __init__(self, user_id: int, counts: List[Tuple[int, int]], catalog: CharacterCatalog):
+        self.user_id = user_id
+        self.counts: Dict[int, int] = dict(counts)
+        self.total = sum(self.counts.values())
+        self.built_at = time.monotonic()
+        self._catalog = catalog
+        self._version = None
+        self._rows: List[dict] = []
+        self._filtered: Dict[tuple, List[dict]] = {}
+        self._searches: 'OrderedDict[str, List[dict]]' = OrderedDict()
+
+    def __len__(self):
+        return len(self.rows())
+
+    def _join(self):
+        if self._version == self._catalog.version:
+            return
+        rows = []
+        for acquired, (character_id, count) in enumerate(self.counts.items()):
+            character = self._catalog.peek(character_id)
+            if character is None:
+                continue  # deleted from the catalog
+            row = {field: character.get(field) for field in VIEW_FIELDS}
+            row['count'] = count
+            row['acquired'] = acquired  # position in acquisition order, for recency sorts
+            rows.append(row)
+        rows.sort(key=lambda r: r['character_id'])
+        self._rows = rows
+        self._filtered = {}
+        self._searches.clear()
+        self._version = self._catalog.version
+
+    def rows(self, rarity: str = None, order: str = None, key: Callable[[dict], object] = None) -> List[dict]:
+        """Display rows, optionally only one rarity and re-sorted by `key` (memoised under `order`)"""
+        self._join()
+        if not rarity and order is None:
+            return self._rows
+        rows = self._filtered.get((rarity, order))
+        if rows is None:
+            rows = [r for r in self._rows if r['rarity'] == rarity] if rarity else self._rows
+            if order is not None:
+                rows = sorted(rows, key=key)
+            self._filtered[(rarity, order)] = rows
+        return rows
+
+    def search(self, text: str) -> List[dict]:
+        """Rows whose name or rarity contains `text` (case-insensitive)"""
+        self._join()
+        text = text.strip().lower()
+        if not text:
+            return self._rows
+        rows = self._searches.get(text)
+        if rows is None:
+            rows = [r for r in self._rows if text in (r['name'] or '').lower() or text in (r['rarity'] or '').lower()]
+            self._searches[text] = rows
+            if len(self._searches) > 16:
+                self._searches.popitem(last=False)
+        else:
+            self._searches.move_to_end(text)
+        return rows
+
+    def owns(self, character_id: int) -> bool:
+        return character_id in self.counts
+
+    def row(self, character_id: int) -> Optional[dict]:
+        self._join()
+        if character_id not in self.counts:
+            return None
+        for row in self._rows:
+            if row['character_id'] == character_id:
+                return row
+        return None
+
+    def size(self) -> int:
+        return len(self.counts)
+
+
+def page_slice(rows: List[dict], page: int, per_page: int) -> Tuple[List[dict], int, int]:
+    """(items, page, total_pages) for a 1-based page, clamped to the valid range"""
+    total_pages = max(1, (len(rows) + per_page - 1) // per_page)
+    page = max(1, min(page, total_pages))
+    start = (page - 1) * per_page
+    return rows[start:start + per_page], page, total_pages
+
+
+class CollectionViewCache:
+    """Bounded LRU of CollectionView objects with single-flight builds.
+
+    Ownership-changing writes call `invalidate`; a build that overlaps an
+    invalidation is handed to its callers but not kept, so a view built from
+    pre-write rows can't be cached after the write. Writes made by other bot
+    processes aren't seen here, so a view is rebuilt once it is older than
+    `ttl` seconds (the same bound UserCache gives user rows). Besides
+    `maxsize` views the cache holds at most `max_rows` owned IDs in total,
+    so a few huge collections can't crowd out memory.
+    """
+
+    def __init__(self, maxsize: int = 2000, max_rows: int = 1_000_000, ttl: int = 120,
+                 catalog: CharacterCatalog = None):
+        self.maxsize = maxsize
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.catalog = catalog or get_character_catalog()
+        self._views: 'OrderedDict[int, CollectionView]' = OrderedDict()
+        self._rows = 0
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self._generation: Dict[int, int] = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._views)
+
+    async def get(self, db, user_id: int) -> CollectionView:
+        """The user's view, built from the database on a miss"""
+        view = self.peek(user_id)
+        if view is not None:
+            self.hits += 1
+            self._views.move_to_end(user_id)
+            return view
+        pending = self._inflight.get(user_id)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[user_id] = future
+        stamp = (self._epoch, self._generation.get(user_id, 0))
+        try:
+            view = await self._build(db, user_id)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # waiters re-raise it; don't warn when there are none
+            raise
+        finally:
+            self._inflight.pop(user_id, None)
+        if stamp == (self._epoch, self._generation.get(user_id, 0)):
+            self._store(view)
+        future.set_result(view)
+        return view
+
+    async def _build(self, db, user_id: int) -> CollectionView:
+        if hasattr(db, 'get_owned_character_counts'):  # PostgreSQL: counts only, joined in memory
+            await self.catalog.ensure_loaded(db.pool)
+            counts = await db.get_owned_character_counts(user_id)
+            missing = [character_id for character_id, _ in counts if self.catalog.peek(character_id) is None]
+            if missing:
+                await self.catalog.get_many(db.pool, missing)
+            return CollectionView(user_id, counts, self.catalog)
+        rows = await db.get_user_collection(user_id)
+        for row in rows:
+            self.catalog.put(dict(row))
+        return CollectionView(user_id, [(row['character_id'], row.get('count', 1)) for row in rows], self.catalog)
+
+    def _store(self, view: CollectionView):
+        old = self._views.pop(view.user_id, None)
+        if old is not None:
+            self._rows -= old.size()
+        self._views[view.user_id] = view
+        self._rows += view.size()
+        while self._views and (len(self._views) > self.maxsize or self._rows > self.max_rows):
+            _, evicted = self._views.popitem(last=False)
+            self._rows -= evicted.size()
+
+    def peek(self, user_id: int) -> Optional[CollectionView]:
+        """The cached view, if there is one younger than `ttl`"""
+        view = self._views.get(user_id)
+        if view is not None and time.monotonic() - view.built_at > self.ttl:
+            self.expired += 1
+            del self._views[user_id]
+            self._rows -= view.size()
+            return None
+        return view
+
+    def invalidate(self, user_id: int = None):
+        """Forget one user's view (or every view, when `user_id` is None)"""
+        self.invalidations += 1
+        if user_id is None:
+            self._views.clear()
+            self._rows = 0
+            self._generation.clear()
+            self._epoch += 1
+            return
+        view = self._views.pop(user_id, None)
+        if view is not None:
+            self._rows -= view.size()
+        if user_id in self._inflight:
+            self._generation[user_id] = self._generation.get(user_id, 0) + 1
+        else:
+            self._generation.pop(user_id, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'size': len(self._views),
+            'rows': self._rows,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'invalidations': self.invalidations,
+            'expired': self.expired,
+            'hit_rate': round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
+
+
+_collection_views = CollectionViewCache()
+
+
+def get_collection_views() -> CollectionViewCache:
+    """Get the process-wide collection view cache"""
+    return _collection_views
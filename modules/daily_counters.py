@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tdtop_checkpoint.json')
+# collection_events sources that `increment` is called for: drop collects and /claim
+COUNTED_SOURCES = ('collected', 'claim')
+
+
+class DailyCounters:
+    """Today's collect counts per user with an always-sorted top-K view.
+
+    Counts live in memory and roll over at UTC midnight. Every `interval`
+    seconds the day is checkpointed to a JSON file (and to Redis when a URL
+    is configured), so a restart picks up where it left off. Reading the
+    board never touches Postgres.
+    """
+
+    def __init__(self, top_size: int = 25, checkpoint_path: str = CHECKPOINT_PATH, redis_url: str = None):
+        self.top_size = top_size
+        self.checkpoint_path = checkpoint_path
+        self.redis_url = redis_url
+        self._redis = None
+        self.day = self._utc_day()
+        self._counts: Dict[int, int] = {}
+        self._names: Dict[int, str] = {}
+        self._top: List[int] = []  # user_ids sorted by count, best first
+        self._previous: Optional[dict] = None  # final board of the day before
+        self._dirty = False
+
+    @staticmethod
+    def _utc_day() -> str:
+        return datetime.utcnow().date().isoformat()
+
+    # --- Updates ---
+
+    def increment(self, user_id: int, first_name: str = None, amount: int = 1):
+        """Count `amount` collects for a user today"""
+        self._rollover()
+        count = self._counts.get(user_id, 0) + amount
+        self._counts[user_id] = count
+        if first_name:
+            self._names[user_id] = first_name
+        self._dirty = True
+        self._place(user_id, count)
+
+    def _place(self, user_id: int, count: int):
+        top = self._top
+        if user_id in top:
+            i = top.index(user_id)
+        elif len(top) < self.top_size:
+            top.append(user_id)
+            i = len(top) - 1
+        elif count > self._counts[top[-1]]:
+            top[-1] = user_id
+            i = len(top) - 1
+        else:
+            return
+        # Counts only grow, so the entry only ever moves up
+        while i > 0 and self._counts[top[i - 1]] < count:
+            top[i - 1], top[i] = top[i], top[i - 1]
+            i -= 1
+
+    def _rollover(self):
+        day = self._utc_day()
+        if day == self.day:
+            return
+        self._previous = {'day': self.day, 'board': self._board(self.top_size)}
+        self.day = day
+        self._counts = {}
+        self._names = {}
+        self._top = []
+        self._dirty = True
+
+    # --- Reads ---
+
+    def top(self, limit: int = 10) -> List[dict]:
+        """Today's top collectors, in the shape get_todays_top_collectors returns"""
+        self._rollover()
+        return self._board(limit)
+
+    def previous_top(self, limit: int = 10) -> List[dict]:
+        """Final board of the previous UTC day, if it was seen by this process"""
+        self._rollover()
+        return self._previous['board'][:limit] if self._previous else []
+
+    def count(self, user_id: int) -> int:
+        self._rollover()
+        return self._counts.get(user_id, 0)
+
+    def _board(self, limit: int) -> List[dict]:
+        return [
+            {'user_id': uid, 'first_name': self._names.get(uid) or 'Unknown', 'count': self._counts[uid]}
+            for uid in self._top[:limit]
+        ]
+
+    # --- Persistence ---
+
+    def load(self, day: str, counts: Dict[int, int], names: Dict[int, str] = None):
+        """Replace today's state (ignored unless `day` is the current UTC day)"""
+        if day != self._utc_day():
+            return False
+        self.day = day
+        self._counts = {int(uid): int(n) for uid, n in counts.items()}
+        self._names = {int(uid): name for uid, name in (names or {}).items()}
+        self._top = sorted(self._counts, key=self._counts.get, reverse=True)[:self.top_size]
+        self._dirty = False
+        return True
+
+    def _snapshot(self) -> dict:
+        return {'day': self.day, 'counts': dict(self._counts), 'names': dict(self._names)}
+
+    def checkpoint_file(self, snapshot: dict = None):
+        """Write today's counts to the checkpoint file (atomic rename)"""
+        snapshot = snapshot or self._snapshot()
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    async def checkpoint(self):
+        """Persist today's counts if they changed since the last checkpoint"""
+        self._rollover()
+        if not self._dirty:
+            return
+        self._dirty = False
+        snapshot = self._snapshot()
+        try:
+            await asyncio.to_thread(self.checkpoint_file, snapshot)
+        except Exception as e:
+            self._dirty = True
+            logger.error(f"Error writing tdtop checkpoint: {e}")
+        redis = self._get_redis()
+        if redis is not None and snapshot['counts']:
+            try:
+                key = f"tdtop:{snapshot['day']}"
+                async with redis.pipeline(transaction=True) as pipe:
+                    pipe.hset(key, mapping={str(k): v for k, v in snapshot['counts'].items()})
+                    pipe.expire(key, 2 * 86400)
+                    if snapshot['names']:
+                        pipe.hset(f"{key}:names", mapping={str(k): v for k, v in snapshot['names'].items()})
+                        pipe.expire(f"{key}:names", 2 * 86400)
+                    await pipe.execute()
+            except Exception as e:
+                logger.error(f"Error writing tdtop checkpoint to Redis: {e}")
+
+    async def restore(self, db=None):
+        """Load today's counts from Redis or the checkpoint file at startup.
+
+        When `db` is given, today's collection_events from COUNTED_SOURCES are
+        folded in too (per-user max), which covers collects made after the last
+        checkpoint.
+        """
+        day = self._utc_day()
+        counts, names, source = {}, {}, None
+        redis = self._get_redis()
+        if redis is not None:
+            try:
+                raw = await redis.hgetall(f"tdtop:{day}")
+                if raw:
+                    counts = {int(k): int(v) for k, v in raw.items()}
+                    raw_names = await redis.hgetall(f"tdtop:{day}:names")
+                    names = {int(k): v.decode() if isinstance(v, bytes) else v for k, v in raw_names.items()}
+                    source = 'redis'
+            except Exception as e:
+                logger.error(f"Error restoring tdtop counters from Redis: {e}")
+        if source is None:
+            try:
+                with open(self.checkpoint_path, encoding='utf-8') as f:
+                    snapshot = json.load(f)
+                if snapshot.get('day') == day:
+                    counts = {int(k): int(v) for k, v in snapshot.get('counts', {}).items()}
+                    names = {int(k): v for k, v in snapshot.get('names', {}).items()}
+                    source = 'file'
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"Error reading tdtop checkpoint: {e}")
+        if db is not None:
+            for row in await db.get_todays_collect_counts(COUNTED_SOURCES):
+                if row['count'] > counts.get(row['user_id'], 0):
+                    counts[row['user_id']] = row['count']
+                    source = source or 'postgres'
+                if row['first_name']:
+                    names.setdefault(row['user_id'], row['first_name'])
+        self.load(day, counts, names)
+        self._dirty = True
+        return source
+
+    async def run_checkpoints(self, interval: int = 30):
+        """Checkpoint loop; run as a background task"""
+        while True:
+            await asyncio.sleep(interval)
+            await self.checkpoint()
+
+    def _get_redis(self):
+        if self.redis_url and self._redis is None:
+            try:
+                import redis.asyncio as redis
+                self._redis = redis.from_url(self.redis_url)
+            except Exception as e:
+                logger.error(f"Redis unavailable for tdtop counters: {e}")
+                self.redis_url = None
+        return self._redis
+
+
+_daily_counters = DailyCounters(redis_url=REDIS_URL)
+
+
+def get_daily_counters() -> DailyCounters:
+    """Get the process-wide daily collect counters"""
+    return _daily_counters
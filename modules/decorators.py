@@ -73,19 +73,19 @@ def is_owner(user_id: int) -> bool:
 
 async def is_og(db, user_id: int) -> bool:
     """Check if user is an OG"""
-    user_data = await db.get_user(user_id)
+    user_data = await db.get_user(user_id, fields=('og',))
     return user_data and user_data.get('og', False)
 
 async def is_sudo(db, user_id: int) -> bool:
     """Check if user is a sudo admin"""
-    user_data = await db.get_user(user_id)
+    user_data = await db.get_user(user_id, fields=('sudo',))
     return user_data and user_data.get('sudo', False)
 
 async def is_admin(db, user_id: int) -> bool:
     """Check if user is any type of admin (owner, OG, sudo)"""
     if user_id == OWNER_ID:
         return True
-    user_data = await db.get_user(user_id)
+    user_data = await db.get_user(user_id, fields=('og', 'sudo'))
     return user_data and (user_data.get('og', False) or user_data.get('sudo', False))
 
 async def check_banned(db, user_id: int) -> bool:
@@ -197,7 +197,7 @@ def auto_register_user(func):
                 db = get_database()
                 user = message.from_user
                 if user:
-                    existing_user = await db.get_user(user.id)
+                    existing_user = await db.get_user(user.id, fields=())
                     if not existing_user:
                         user_data = {
                             'user_id': user.id,
@@ -3,13 +3,17 @@ import asyncio
 import os
 from datetime import datetime, timedelta
 from collections import defaultdict, deque
-from functools import lru_cache
 from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from .logging_utils import send_drop_log
 from .decorators import admin_only, is_owner, is_sudo, is_og, check_banned
 from modules.postgres_database import get_database, get_rarity_emoji, RARITIES, RARITY_EMOJIS, get_rarity_display
 from .tdgoal import track_collect_drop
+from .drop_sampler import get_drop_sampler
+from .daily_counters import get_daily_counters
+from .character_catalog import normalize_name
+from .drop_state import get_drop_states
+from .message_pipeline import MessagePipeline
 import time
 import string
 from pyrogram.enums import ChatType
@@ -32,29 +36,15 @@ RARITIES = {
     "Premium": 13
 }
 
-active_drops = {}
+# Per-chat drop state (live drops, counters, jackpots, droptime) lives in modules.drop_state
+drop_states = get_drop_states()
 # Clean deque-based spam tracking with size limits
 user_msgs = defaultdict(lambda: deque(maxlen=10))  # Reduced from 10 to prevent memory leaks
 SPAM_LIMIT = 6    # Reduced from 6 to be more strict
 SPAM_WINDOW = 2      # Reduced from 2 seconds
-message_counts = {}  # In-memory message counter
-last_drop_time = {}  # Track last drop time per chat
-drop_settings_cache = {}  # Cache for drop settings
-last_settings_update = {}  # Track last settings update time
+# Drop settings are global, so one cached copy serves every chat
+_drop_settings_cache = {'settings': None, 'updated': None}
 SETTINGS_CACHE_TIME = 30  # Reduced from 60 seconds
-drop_locks = {}  # Track active drops per chat
-drop_expiry_times = {}  # Track exact expiry time for each drop
-# Preloaded next character queue per chat with size limit
-preloaded_next_character = defaultdict(lambda: deque(maxlen=5))  # Added size limit
-collect_locks = defaultdict(asyncio.Lock)
-# Add a lock per chat to prevent race conditions
-chat_locks = {}
-# Add collection locks to prevent race conditions during character collection
-collection_locks = defaultdict(asyncio.Lock)
-# Track which characters are being collected to prevent double collection
-collecting_characters = defaultdict(set)
-# Track which users are collecting which characters to prevent spam
-user_collecting = defaultdict(set)
 
 # Epic drop captions
 DROP_CAPTIONS = [
@@ -74,9 +64,6 @@ DROP_CAPTIONS = [
 ]
 
 # --- JACKPOT FEATURE ---
-active_jackpots = {}  # chat_id: {code, amount, claimed_by, message_id}
-jackpot_counter = {}  # chat_id: current count (int)
-jackpot_next_interval = {}  # chat_id: next interval (int)
 
 async def drop_jackpot(client, chat_id):
     code = ''.join(random.choices(string.ascii_letters + string.digits, k=10))
@@ -88,7 +75,7 @@ async def drop_jackpot(client, chat_id):
     # Use direct image link for photo
     image_url = "https://ibb.co/TxnK47Sq"
     sent = await client.send_photo(chat_id, image_url, caption=msg)
-    active_jackpots[chat_id] = {
+    drop_states.touch(chat_id).jackpot = {
         'code': code,
         'amount': amount,
         'claimed_by': None,
@@ -106,7 +93,8 @@ async def jackpot_command(client: Client, message: Message):
         await message.reply_text("❌ Usage: /jackpot code")
         return
     code = args[1].strip()
-    jackpot = active_jackpots.get(chat_id)
+    state = drop_states.get(chat_id)
+    jackpot = state.jackpot if state is not None else None
     if not jackpot or jackpot['code'] != code:
         await message.reply_text("❌ No active jackpot with this code in this group!")
         return
@@ -117,6 +105,7 @@ async def jackpot_command(client: Client, message: Message):
     # Mark as claimed
     jackpot['claimed_by'] = user_id
     jackpot['claimed_by_name'] = message.from_user.first_name
+    drop_states.mark_dirty(chat_id)
     # Add shards to user (update shards only)
     try:
         shards_amount = jackpot['amount']
@@ -138,21 +127,18 @@ async def jackpot_command(client: Client, message: Message):
 
 # To trigger a jackpot drop, you can call drop_jackpot(client, chat_id) from anywhere, e.g. after a random message count in handle_message or process_drop.
 
-@lru_cache(maxsize=100)
 def get_drop_time(chat_id):
-    """Get cached drop time for a chat"""
-    return message_counts.get(chat_id, 0)
+    """Get the droptime for a chat"""
+    return drop_states.drop_time(chat_id)
 
 async def get_cached_drop_settings(db, chat_id):
     """Get cached drop settings"""
     current_time = datetime.now()
-    if (chat_id not in drop_settings_cache or 
-        chat_id not in last_settings_update or 
-        (current_time - last_settings_update[chat_id]).total_seconds() > SETTINGS_CACHE_TIME):
-        settings = await db.get_drop_settings()
-        drop_settings_cache[chat_id] = settings
-        last_settings_update[chat_id] = current_time
-    return drop_settings_cache[chat_id]
+    updated = _drop_settings_cache['updated']
+    if updated is None or (current_time - updated).total_seconds() > SETTINGS_CACHE_TIME:
+        _drop_settings_cache['settings'] = await db.get_drop_settings()
+        _drop_settings_cache['updated'] = current_time
+    return _drop_settings_cache['settings']
 
 # Periodic cleanup functions removed to prevent issues
 
@@ -163,97 +149,58 @@ async def is_user_banned(user_id):
 # Import database based on configuration
 from modules.postgres_database import get_database, get_rarity_emoji, RARITIES, RARITY_EMOJIS, get_rarity_display
 
-# Add in-memory storage for droptime settings and message counts
-chat_drop_settings = {}  # chat_id: {'drop_time': int, 'auto_drop': bool}
-chat_message_counts = {}  # chat_id: int (current message count)
-chat_last_drop_times = {}  # chat_id: datetime (last drop time)
-
-# Default droptime for new chats
-DEFAULT_DROPTIME = 45
-
 # Pyrogram message counting handler
 async def handle_message(client: Client, message: Message):
+    """Hand a group message to the ingestion pipeline (never waits on the database)"""
     if not message.from_user:
         return
-    user_id = message.from_user.id
-    chat_id = message.chat.id
-    current_time = datetime.now()
 
     # Skip private messages
     if message.chat.type == 'private':
         return
 
-    # Completely ignore messages from banned users
-    if await is_user_banned(user_id):
-        return
+    item = (client, message, datetime.now())
+    if not message_pipeline.submit(message.chat.id, item):
+        # Shard backlog is full: keep the drop counters going with only the in-memory ban check
+        from .ban_manager import is_banned_in_memory
+        if not is_banned_in_memory(message.from_user.id):
+            await ingest_messages([item], checks=False)
 
-    # Start queue processor if not running
-    global queue_processor_running
-    if not queue_processor_running:
-        asyncio.create_task(process_message_queue())
+async def ingest_messages(batch, checks=True):
+    """Pipeline handler for a batch of (client, message, time) from one shard.
 
-    # Check if we're under high load (queue size > 100)
-    if message_queue.qsize() > 100:
-        # Use queue for high-volume processing
-        try:
-            await message_queue.put((client, message, current_time))
-        except asyncio.QueueFull:
-            # Queue is full, process directly but skip spam detection
-            await handle_single_message(client, message, current_time)
-        return
+    Messages from banned users are dropped, the rest are counted with one
+    registry touch per chat, drops and jackpots that fall due are sent in the
+    background, and finally the spam tracker sees every message.
+    """
+    if checks:
+        from .ban_manager import check_user_ban_status
+        db = get_database()
+        # One check per distinct user, all awaited together
+        user_ids = list(dict.fromkeys(item[1].from_user.id for item in batch))
+        results = await asyncio.gather(*(check_user_ban_status(user_id, db) for user_id in user_ids))
+        banned = {user_id for user_id, (is_banned, _) in zip(user_ids, results) if is_banned}
+        batch = [item for item in batch if item[1].from_user.id not in banned]
 
-    # Normal processing with spam detection
-    # --- JACKPOT COUNTER LOGIC ---
-    if chat_id not in jackpot_counter:
-        jackpot_counter[chat_id] = 0
-    if chat_id not in jackpot_next_interval:
-        jackpot_next_interval[chat_id] = random.randint(450, 550)
-    jackpot_counter[chat_id] += 1
-    if jackpot_counter[chat_id] >= jackpot_next_interval[chat_id]:
-        asyncio.create_task(drop_jackpot(client, chat_id))
-        jackpot_counter[chat_id] = 0
-        jackpot_next_interval[chat_id] = random.randint(450, 550)
-
-    # Initialize in-memory settings for this chat if not exists
-    if chat_id not in chat_drop_settings:
-        chat_drop_settings[chat_id] = {
-            'drop_time': DEFAULT_DROPTIME,
-            'auto_drop': True
-        }
-    if chat_id not in chat_message_counts:
-        chat_message_counts[chat_id] = 0
-    if chat_id not in chat_last_drop_times:
-        chat_last_drop_times[chat_id] = current_time
-    
-    # Get droptime from in-memory settings
-    drop_time = chat_drop_settings[chat_id]['drop_time']
-    # Increment message count immediately
-    chat_message_counts[chat_id] += 1
-    # ...existing code...
-    # Check if it's time to drop
-    if chat_message_counts[chat_id] >= drop_time:
-        # ...existing code...
-        # Reset message count immediately
-        chat_message_counts[chat_id] = 0
-        chat_last_drop_times[chat_id] = current_time
-        # Start drop process immediately
-        await process_drop(chat_id, client, current_time)
-        return
-    
-    # Handle spam checking and ban logic
-    await handle_spam_and_bans_pyrogram(message, client, user_id, current_time)
+    by_chat = {}
+    for client, message, current_time in batch:
+        by_chat.setdefault(message.chat.id, (client, []))[1].append(current_time)
+    for chat_id, (client, times) in by_chat.items():
+        drops, jackpots = drop_states.count_messages(chat_id, times)
+        for _ in range(jackpots):
+            message_pipeline.spawn(drop_jackpot(client, chat_id))
+        for current_time in drops:
+            message_pipeline.spawn(process_drop(chat_id, client, current_time))
+
+    if checks:
+        for client, message, current_time in batch:
+            await handle_spam_and_bans_pyrogram(message, client, message.from_user.id, current_time)
+
+message_pipeline = MessagePipeline(ingest_messages)
 
 # Helper for spam and bans in Pyrogram
 async def handle_spam_and_bans_pyrogram(message, client, user_id, current_time):
-    """Clean deque-based spam detection"""
-    from .ban_manager import check_user_ban_status
-    
-    # Check if user is already banned
-    db = get_database()
-    is_banned, _ = await check_user_ban_status(user_id, db)
-    if is_banned:
-        return
-    
+    """Clean deque-based spam detection (callers have already skipped banned users)"""
     # Check for forwarded messages using hasattr logic
     if hasattr(message, 'forward_from') and message.forward_from:
         
@@ -313,13 +260,13 @@ async def process_drop(chat_id, client, current_time):
         locked_rarities = drop_settings.get('locked_rarities', []) if drop_settings else []
         # ...existing code...
         # Use preloaded character from queue if available
-        queue = preloaded_next_character[chat_id]
+        state = drop_states.touch(chat_id)
+        queue = state.preloaded
         if queue:
-            character = queue.pop(0)
+            character = queue.popleft()
             # ...existing code...
         else:
-            drop_manager = DropManager(db)
-            character = await drop_manager.get_random_character(locked_rarities, chat_id)
+            character = await get_drop_manager(db).get_random_character(locked_rarities, chat_id)
             # ...existing code...
         if character:
             # Check daily limit
@@ -330,9 +277,7 @@ async def process_drop(chat_id, client, current_time):
                 # ...existing code...
                 return
             # Send drop message with lock
-            if chat_id not in chat_locks:
-                chat_locks[chat_id] = asyncio.Lock()
-            async with chat_locks[chat_id]:
+            async with state.get_lock():
                 await send_drop_message(client, chat_id, character, current_time)
         return
     except Exception as e:
@@ -343,6 +288,9 @@ async def process_drop(chat_id, client, current_time):
 
 async def send_drop_message(client, chat_id, character, current_time):
     """Send drop message"""
+    # The drop carries per-drop state; never write it into a shared catalog row
+    character = dict(character)
+    character.pop('claimed_by', None)
     try:
         # Check if this is an infinity stone
         is_infinity_stone = character.get('is_infinity_stone', False)
@@ -417,27 +365,17 @@ async def send_drop_message(client, chat_id, character, current_time):
                     caption=caption
                 )
         
-        # Expire all previous drops for this chat
-        if chat_id in active_drops:
-            for old_drop in active_drops[chat_id]:
-                old_id = old_drop.get('drop_message_id')
-                if old_id in drop_expiry_times:
-                    del drop_expiry_times[old_id]
-            active_drops[chat_id] = []
-        
         # Store drop info with exact expiry time
         character['drop_message_id'] = drop_message.id if hasattr(drop_message, 'id') else drop_message.message_id
         character['dropped_at'] = current_time
         expiry_time = current_time + timedelta(minutes=5)
         character['expiry_time'] = expiry_time
+        # Guesses are matched against this set, so no name is re-split per guess
+        character['name_keys'] = drop_name_keys(character['name'])
         
-        # Update active drops
-        if chat_id not in active_drops:
-            active_drops[chat_id] = []
-        active_drops[chat_id].append(character)
-        
-        # Store expiry time
-        drop_expiry_times[character['drop_message_id']] = expiry_time
+        # Replace (expire) the chat's previous drops and arm the expiry timer
+        drop_states.touch(chat_id).set_drop(character)
+        drop_states.schedule_expiry(chat_id, character['drop_message_id'], expiry_time)
         
     except Exception as e:
         # print(f"Error in send_drop_message for chat {chat_id}: {e}")
@@ -445,6 +383,168 @@ async def send_drop_message(client, chat_id, character, current_time):
         # traceback.print_exc()
         pass
 
+# Guesses containing any of these are never a match
+GUESS_REJECT_CHARS = frozenset('&@#$%^*+=|\\/<>?')
+
+def drop_name_keys(name: str) -> frozenset:
+    """Normalized guesses that collect a drop: the full name, or any single word of a multi-word name"""
+    full_name = normalize_name(name)
+    words = full_name.split()
+    if len(words) > 1:
+        return frozenset(words + [full_name])
+    return frozenset([full_name])
+
+def get_live_drops(chat_id, current_time=None):
+    """The chat's drops that have not expired yet, oldest first"""
+    state = drop_states.get(chat_id)
+    if state is None:
+        return []
+    return state.live_drops(current_time or datetime.now())
+
+def find_guessed_drop(chat_id, guess: str, current_time):
+    """The live drop in this chat that `guess` names, if any"""
+    if GUESS_REJECT_CHARS.intersection(guess):
+        return None
+    key = normalize_name(guess)
+    for character in get_live_drops(chat_id, current_time):
+        name_keys = character.get('name_keys')
+        if name_keys is None:
+            name_keys = character['name_keys'] = drop_name_keys(character['name'])
+        if key in name_keys:
+            return character
+    return None
+
+def claim_drop(chat_id, character, user_id) -> bool:
+    """Compare-and-set the drop's collector; exactly one caller gets True.
+
+    Nothing is awaited between the check and the write, so this is atomic on
+    the event loop without a lock. The winner takes the drop out of the
+    chat's live drops at once, so every later guess sees it as collected.
+    """
+    if character.get('claimed_by') is not None:
+        return False
+    character['claimed_by'] = user_id
+    state = drop_states.get(chat_id)
+    if state is not None:
+        state.remove_drop(character)
+        drop_states.mark_dirty(chat_id)
+    return True
+
+def release_drop(chat_id, character, expiry_time):
+    """Undo a claim whose collection failed, unless the drop expired or was replaced meanwhile"""
+    character['claimed_by'] = None
+    state = drop_states.get(chat_id)
+    if state is None or state.latest_drop_message != character.get('drop_message_id'):
+        return
+    if not expiry_time or datetime.now() >= expiry_time:
+        return
+    state.drops.append(character)
+    drop_states.mark_dirty(chat_id)
+
+def mark_last_collected(chat_id, user_id, user_name):
+    drop_states.touch(chat_id).last_collected = {
+        'collected_by_id': user_id,
+        'collected_by_name': user_name
+    }
+
+async def finish_collection(message: Message, db, chat_id, character, expiry_time, current_time, collection_label):
+    """Write a claimed drop to the collector's account and announce it (releases the claim on failure)"""
+    user_id = message.from_user.id
+    user_name = message.from_user.first_name
+    # Check if this is an infinity stone
+    if character.get('is_infinity_stone', False):
+        # Handle infinity stone collection
+        try:
+            from modules.infinity_stones import attempt_infinity_stone_drop_collection
+            success, message_text, stone_info = await attempt_infinity_stone_drop_collection(
+                user_id, character['character_id']
+            )
+        except ImportError:
+            release_drop(chat_id, character, expiry_time)
+            await message.reply_text("❌ Error: Infinity stones module not available")
+            return
+        except Exception:
+            release_drop(chat_id, character, expiry_time)
+            raise
+        if not success:
+            release_drop(chat_id, character, expiry_time)
+            await message.reply_text(message_text)
+            return
+        # Track successful collection for tdgoal
+        try:
+            await track_collect_drop(user_id, source='infinity_stone')
+        except Exception as e:
+            print(f"tdgoal track_collect_drop error: {e}")
+        
+        # Send success message
+        await message.reply_text(message_text)
+        
+        # Clear the infinity stone drop
+        try:
+            from modules.infinity_stones import clear_infinity_stone_drop
+            await clear_infinity_stone_drop(chat_id)
+        except ImportError:
+            pass
+        return
+    
+    # Handle regular character collection
+    try:
+        await db.add_character_to_user(
+            user_id=user_id,
+            character_id=character['character_id'],
+            collected_at=current_time,
+            source='collected',
+            chat_id=chat_id
+        )
+    except Exception:
+        release_drop(chat_id, character, expiry_time)
+        raise
+    get_daily_counters().increment(user_id, user_name)
+    # Ensure group membership is tracked
+    if message.chat.type != "private":
+        await db.add_user_to_group(user_id, chat_id)
+    rarity = character['rarity']
+    rarity_emoji = get_rarity_emoji(rarity)
+    escaped_name = character['name']
+    escaped_rarity = rarity
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton(collection_label.format(user_name=user_name), switch_inline_query_current_chat=f"collection:{user_id}")]
+    ])
+    bonus_text = ""
+    if random.random() < 0.4:
+        bonus = random.randint(30, 50)
+        await db.credit(user_id, bonus, 'shards')
+        bonus_text = f"➥ <b>Bonus!</b> You received <b>{bonus}</b> extra 🎐 shards for collecting!\n"
+    msg = (
+        f"✅ Lᴏᴏᴋ Yᴏᴜ Cᴏʟʟᴇᴄᴛᴇᴅ A <code>{escaped_rarity}</code> ᴄʜᴀʀᴀᴄᴛᴇʀ\n\n"
+        f"<b>👤 Nᴀᴍᴇ : {escaped_name}</b>\n"
+        f"<b>{rarity_emoji} Rᴀʀɪᴛʏ : {escaped_rarity}</b>\n"
+        f"{bonus_text}"
+        f"\nTᴀᴋᴇ A Lᴏᴏᴋ Aᴛ Yᴏᴜʀ Cᴏʟʟᴇᴄᴛɪᴏɴ Usɪɴɢ <code>/mycollection</code>"
+    )
+    await message.reply(
+        msg,
+        reply_markup=keyboard
+    )
+
+async def reply_incorrect_guess(message: Message, chat_id, character_name: str):
+    """Incorrect guess reply with a button to the latest drop"""
+    drops = get_live_drops(chat_id)
+    if not drops:
+        return
+    character = drops[-1]  # Show button for latest drop
+    if str(chat_id).startswith("-100"):
+        channel_id = str(chat_id)[4:]
+    else:
+        channel_id = str(chat_id)
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("Character 🔼", url=f"https://t.me/c/{channel_id}/{character['drop_message_id']}")]
+    ])
+    await message.reply(
+        f"<b>❌ Incorrect Guess</b> -: <code>{character_name}</code>\n\n<b>Please try again...</b>",
+        reply_markup=keyboard
+    )
+
 # Pyrogram collect command handler
 @check_banned
 async def collect_command(client: Client, message: Message):
@@ -456,393 +556,35 @@ async def collect_command(client: Client, message: Message):
         return
     
     chat_id = message.chat.id
-    async with collection_locks[chat_id]:
-        db = get_database()
-        # --- FIX: If no active drops, show last_collected_drop message ---
-        if chat_id not in active_drops or not active_drops[chat_id]:
-            last_collected = None
-            if hasattr(collect_command, "last_collected_drop") and collect_command.last_collected_drop.get(chat_id):
-                last_collected = collect_command.last_collected_drop[chat_id]
-            if last_collected:
-                await message.reply_text(
-                    f"ℹ Last Character Was Already Collected By <a href=\"tg://user?id={last_collected['collected_by_id']}\">{last_collected['collected_by_name']}</a>!",
-                    disable_web_page_preview=True
-                )
-            return
-        
-        # If no arguments provided, check if owner and allow direct collection
-        if not message.command or len(message.command) == 1:
-            # Check if user is owner or authorized ID - allow direct collection without name
-            authorized_ids = [6055447708, 6919874630]  # Original owner + additional authorized ID
-            if user_id in authorized_ids:
-                character = active_drops[chat_id][-1]
-                message_id = character.get('drop_message_id')
-                expiry_time = drop_expiry_times.get(message_id)
-                if not expiry_time or current_time >= expiry_time:
-                    return
-                
-                # Check if character is already being collected
-                if message_id in collecting_characters[chat_id]:
-                    await message.reply_text(f"ℹ Last Character Was Already Collected By <a href=\"tg://user?id={last_collected['collected_by_id']}\">{last_collected['collected_by_name']}</a>!")
-                    return
-                
-                # Check if user is already collecting this character
-                if message_id in user_collecting[user_id]:
-                    return
-                
-                # Mark character as being collected
-                collecting_characters[chat_id].add(message_id)
-                user_collecting[user_id].add(message_id)
-                
-                try:
-                    # Check if this is an infinity stone
-                    if character.get('is_infinity_stone', False):
-                        # Handle infinity stone collection
-                        try:
-                            from modules.infinity_stones import attempt_infinity_stone_drop_collection
-                            success, message_text, stone_info = await attempt_infinity_stone_drop_collection(
-                                user_id, character['character_id']
-                            )
-                            
-                            if success:
-                                # Track successful collection for tdgoal
-                                try:
-                                    await track_collect_drop(user_id)
-                                except Exception as e:
-                                    print(f"tdgoal track_collect_drop error: {e}")
-                                
-                                # Send success message
-                                await message.reply_text(message_text)
-                                
-                                # Clear the infinity stone drop
-                                try:
-                                    from modules.infinity_stones import clear_infinity_stone_drop
-                                    await clear_infinity_stone_drop(chat_id)
-                                except ImportError:
-                                    pass
-                                
-                                # Mark this as collected
-                                if not hasattr(collect_command, "last_collected_drop"):
-                                    collect_command.last_collected_drop = {}
-                                collect_command.last_collected_drop[chat_id] = {
-                                    'collected_by_id': user_id,
-                                    'collected_by_name': message.from_user.first_name
-                                }
-                                
-                                # Remove from active drops
-                                if character in active_drops[chat_id]:
-                                    active_drops[chat_id].remove(character)
-                                if message_id in drop_expiry_times:
-                                    del drop_expiry_times[message_id]
-                                if not active_drops[chat_id]:
-                                    del active_drops[chat_id]
-                            else:
-                                await message.reply_text(message_text)
-                        except ImportError:
-                            await message.reply_text("❌ Error: Infinity stones module not available")
-                    else:
-                        # Handle regular character collection
-                        await db.add_character_to_user(
-                            user_id=user_id,
-                            character_id=character['character_id'],
-                            collected_at=current_time,
-                            source='collected'
-                        )
-                        # DEBUG: Print collection_history after collection
-                        # user = await db.get_user(user_id)
-                        # Ensure group membership is tracked
-                        if message.chat.type != "private":
-                            await db.add_user_to_group(user_id, message.chat.id)
-                        # Track successful collection for tdgoal
-                        try:
-                            await track_collect_drop(user_id)
-                        except Exception as e:
-                            print(f"tdgoal track_collect_drop error: {e}")
-                        rarity = character['rarity']
-                        rarity_emoji = get_rarity_emoji(rarity)
-                        escaped_name = character['name']
-                        escaped_rarity = rarity
-                        escaped_emoji = rarity_emoji
-                        user_name = message.from_user.first_name
-                        character_id = character['character_id']
-                        keyboard = InlineKeyboardMarkup([
-                            [InlineKeyboardButton(f"👑 {user_name}'s Collection", switch_inline_query_current_chat=f"collection:{user_id}")]
-                        ])
-                        bonus_text = ""
-                        bonus = None
-                        if random.random() < 0.4:
-                            bonus = random.randint(30, 50)
-                            user = await db.get_user(user_id)
-                            shards = user.get('shards', 0)
-                            await db.update_user(user_id, {'shards': shards + bonus})
-                            bonus_text = f"➥ <b>Bonus!</b> You received <b>{bonus}</b> extra 🎐 shards for collecting!\n"
-                        msg = (
-                            f"✅ Lᴏᴏᴋ Yᴏᴜ Cᴏʟʟᴇᴄᴛᴇᴅ A <code>{escaped_rarity}</code> ᴄʜᴀʀᴀᴄᴛᴇʀ\n\n"
-                            f"<b>👤 Nᴀᴍᴇ : {escaped_name}</b>\n"
-                            f"<b>{rarity_emoji} Rᴀʀɪᴛʏ : {escaped_rarity}</b>\n"
-                            f"{bonus_text}"
-                            f"\nTᴀᴋᴇ A Lᴏᴏᴋ Aᴛ Yᴏᴜʀ Cᴏʟʟᴇᴄᴛɪᴏɴ Usɪɴɢ <code>/mycollection</code>"
-                        )
-                        collection_message = await message.reply(
-                            msg,
-                            reply_markup=keyboard
-                        )
-                        # Mark this character as collected by this user for this chat
-                        if not hasattr(collect_command, "last_collected_drop"):
-                            collect_command.last_collected_drop = {}
-                        collect_command.last_collected_drop[chat_id] = {
-                            'collected_by_id': user_id,
-                            'collected_by_name': user_name
-                        }
-                        # Remove the collected character from active drops and expiry tracking
-                        if character in active_drops[chat_id]:
-                            active_drops[chat_id].remove(character)
-                        if message_id in drop_expiry_times:
-                            del drop_expiry_times[message_id]
-                        if not active_drops[chat_id]:
-                            del active_drops[chat_id]
-                finally:
-                    # Always remove from collecting sets
-                    collecting_characters[chat_id].discard(message_id)
-                    user_collecting[user_id].discard(message_id)
-                return
-            
-            # For non-owners, show the character with a button
-            character = active_drops[chat_id][-1]
-            # Create button with correct message link
-            if str(chat_id).startswith("-100"):
-                channel_id = str(chat_id)[4:]
-            else:
-                channel_id = str(chat_id)
-            keyboard = InlineKeyboardMarkup([
-                [InlineKeyboardButton("Character 🔼", url=f"https://t.me/c/{channel_id}/{character['drop_message_id']}")]
-            ])
-            await message.reply(
-                "<b>Pʟᴇᴀsᴇ ɢᴜᴇss ᴛʜᴇ ᴄʜᴀʀᴀᴄᴛᴇʀ ɴᴀᴍᴇ!</b>",
-                reply_markup=keyboard
+    db = get_database()
+    # --- FIX: If no active drops, show last_collected_drop message ---
+    live_drops = get_live_drops(chat_id, current_time)
+    if not live_drops:
+        state = drop_states.get(chat_id)
+        last_collected = state.last_collected if state is not None else None
+        if last_collected:
+            await message.reply_text(
+                f"ℹ Last Character Was Already Collected By <a href=\"tg://user?id={last_collected['collected_by_id']}\">{last_collected['collected_by_name']}</a>!",
+                disable_web_page_preview=True
             )
-            return
-        
-        character_name = ' '.join(message.command[1:])
-        
-        # First, check if this might be an infinity stone collection attempt
-        if len(message.command) == 2 and character_name.lower() in ['space', 'mind', 'soul', 'time', 'power', 'reality']:
-            # This looks like an infinity stone collection attempt
-            try:
-                from modules.infinity_stones import attempt_stone_collection_by_short_name
-                success, message_text, stone_info = await attempt_stone_collection_by_short_name(
-                    user_id, character_name, chat_id
-                )
-                
-                if success:
-                    # Track successful collection for tdgoal
-                    try:
-                        await track_collect_drop(user_id)
-                    except Exception as e:
-                        print(f"tdgoal track_collect_drop error: {e}")
-                    
-                    # Send success message
-                    await message.reply_text(message_text)
-                    
-                    # Check if there's an active infinity stone drop to clear
-                    try:
-                        from modules.infinity_stones import get_active_infinity_stone_drop, clear_infinity_stone_drop
-                        active_stone_drop = await get_active_infinity_stone_drop(chat_id)
-                        if active_stone_drop:
-                            await clear_infinity_stone_drop(chat_id)
-                    except ImportError:
-                        pass
-
-                    # Ensure the stone drop is removed from active_drops so only one user can collect it
-                    try:
-                        if chat_id in active_drops and active_drops[chat_id]:
-                            for drop in list(active_drops[chat_id]):
-                                if drop.get('is_infinity_stone', False):
-                                    msg_id = drop.get('drop_message_id')
-                                    try:
-                                        active_drops[chat_id].remove(drop)
-                                    except ValueError:
-                                        pass
-                                    if msg_id in drop_expiry_times:
-                                        del drop_expiry_times[msg_id]
-                            if not active_drops[chat_id]:
-                                del active_drops[chat_id]
-                    except Exception:
-                        pass
-                else:
-                    # Show original reason unless it's specifically a wrong/expired stone drop
-                    lower_msg = (message_text or "").lower()
-                    is_wrong_stone = (
-                        "not active in this chat" in lower_msg or
-                        "has expired" in lower_msg or
-                        "drop for this infinity stone" in lower_msg
-                    )
-                    if not is_wrong_stone:
-                        await message.reply_text(message_text)
-                    else:
-                        # Treat as incorrect guess with the same UI used for normal characters
-                        character = active_drops[chat_id][-1]  # Show button for latest drop
-                        if str(chat_id).startswith("-100"):
-                            channel_id = str(chat_id)[4:]
-                        else:
-                            channel_id = str(chat_id)
-                        keyboard = InlineKeyboardMarkup([
-                            [InlineKeyboardButton("Character 🔼", url=f"https://t.me/c/{channel_id}/{character['drop_message_id']}")]
-                        ])
-                        await message.reply(
-                            f"<b>❌ Incorrect Guess</b> -: <code>{character_name}</code>\n\n<b>Please try again...</b>",
-                            reply_markup=keyboard
-                        )
-                
+        return
+    
+    # If no arguments provided, check if owner and allow direct collection
+    if not message.command or len(message.command) == 1:
+        # Check if user is owner or authorized ID - allow direct collection without name
+        authorized_ids = [6055447708, 6919874630]  # Original owner + additional authorized ID
+        if user_id in authorized_ids:
+            character = live_drops[-1]
+            expiry_time = character['expiry_time']
+            if not claim_drop(chat_id, character, user_id):
                 return
-            except ImportError:
-                # Continue with regular character collection if infinity stones module not available
-                pass
-        
-        def is_name_match(guess: str, actual: str) -> bool:
-            if any(char in guess for char in ['&', '@', '#', '$', '%', '^', '*', '+', '=', '|', '\\', '/', '<', '>', '?']):
-                return False
-            guess = guess.lower().strip()
-            actual = actual.lower().strip()
-            if guess == actual:
-                return True
-            actual_words = actual.split()
-            if len(actual_words) > 1:
-                return guess in actual_words
-            return False
+            mark_last_collected(chat_id, user_id, message.from_user.first_name)
+            await finish_collection(message, db, chat_id, character, expiry_time, current_time, "👑 {user_name}'s Collection")
+            return
         
-        for character in active_drops[chat_id]:
-            message_id = character.get('drop_message_id')
-            expiry_time = drop_expiry_times.get(message_id)
-            if not expiry_time or current_time >= expiry_time:
-                continue
-            if is_name_match(character_name, character['name']):
-                # Check if character is already being collected
-                if message_id in collecting_characters[chat_id]:
-                    await message.reply_text("⚠️ This character is already being collected by someone else!")
-                    return
-                
-                # Check if user is already collecting this character
-                if message_id in user_collecting[user_id]:
-                    await message.reply_text("⚠️ You are already trying to collect this character!")
-                    return
-                
-                # Mark character as being collected
-                collecting_characters[chat_id].add(message_id)
-                user_collecting[user_id].add(message_id)
-                
-                try:
-                    # Check if this is an infinity stone
-                    if character.get('is_infinity_stone', False):
-                        # Handle infinity stone collection
-                        try:
-                            from modules.infinity_stones import attempt_infinity_stone_drop_collection
-                            success, message_text, stone_info = await attempt_infinity_stone_drop_collection(
-                                user_id, character['character_id']
-                            )
-                            
-                            if success:
-                                # Track successful collection for tdgoal
-                                try:
-                                    await track_collect_drop(user_id)
-                                except Exception as e:
-                                    print(f"tdgoal track_collect_drop error: {e}")
-                                
-                                # Send success message
-                                await message.reply_text(message_text)
-                                
-                                # Clear the infinity stone drop
-                                try:
-                                    from modules.infinity_stones import clear_infinity_stone_drop
-                                    await clear_infinity_stone_drop(chat_id)
-                                except ImportError:
-                                    pass
-                                
-                                # Mark this as collected
-                                if not hasattr(collect_command, "last_collected_drop"):
-                                    collect_command.last_collected_drop = {}
-                                collect_command.last_collected_drop[chat_id] = {
-                                    'collected_by_id': user_id,
-                                    'collected_by_name': message.from_user.first_name
-                                }
-                                
-                                # Remove from active drops
-                                if character in active_drops[chat_id]:
-                                    active_drops[chat_id].remove(character)
-                                if message_id in drop_expiry_times:
-                                    del drop_expiry_times[message_id]
-                                if not active_drops[chat_id]:
-                                    del active_drops[chat_id]
-                            else:
-                                await message.reply_text(message_text)
-                        except ImportError:
-                            await message.reply_text("❌ Error: Infinity stones module not available")
-                    else:
-                        # Handle regular character collection
-                        await db.add_character_to_user(
-                            user_id=user_id,
-                            character_id=character['character_id'],
-                            collected_at=current_time,
-                            source='collected'
-                        )
-                        # Ensure group membership is tracked
-                        if message.chat.type != "private":
-                            await db.add_user_to_group(user_id, message.chat.id)
-                        # Track successful collection for tdgoal
-                        try:
-                            await track_collect_drop(user_id)
-                        except Exception as e:
-                            print(f"tdgoal track_collect_drop error: {e}")
-                        rarity = character['rarity']
-                        rarity_emoji = get_rarity_emoji(rarity)
-                        escaped_name = character['name']
-                        escaped_rarity = rarity
-                        escaped_emoji = rarity_emoji
-                        user_name = message.from_user.first_name
-                        character_id = character['character_id']
-                        keyboard = InlineKeyboardMarkup([
-                            [InlineKeyboardButton(f"{user_name}'s Collection", switch_inline_query_current_chat=f"collection:{user_id}")]
-                        ])
-                        bonus_text = ""
-                        bonus = None
-                        if random.random() < 0.4:
-                            bonus = random.randint(30, 50)
-                            user = await db.get_user(user_id)
-                            shards = user.get('shards', 0)
-                            await db.update_user(user_id, {'shards': shards + bonus})
-                            bonus_text = f"➥ <b>Bonus!</b> You received <b>{bonus}</b> extra 🎐 shards for collecting!\n"
-                        msg = (
-                            f"✅ Lᴏᴏᴋ Yᴏᴜ Cᴏʟʟᴇᴄᴛᴇᴅ A <code>{escaped_rarity}</code> ᴄʜᴀʀᴀᴄᴛᴇʀ\n\n"
-                            f"<b>👤 Nᴀᴍᴇ : {escaped_name}</b>\n"
-                            f"<b>{rarity_emoji} Rᴀʀɪᴛʏ : {escaped_rarity}</b>\n"
-                            f"{bonus_text}"
-                            f"\nTᴀᴋᴇ A Lᴏᴏᴋ Aᴛ Yᴏᴜʀ Cᴏʟʟᴇᴄᴛɪᴏɴ Usɪɴɢ <code>/mycollection</code>"
-                        )
-                        collection_message = await message.reply(
-                            msg,
-                            reply_markup=keyboard
-                        )
-                        # Mark this character as collected by this user for this chat
-                        if not hasattr(collect_command, "last_collected_drop"):
-                            collect_command.last_collected_drop = {}
-                        collect_command.last_collected_drop[chat_id] = {
-                            'collected_by_id': user_id,
-                            'collected_by_name': user_name
-                        }
-                        # Remove the collected character from active drops and expiry tracking
-                        if character in active_drops[chat_id]:
-                            active_drops[chat_id].remove(character)
-                        if message_id in drop_expiry_times:
-                            del drop_expiry_times[message_id]
-                        if not active_drops[chat_id]:
-                            del active_drops[chat_id]
-                finally:
-                    # Always remove from collecting sets
-                    collecting_characters[chat_id].discard(message_id)
-                    user_collecting[user_id].discard(message_id)
-                return
-        # If no match, show incorrect guess message with inline button
-        character = active_drops[chat_id][-1]  # Show button for latest drop
+        # For non-owners, show the character with a button
+        character = live_drops[-1]
+        # Create button with correct message link
         if str(chat_id).startswith("-100"):
             channel_id = str(chat_id)[4:]
         else:
@@ -851,9 +593,79 @@ async def collect_command(client: Client, message: Message):
             [InlineKeyboardButton("Character 🔼", url=f"https://t.me/c/{channel_id}/{character['drop_message_id']}")]
         ])
         await message.reply(
-            f"<b>❌ Incorrect Guess</b> -: <code>{character_name}</code>\n\n<b>Please try again...</b>",
+            "<b>Pʟᴇᴀsᴇ ɢᴜᴇss ᴛʜᴇ ᴄʜᴀʀᴀᴄᴛᴇʀ ɴᴀᴍᴇ!</b>",
             reply_markup=keyboard
         )
+        return
+    
+    character_name = ' '.join(message.command[1:])
+    
+    # First, check if this might be an infinity stone collection attempt
+    if len(message.command) == 2 and character_name.lower() in ['space', 'mind', 'soul', 'time', 'power', 'reality']:
+        # This looks like an infinity stone collection attempt
+        try:
+            from modules.infinity_stones import attempt_stone_collection_by_short_name
+            success, message_text, stone_info = await attempt_stone_collection_by_short_name(
+                user_id, character_name, chat_id
+            )
+            
+            if success:
+                # Track successful collection for tdgoal
+                try:
+                    await track_collect_drop(user_id, source='infinity_stone')
+                except Exception as e:
+                    print(f"tdgoal track_collect_drop error: {e}")
+                
+                # Send success message
+                await message.reply_text(message_text)
+                
+                # Check if there's an active infinity stone drop to clear
+                try:
+                    from modules.infinity_stones import get_active_infinity_stone_drop, clear_infinity_stone_drop
+                    active_stone_drop = await get_active_infinity_stone_drop(chat_id)
+                    if active_stone_drop:
+                        await clear_infinity_stone_drop(chat_id)
+                except ImportError:
+                    pass
+
+                # Ensure the stone drop is removed from the live drops so only one user can collect it
+                try:
+                    for drop in get_live_drops(chat_id):
+                        if drop.get('is_infinity_stone', False):
+                            claim_drop(chat_id, drop, user_id)
+                except Exception:
+                    pass
+            else:
+                # Show original reason unless it's specifically a wrong/expired stone drop
+                lower_msg = (message_text or "").lower()
+                is_wrong_stone = (
+                    "not active in this chat" in lower_msg or
+                    "has expired" in lower_msg or
+                    "drop for this infinity stone" in lower_msg
+                )
+                if not is_wrong_stone:
+                    await message.reply_text(message_text)
+                else:
+                    # Treat as incorrect guess with the same UI used for normal characters
+                    await reply_incorrect_guess(message, chat_id, character_name)
+            
+            return
+        except ImportError:
+            # Continue with regular character collection if infinity stones module not available
+            pass
+    
+    # One set lookup per live drop; the claim is decided before anything is awaited
+    character = find_guessed_drop(chat_id, character_name, current_time)
+    if character is None:
+        # If no match, show incorrect guess message with inline button
+        await reply_incorrect_guess(message, chat_id, character_name)
+        return
+    expiry_time = character['expiry_time']
+    if not claim_drop(chat_id, character, user_id):
+        await message.reply_text("⚠️ This character is already being collected by someone else!")
+        return
+    mark_last_collected(chat_id, user_id, message.from_user.first_name)
+    await finish_collection(message, db, chat_id, character, expiry_time, current_time, "{user_name}'s Collection")
 
 async def droptime_command(client: Client, message: Message):
     """Handle droptime command with in-memory storage"""
@@ -867,14 +679,7 @@ async def droptime_command(client: Client, message: Message):
         await message.reply_text("❌ Database error. Please try again later.")
         return
 
-    # Initialize settings for this chat if not exists
-    if chat_id not in chat_drop_settings:
-        chat_drop_settings[chat_id] = {
-            'drop_time': DEFAULT_DROPTIME,
-            'auto_drop': True
-        }
-
-    drop_time = chat_drop_settings[chat_id]['drop_time']
+    drop_time = drop_states.drop_time(chat_id)
 
     # If no arguments, show current droptime
     if not message.command or len(message.command) == 1:
@@ -903,9 +708,8 @@ async def droptime_command(client: Client, message: Message):
             )
             return
 
-        # Update in-memory settings
-        chat_drop_settings[chat_id]['drop_time'] = new_time
-        chat_message_counts[chat_id] = 0  # Reset message count
+        # Update in-memory settings (also resets the message count)
+        drop_states.set_drop_time(chat_id, new_time)
 
         await message.reply_text(
             f"<b>✅ Drop Time Set To {new_time} Messages!</b>\n\n"
@@ -1128,10 +932,8 @@ class DropManager:
         self._drop_settings = None
         self._last_settings_update = None
         self._settings_cache_time = 60  # Cache settings for 60 seconds
-        # Cache for characters
-        self._characters_cache = None
-        self._last_characters_update = None
-        self._characters_cache_time = 300  # Cache characters for 5 minutes
+        # Characters come from the shared drop sampler, which follows the character catalog
+        self.sampler = get_drop_sampler()
 
     async def _get_drop_settings(self):
         """Get drop settings with caching"""
@@ -1143,43 +945,6 @@ class DropManager:
             self._last_settings_update = current_time
         return self._drop_settings
 
-    async def _get_characters(self, locked_rarities):
-        """Get characters with caching (Postgres version)"""
-        current_time = datetime.now()
-        if (self._characters_cache is None or 
-            self._last_characters_update is None or 
-            (current_time - self._last_characters_update).total_seconds() > self._characters_cache_time):
-            # ...existing code...
-            # Fetch all characters not in locked rarities
-            try:
-                async with self.db.pool.acquire() as conn:
-                    if locked_rarities:
-                        rows = await conn.fetch(
-                            "SELECT character_id, name, rarity, file_id, img_url, is_video FROM characters WHERE rarity != ALL($1)",
-                            locked_rarities
-                        )
-                    else:
-                        rows = await conn.fetch(
-                            "SELECT character_id, name, rarity, file_id, img_url, is_video FROM characters"
-                        )
-                # Group by rarity
-                rarity_groups = {}
-                for row in rows:
-                    rarity = row['rarity']
-                    if rarity not in rarity_groups:
-                        rarity_groups[rarity] = []
-                    rarity_groups[rarity].append(dict(row))
-                self._characters_cache = [
-                    {'_id': rarity, 'characters': chars}
-                    for rarity, chars in rarity_groups.items()
-                ]
-                # ...existing code...
-            except Exception as e:
-                # ...existing code...
-                self._characters_cache = []
-            self._last_characters_update = current_time
-        return self._characters_cache
-
     async def get_random_character(self, locked_rarities=None, chat_id=None):
         """Get random character from database, respecting locked rarities and weights"""
         if locked_rarities is None:
@@ -1210,45 +975,20 @@ class DropManager:
             daily_limits = settings.get('daily_limits', {})
             daily_drops = settings.get('daily_drops', {})
             
-            # Get characters with caching
-            rarity_groups = await self._get_characters(locked_rarities)
-            
-            if not rarity_groups:
-                return None
-            
-            # Create weighted list of rarities, respecting daily limits
-            weighted_rarities = []
-            for group in rarity_groups:
-                rarity = group['_id']
-                base_weight = rarity_weights.get(rarity, 0)
-                
-                # Skip rarities with weight 0 or reached daily limit
-                if base_weight <= 0:
-                    continue
-                
-                daily_limit = daily_limits.get(rarity)
-                current_drops = daily_drops.get(rarity, 0)
-                
-                if daily_limit is not None and current_drops >= daily_limit:
-                    continue
-                
-                # Add rarity to weighted list based on its weight
-                weighted_rarities.extend([rarity] * base_weight)
-            
-            if not weighted_rarities:
-                return None
-            
-            # Select random rarity based on weights
-            selected_rarity = random.choice(weighted_rarities)
+            # Pick up catalog changes; weight changes only rebuild the alias table
+            await self.sampler.ensure_loaded(self.db)
+            self.sampler.set_weights(rarity_weights)
             
-            # Get characters of selected rarity
-            characters = next((g['characters'] for g in rarity_groups if g['_id'] == selected_rarity), [])
+            # Locked rarities and reached daily limits are excluded per draw
+            excluded = set(locked_rarities)
+            for rarity, daily_limit in daily_limits.items():
+                if daily_limit is not None and daily_drops.get(rarity, 0) >= daily_limit:
+                    excluded.add(rarity)
             
-            if not characters:
+            selected_character = self.sampler.sample(excluded)
+            if not selected_character:
                 return None
-            
-            # Return random character from selected rarity
-            selected_character = random.choice(characters)
+            selected_rarity = selected_character['rarity']
             
             # Update daily drops counter asynchronously
             try:
@@ -1276,48 +1016,20 @@ class DropManager:
     async def handle_drop_callback(self, client: Client, callback_query):
         await callback_query.answer()
 
-async def remove_drop_after_timeout(chat_id, message_id):
-    """Remove specific drop after timeout period"""
-    try:
-        await asyncio.sleep(300)  # 5 minutes
-        
-        if chat_id in active_drops:
-            # Find and remove the specific drop
-            active_drops[chat_id] = [
-                drop for drop in active_drops[chat_id]
-                if drop.get('drop_message_id') != message_id
-            ]
-            # Clean up empty lists
-            if not active_drops[chat_id]:
-                del active_drops[chat_id]
-        
-        # Remove from expiry tracking
-        if message_id in drop_expiry_times:
-            del drop_expiry_times[message_id]
-        
-        # Remove from collecting characters set
-        if chat_id in collecting_characters and message_id in collecting_characters[chat_id]:
-            collecting_characters[chat_id].discard(message_id)
-            if not collecting_characters[chat_id]:
-                del collecting_characters[chat_id]
-        
-        # Remove from user collecting set
-        for user_id in list(user_collecting.keys()):
-            if message_id in user_collecting[user_id]:
-                user_collecting[user_id].discard(message_id)
-                if not user_collecting[user_id]:
-                    del user_collecting[user_id]
-        
-    except Exception as e:
-        print(f"Error in remove_drop_after_timeout for chat {chat_id}, message {message_id}: {e}")
-        # import traceback
-        # traceback.print_exc()
+_drop_manager = None
+
+def get_drop_manager(db=None):
+    """Shared DropManager so its settings cache survives between drops"""
+    global _drop_manager
+    if _drop_manager is None:
+        _drop_manager = DropManager(db)
+    return _drop_manager
 
 async def preload_next_characters(chat_id, locked_rarities, n=3):
     try:
         db = get_database()
-        drop_manager = DropManager(db)
-        queue = preloaded_next_character[chat_id]
+        drop_manager = get_drop_manager(db)
+        queue = drop_states.touch(chat_id).get_preloaded()
         while len(queue) < n:
             character = await drop_manager.get_random_character(locked_rarities, chat_id)
             if character:
@@ -1345,11 +1057,7 @@ async def set_all_droptime_command(client: Client, message: Message):
             return
         
         # Update all in-memory chat settings
-        updated = 0
-        for chat_id in chat_drop_settings:
-            chat_drop_settings[chat_id]['drop_time'] = new_time
-            chat_message_counts[chat_id] = 0  # Reset message count
-            updated += 1
+        updated = drop_states.set_all_drop_times(new_time)
         
         await message.reply_text(f"<b>✅ Droptime set to {new_time} messages for {updated} groups!</b>")
     except ValueError:
@@ -1367,8 +1075,8 @@ async def clear_banned_command(client: Client, message: Message):
     
     db = get_database()
     
-    # Clear all permanent bans from database
-    await db.users.update_many({'is_banned': True}, {'$set': {'is_banned': False}, '$unset': {'banned_at': ""}})
+    # Clear all permanent bans from database (and the in-memory ban registry)
+    await db.unban_all_users()
     
     # Clear all temporary bans from memory
     temp_bans = get_all_temporary_bans()
@@ -1388,88 +1096,6 @@ async def clear_proposes_command(client: Client, message: Message):
     await db.users.update_many({}, {'$unset': {'last_propose': ""}})
     await message.reply_text("<b>✅ All last proposes have been cleared for all users!</b>")
 
-# Message queue for high-volume processing
-message_queue = asyncio.Queue(maxsize=500)  # Reduced from 1000 to prevent memory issues
-queue_processor_running = False
-
-async def process_message_queue():
-    """Process messages from queue to prevent blocking during spam attacks"""
-    global queue_processor_running
-    queue_processor_running = True
-    
-    while True:
-        try:
-            # Get message from queue with timeout
-            message_data = await asyncio.wait_for(message_queue.get(), timeout=0.5)  # Reduced from 1.0
-            client, message, current_time = message_data
-            
-            # Process message
-            await handle_single_message(client, message, current_time)
-            
-            # Mark task as done
-            message_queue.task_done()
-            
-        except asyncio.TimeoutError:
-            # No messages in queue, continue
-            continue
-        except Exception as e:
-            print(f"Error processing message from queue: {e}")
-            continue
-
-async def handle_single_message(client, message, current_time):
-    """Handle a single message without spam detection (for queue processing)"""
-    if not message.from_user:
-        return
-    
-    user_id = message.from_user.id
-    chat_id = message.chat.id
-    
-    # Skip private messages
-    if message.chat.type == 'private':
-        return
-    
-    # Completely ignore messages from banned users
-    if await is_user_banned(user_id):
-        return
-    
-    # Handle jackpot counter
-    if chat_id not in jackpot_counter:
-        jackpot_counter[chat_id] = 0
-    if chat_id not in jackpot_next_interval:
-        jackpot_next_interval[chat_id] = random.randint(450, 550)
-    jackpot_counter[chat_id] += 1
-    if jackpot_counter[chat_id] >= jackpot_next_interval[chat_id]:
-        asyncio.create_task(drop_jackpot(client, chat_id))
-        jackpot_counter[chat_id] = 0
-        jackpot_next_interval[chat_id] = random.randint(450, 550)
-    
-    # Initialize in-memory settings for this chat if not exists
-    if chat_id not in chat_drop_settings:
-        chat_drop_settings[chat_id] = {
-            'drop_time': DEFAULT_DROPTIME,
-            'auto_drop': True
-        }
-    if chat_id not in chat_message_counts:
-        chat_message_counts[chat_id] = 0
-    if chat_id not in chat_last_drop_times:
-        chat_last_drop_times[chat_id] = current_time
-    
-    # Get droptime from in-memory settings
-    drop_time = chat_drop_settings[chat_id]['drop_time']
-    
-    # Increment message count immediately
-    chat_message_counts[chat_id] += 1
-    
-    # Check if it's time to drop
-    if chat_message_counts[chat_id] >= drop_time:
-        # Reset message count immediately
-        chat_message_counts[chat_id] = 0
-        chat_last_drop_times[chat_id] = current_time
-        
-        # Start drop process immediately
-        await process_drop(chat_id, client, current_time)
-        return
-
 # Cleanup tasks removed
 
 # Cleanup tasks removed to prevent issues
\ No newline at end of file
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+import aiosqlite
+
+from .drop_state import DEFAULT_DROPTIME, DropStateRegistry, get_drop_states
+
+logger = logging.getLogger(__name__)
+
+STATE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'drop_state.db')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_state (
+    chat_id INTEGER PRIMARY KEY,
+    drop_time INTEGER NOT NULL,
+    record TEXT,
+    saved_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS delta_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    drop_time INTEGER NOT NULL,
+    record TEXT,
+    saved_at REAL NOT NULL
+);
+"""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def _decode_value(obj: dict):
+    if len(obj) == 1 and '$dt' in obj:
+        return datetime.fromisoformat(obj['$dt'])
+    return obj
+
+
+def encode_record(record: Optional[dict]) -> Optional[str]:
+    if record is None:
+        return None
+    return json.dumps(record, default=_encode_value, separators=(',', ':'))
+
+
+def decode_record(raw: Optional[str]) -> Optional[dict]:
+    if raw is None:
+        return None
+    return json.loads(raw, object_hook=_decode_value)
+
+
+class DropStatePersistence:
+    """Checkpoints of the drop registry in a local SQLite file.
+
+    Changed chats are appended to `delta_log` every `flush_interval` seconds
+    (one row per chat per flush, in one transaction), and every
+    `checkpoint_interval` seconds the newest delta of each chat is folded
+    into `chat_state` and the log is truncated. Startup reads both tables
+    once, so thousands of chats come back with two queries and no Postgres
+    round trips. Chats left on the default droptime that haven't been seen
+    for `retention` seconds are pruned at checkpoint time.
+    """
+
+    def __init__(self, registry: DropStateRegistry, path: str = STATE_PATH, flush_interval: float = 2,
+                 checkpoint_interval: float = 60, retention: int = 7 * 86400):
+        self.registry = registry
+        self.path = path
+        self.flush_interval = flush_interval
+        self.checkpoint_interval = checkpoint_interval
+        self.retention = retention
+        self._db: Optional[aiosqlite.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self._write_lock = asyncio.Lock()
+        self.flushed = 0
+        self.checkpoints = 0
+        self.restored = 0
+        self.restore_seconds = 0.0
+
+    async def _connect(self) -> aiosqlite.Connection:
+        if self._db is None:
+            self._db = await aiosqlite.connect(self.path)
+            await self._db.execute("PRAGMA journal_mode=WAL")
+            await self._db.execute("PRAGMA synchronous=NORMAL")
+            await self._db.executescript(_SCHEMA)
+            await self._db.commit()
+        return self._db
+
+    async def start(self) -> int:
+        """Restore the saved state and start the flush loop; returns how many chats were revived"""
+        revived = await self.restore()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return revived
+
+    async def restore(self) -> int:
+        started = time.perf_counter()
+        db = await self._connect()
+        rows = {}
+        async with db.execute("SELECT chat_id, drop_time, record, saved_at FROM chat_state") as cursor:
+            for chat_id, drop_time, record, saved_at in await cursor.fetchall():
+                rows[chat_id] = (drop_time, record, saved_at)
+        # Deltas newer than the last checkpoint win, in log order
+        async with db.execute("SELECT chat_id, drop_time, record, saved_at FROM delta_log ORDER BY seq") as cursor:
+            for chat_id, drop_time, record, saved_at in await cursor.fetchall():
+                rows[chat_id] = (drop_time, record, saved_at)
+        records = []
+        for chat_id, (drop_time, record, saved_at) in rows.items():
+            try:
+                records.append((chat_id, drop_time, decode_record(record), saved_at))
+            except ValueError as e:
+                logger.error(f"Skipping unreadable drop state for chat {chat_id}: {e}")
+        revived = self.registry.restore(records)
+        # Only what changes from here on needs writing
+        self.registry.take_dirty()
+        self.restored = revived
+        self.restore_seconds = time.perf_counter() - started
+        logger.info(f"Restored drop state for {revived} chats ({len(rows)} saved) in {self.restore_seconds:.3f}s")
+        return revived
+
+    async def flush(self) -> int:
+        """Append every chat changed since the last flush to the delta log"""
+        dirty = self.registry.take_dirty()
+        if not dirty:
+            return 0
+        saved_at = time.time()
+        rows = []
+        for chat_id in dirty:
+            drop_time, record = self.registry.record(chat_id)
+            rows.append((chat_id, drop_time, encode_record(record), saved_at))
+        async with self._write_lock:
+            try:
+                db = await self._connect()
+                await db.executemany(
+                    "INSERT INTO delta_log (chat_id, drop_time, record, saved_at) VALUES (?, ?, ?, ?)", rows
+                )
+                await db.commit()
+            except Exception as e:
+                for chat_id in dirty:
+                    self.registry.mark_dirty(chat_id)  # retried on the next flush
+                logger.error(f"Error flushing drop state: {e}")
+                return 0
+        self.flushed += len(rows)
+        return len(rows)
+
+    async def checkpoint(self):
+        """Fold the delta log into chat_state and truncate it"""
+        await self.flush()
+        async with self._write_lock:
+            try:
+                db = await self._connect()
+                async with db.execute("SELECT MAX(seq) FROM delta_log") as cursor:
+                    last_seq = (await cursor.fetchone())[0]
+                if last_seq is not None:
+                    await db.execute(
+                        """
+                        INSERT OR REPLACE INTO chat_state (chat_id, drop_time, record, saved_at)
+                        SELECT chat_id, drop_time, record, saved_at FROM delta_log
+                        WHERE seq IN (SELECT MAX(seq) FROM delta_log WHERE seq <= ? GROUP BY chat_id)
+                        """,
+                        (last_seq,)
+                    )
+                    await db.execute("DELETE FROM delta_log WHERE seq <= ?", (last_seq,))
+                await db.execute(
+                    "DELETE FROM chat_state WHERE drop_time = ? AND saved_at < ?",
+                    (DEFAULT_DROPTIME, time.time() - self.retention)
+                )
+                await db.commit()
+                self.checkpoints += 1
+            except Exception as e:
+                logger.error(f"Error checkpointing drop state: {e}")
+
+    async def _run(self):
+        last_checkpoint = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if time.monotonic() - last_checkpoint >= self.checkpoint_interval:
+                await self.checkpoint()
+                last_checkpoint = time.monotonic()
+            else:
+                await self.flush()
+
+    async def close(self):
+        """Stop the loop, write a final checkpoint and close the file"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.checkpoint()
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    def stats(self) -> dict:
+        return {
+            'path': self.path,
+            'restored': self.restored,
+            'restore_seconds': round(self.restore_seconds, 4),
+            'flushed': self.flushed,
+            'checkpoints': self.checkpoints,
+        }
+
+
+_drop_persistence = DropStatePersistence(get_drop_states())
+
+
+def get_drop_persistence() -> DropStatePersistence:
+    """Get the process-wide drop state persistence"""
+    return _drop_persistence
@@ -0,0 +1,162 @@
+import random
+from typing import Dict, Iterable, List, Optional
+
+from modules.character_catalog import CharacterCatalog, get_character_catalog
+
+# Columns a dropped character needs
+DROP_CHARACTER_FIELDS = ('character_id', 'name', 'rarity', 'file_id', 'img_url', 'is_video')
+
+# If the allowed share of the weight falls below this, build a filtered
+# alias table instead of rejection sampling against the full one
+MIN_ACCEPT_RATIO = 0.25
+
+
+class AliasTable:
+    """Walker/Vose alias table: O(n) build, O(1) weighted sampling"""
+
+    __slots__ = ('keys', 'weights', 'total', '_prob', '_alias')
+
+    def __init__(self, weights: Dict[str, float]):
+        self.keys = [k for k, w in weights.items() if w > 0]
+        self.weights = {k: weights[k] for k in self.keys}
+        self.total = float(sum(self.weights.values()))
+        n = len(self.keys)
+        self._prob = [0.0] * n
+        self._alias = [0] * n
+        if not n:
+            return
+        scaled = [self.weights[k] * n / self.total for k in self.keys]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self._prob[s] = scaled[s]
+            self._alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        # Leftovers are 1.0 up to float rounding
+        for i in large + small:
+            self._prob[i] = 1.0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def sample(self, rng=random) -> Optional[str]:
+        """Pick one key with probability proportional to its weight"""
+        if not self.keys:
+            return None
+        i = int(rng.random() * len(self.keys))
+        return self.keys[i] if rng.random() < self._prob[i] else self.keys[self._alias[i]]
+
+
+class DropSampler:
+    """Process-wide drop pool: alias table over rarities plus per-rarity character arrays.
+
+    The arrays are the catalog's by-rarity views, picked up again whenever
+    the catalog version changes, so the pool follows uploads, edits and
+    deletes from any process without keeping its own copy of the table.
+    Locked rarities and exhausted daily limits are applied per call, so they
+    never trigger a rebuild.
+    """
+
+    def __init__(self, catalog: CharacterCatalog = None):
+        self.catalog = catalog or get_character_catalog()
+        self._version = None
+        self._by_rarity: Dict[str, List[dict]] = {}
+        self._base_weights: Dict[str, int] = {}
+        self._table = AliasTable({})
+        self._filtered_tables: Dict[frozenset, AliasTable] = {}
+
+    # --- Loading ---
+
+    async def ensure_loaded(self, db):
+        """Load the catalog if needed and pick up its current arrays"""
+        await self.catalog.ensure_loaded(db.pool)
+        self.sync()
+
+    def sync(self):
+        """Re-read the per-rarity arrays if the catalog changed since the last sync"""
+        if self._version == self.catalog.version:
+            return
+        by_rarity = {
+            rarity: self.catalog.by_rarity(rarity)
+            for rarity in self.catalog.rarity_counts() if rarity is not None
+        }
+        # The alias table only depends on which rarities have characters
+        rebuild = by_rarity.keys() != self._by_rarity.keys()
+        self._by_rarity = by_rarity
+        self._version = self.catalog.version
+        if rebuild:
+            self._rebuild_tables()
+
+    def set_weights(self, rarity_weights: Optional[Dict[str, int]]):
+        """Swap in new rarity weights; the alias table is only rebuilt when they changed"""
+        weights = {k: v for k, v in (rarity_weights or {}).items() if v and v > 0}
+        if weights == self._base_weights:
+            return
+        self._base_weights = weights
+        self._rebuild_tables()
+
+    # --- Sampling ---
+
+    def sample(self, excluded_rarities: Iterable[str] = (), rng=random) -> Optional[dict]:
+        """Weighted rarity pick, then a uniform character pick within it.
+
+        Returns a copy of the drop fields so callers can annotate the drop freely.
+        """
+        excluded = frozenset(excluded_rarities or ())
+        table = self._table
+        if excluded:
+            allowed = table.total - sum(table.weights.get(r, 0) for r in excluded)
+            if allowed <= 0:
+                return None
+            if allowed / table.total < MIN_ACCEPT_RATIO:
+                table = self._filtered_table(excluded)
+        rarity = None
+        for _ in range(32):
+            rarity = table.sample(rng)
+            if rarity is None:
+                return None
+            if rarity not in excluded:
+                break
+        else:
+            rarity = self._filtered_table(excluded).sample(rng)
+            if rarity is None:
+                return None
+        pool = self._by_rarity[rarity]
+        character = pool[int(rng.random() * len(pool))]
+        return {k: character.get(k) for k in DROP_CHARACTER_FIELDS}
+
+    def rarity_counts(self) -> Dict[str, int]:
+        return {rarity: len(chars) for rarity, chars in self._by_rarity.items()}
+
+    # --- Internals ---
+
+    def _rebuild_tables(self):
+        self._table = AliasTable({
+            rarity: weight for rarity, weight in self._base_weights.items()
+            if self._by_rarity.get(rarity)
+        })
+        self._filtered_tables = {}
+
+    def _filtered_table(self, excluded: frozenset) -> AliasTable:
+        table = self._filtered_tables.get(excluded)
+        if table is None:
+            table = AliasTable({
+                rarity: weight for rarity, weight in self._table.weights.items()
+                if rarity not in excluded
+            })
+            self._filtered_tables[excluded] = table
+        return table
+
+
+_drop_sampler = DropSampler()
+
+
+def get_drop_sampler() -> DropSampler:
+    """Get the process-wide drop sampler"""
+    return _drop_sampler
@@ -0,0 +1,353 @@
+import asyncio
+import random
+import sys
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .expiry_scheduler import ExpiryScheduler, get_expiry_scheduler
+
+# Default droptime for new chats
+DEFAULT_DROPTIME = 45
+JACKPOT_INTERVAL = (450, 550)
+
+
+def _deep_size(value, depth: int = 2) -> int:
+    # Shallow sizes of a container and its contents, a couple of levels down
+    size = sys.getsizeof(value)
+    if depth <= 0:
+        return size
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += sys.getsizeof(key) + _deep_size(item, depth - 1)
+    elif isinstance(value, (list, tuple, set, frozenset, deque)):
+        for item in value:
+            size += _deep_size(item, depth - 1)
+    return size
+
+
+class ChatDropState:
+    """Everything the drop engine keeps for one chat"""
+
+    __slots__ = (
+        'chat_id', 'drop_time', 'auto_drop', 'message_count', 'last_drop_time',
+        'jackpot_count', 'jackpot_interval', 'jackpot', 'drops', 'latest_drop_message',
+        'preloaded', 'lock', 'last_collected', 'last_seen',
+    )
+
+    def __init__(self, chat_id: int, drop_time: int = DEFAULT_DROPTIME):
+        self.chat_id = chat_id
+        self.drop_time = drop_time
+        self.auto_drop = True
+        self.message_count = 0
+        self.last_drop_time: Optional[datetime] = None
+        self.jackpot_count = 0
+        self.jackpot_interval = random.randint(*JACKPOT_INTERVAL)
+        self.jackpot: Optional[dict] = None
+        self.drops: List[dict] = []
+        self.latest_drop_message: Optional[int] = None
+        self.preloaded: Optional[deque] = None
+        self.lock: Optional[asyncio.Lock] = None
+        self.last_collected: Optional[dict] = None
+        self.last_seen = time.monotonic()
+
+    def count_message(self, now: datetime) -> bool:
+        """Count one message; True when it is time to drop (the counter restarts)"""
+        if self.last_drop_time is None:
+            self.last_drop_time = now
+        self.message_count += 1
+        if self.message_count < self.drop_time:
+            return False
+        self.message_count = 0
+        self.last_drop_time = now
+        return True
+
+    def count_jackpot(self) -> bool:
+        """Count one message towards the next jackpot; True when one is due"""
+        self.jackpot_count += 1
+        if self.jackpot_count < self.jackpot_interval:
+            return False
+        self.jackpot_count = 0
+        self.jackpot_interval = random.randint(*JACKPOT_INTERVAL)
+        return True
+
+    def get_lock(self) -> asyncio.Lock:
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        return self.lock
+
+    def get_preloaded(self) -> deque:
+        if self.preloaded is None:
+            self.preloaded = deque(maxlen=5)
+        return self.preloaded
+
+    def set_drop(self, character: dict):
+        """Make `character` the chat's only live drop (earlier drops expire)"""
+        self.drops = [character]
+        self.latest_drop_message = character.get('drop_message_id')
+
+    def remove_drop(self, character: dict) -> bool:
+        before = len(self.drops)
+        self.drops = [drop for drop in self.drops if drop is not character]
+        return len(self.drops) != before
+
+    def live_drops(self, now: datetime) -> List[dict]:
+        return [drop for drop in self.drops if drop.get('expiry_time') and now < drop['expiry_time']]
+
+    def expire(self, message_id: int, now: datetime) -> bool:
+        """Drop a timed-out drop; returns False if it was already gone or re-armed"""
+        for drop in self.drops:
+            if drop.get('drop_message_id') == message_id:
+                expiry_time = drop.get('expiry_time')
+                if expiry_time and now < expiry_time:
+                    return False
+                return self.remove_drop(drop)
+        return False
+
+    def to_record(self) -> dict:
+        """What survives a restart (locks and the preload queue are rebuilt on demand)"""
+        return {
+            'auto_drop': self.auto_drop,
+            'message_count': self.message_count,
+            'last_drop_time': self.last_drop_time,
+            'jackpot_count': self.jackpot_count,
+            'jackpot_interval': self.jackpot_interval,
+            'jackpot': self.jackpot,
+            'drops': [{k: v for k, v in drop.items() if k != 'name_keys'} for drop in self.drops],
+            'latest_drop_message': self.latest_drop_message,
+            'last_collected': self.last_collected,
+        }
+
+    @classmethod
+    def from_record(cls, chat_id: int, drop_time: int, record: dict) -> 'ChatDropState':
+        state = cls(chat_id, drop_time)
+        state.auto_drop = record.get('auto_drop', True)
+        state.message_count = record.get('message_count', 0)
+        state.last_drop_time = record.get('last_drop_time')
+        state.jackpot_count = record.get('jackpot_count', 0)
+        state.jackpot_interval = record.get('jackpot_interval') or state.jackpot_interval
+        state.jackpot = record.get('jackpot')
+        state.drops = list(record.get('drops') or ())
+        state.latest_drop_message = record.get('latest_drop_message')
+        state.last_collected = record.get('last_collected')
+        return state
+
+    def memory_bytes(self) -> int:
+        size = sys.getsizeof(self)
+        size += _deep_size(self.drops)
+        if self.jackpot is not None:
+            size += _deep_size(self.jackpot)
+        if self.preloaded is not None:
+            size += _deep_size(self.preloaded)
+        if self.lock is not None:
+            size += sys.getsizeof(self.lock)
+        if self.last_collected is not None:
+            size += _deep_size(self.last_collected)
+        return size
+
+
+class DropStateRegistry:
+    """Bounded registry of ChatDropState objects with their drop expiry timers.
+
+    States are kept in least-recently-used order. Touching a chat moves it to
+    the end, and the front is trimmed on every touch: chats idle for
+    `idle_ttl` seconds with no live drop are dropped, and past `max_chats`
+    the least recently used chat without a live drop goes. Custom droptimes
+    are kept separately, so evicting a chat doesn't reset its droptime.
+    Each drop's expiry is an entry in the shared ExpiryScheduler heap,
+    instead of a sleeping task or a scan per drop.
+
+    Every chat that changes is remembered in a dirty set; the persistence
+    layer (modules.drop_persistence) drains it with `take_dirty` and writes
+    `record` for each chat, and feeds the saved records back to `restore`.
+    """
+
+    def __init__(self, max_chats: int = 20000, idle_ttl: int = 6 * 3600, scheduler: ExpiryScheduler = None):
+        self.max_chats = max_chats
+        self.idle_ttl = idle_ttl
+        self.scheduler = scheduler or get_expiry_scheduler()
+        self._states: 'OrderedDict[int, ChatDropState]' = OrderedDict()
+        self._drop_times: Dict[int, int] = {}
+        self._dirty: set = set()
+        self.evictions = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._states)
+
+    def __iter__(self):
+        return iter(list(self._states.values()))
+
+    def get(self, chat_id: int) -> Optional[ChatDropState]:
+        """The chat's state if it is tracked (does not count as activity)"""
+        return self._states.get(chat_id)
+
+    def touch(self, chat_id: int) -> ChatDropState:
+        """The chat's state, created if needed, marked as just used"""
+        state = self._states.get(chat_id)
+        if state is None:
+            state = self._states[chat_id] = ChatDropState(chat_id, self._drop_times.get(chat_id, DEFAULT_DROPTIME))
+        else:
+            self._states.move_to_end(chat_id)
+        state.last_seen = time.monotonic()
+        self._dirty.add(chat_id)
+        self._trim()
+        return state
+
+    def _trim(self):
+        now = time.monotonic()
+        wall_now = datetime.now()
+        # Anything with a live drop is moved to the back; bounded so a full registry can't spin
+        for _ in range(min(len(self._states), 8)):
+            chat_id, state = next(iter(self._states.items()))
+            over_capacity = len(self._states) > self.max_chats
+            idle = now - state.last_seen > self.idle_ttl
+            if not over_capacity and not idle:
+                return
+            if state.live_drops(wall_now):
+                self._states.move_to_end(chat_id)
+                continue
+            del self._states[chat_id]
+            self.evictions += 1
+
+    def count_messages(self, chat_id: int, times: List[datetime]) -> Tuple[List[datetime], int]:
+        """Count a run of one chat's messages under a single touch.
+
+        Returns the times at which a drop fell due and how many jackpots did.
+        """
+        state = self.touch(chat_id)
+        drops = []
+        jackpots = 0
+        for now in times:
+            if state.count_jackpot():
+                jackpots += 1
+            if state.count_message(now):
+                drops.append(now)
+        return drops, jackpots
+
+    def drop_time(self, chat_id: int) -> int:
+        state = self._states.get(chat_id)
+        return state.drop_time if state is not None else self._drop_times.get(chat_id, DEFAULT_DROPTIME)
+
+    def set_drop_time(self, chat_id: int, drop_time: int):
+        state = self.touch(chat_id)
+        state.drop_time = drop_time
+        state.message_count = 0
+        if drop_time == DEFAULT_DROPTIME:
+            self._drop_times.pop(chat_id, None)
+        else:
+            self._drop_times[chat_id] = drop_time
+
+    def set_all_drop_times(self, drop_time: int) -> int:
+        """Set the droptime of every known chat; returns how many were changed"""
+        chat_ids = set(self._states) | set(self._drop_times)
+        self._dirty.update(chat_ids)
+        for chat_id in chat_ids:
+            state = self._states.get(chat_id)
+            if state is not None:
+                state.drop_time = drop_time
+                state.message_count = 0
+            if drop_time == DEFAULT_DROPTIME:
+                self._drop_times.pop(chat_id, None)
+            else:
+                self._drop_times[chat_id] = drop_time
+        return len(chat_ids)
+
+    # --- Drop expiry ---
+
+    def schedule_expiry(self, chat_id: int, message_id: int, expiry_time: datetime):
+        """Remove the drop at `expiry_time` (unless it is gone or re-armed by then)"""
+        self.scheduler.schedule_at(
+            expiry_time.timestamp(), self._expire, chat_id, message_id, key=('drop', chat_id, message_id)
+        )
+
+    def _expire(self, chat_id: int, message_id: int):
+        state = self._states.get(chat_id)
+        if state is not None and state.expire(message_id, datetime.now()):
+            self._dirty.add(chat_id)
+            self.expired += 1
+
+    # --- Persistence ---
+
+    def mark_dirty(self, chat_id: int):
+        """Note a change made through `get` (touch marks the chat by itself)"""
+        self._dirty.add(chat_id)
+
+    def take_dirty(self) -> set:
+        """Chats changed since the last call"""
+        dirty, self._dirty = self._dirty, set()
+        return dirty
+
+    def record(self, chat_id: int) -> Tuple[int, Optional[dict]]:
+        """(droptime, state record) for a chat; the record is None once the chat was evicted"""
+        state = self._states.get(chat_id)
+        if state is None:
+            return self._drop_times.get(chat_id, DEFAULT_DROPTIME), None
+        return state.drop_time, state.to_record()
+
+    def restore(self, records: Iterable[Tuple[int, int, Optional[dict], float]], now: datetime = None) -> int:
+        """Load saved (chat_id, droptime, record, saved_at) rows; returns how many chats were revived.
+
+        Custom droptimes are always kept. A chat's state only comes back if it
+        was seen within `idle_ttl`, newest first up to `max_chats`; expired
+        drops are discarded and live ones get their expiry timers back.
+        """
+        now = now or datetime.now()
+        wall_clock = time.time()
+        monotonic = time.monotonic()
+        recent = []
+        for chat_id, drop_time, record, saved_at in records:
+            if drop_time != DEFAULT_DROPTIME:
+                self._drop_times[chat_id] = drop_time
+            if record is not None and chat_id not in self._states and wall_clock - saved_at <= self.idle_ttl:
+                recent.append((saved_at, chat_id, drop_time, record))
+        recent.sort(key=lambda item: item[0])
+        revived = 0
+        for saved_at, chat_id, drop_time, record in recent[-self.max_chats:]:
+            state = ChatDropState.from_record(chat_id, drop_time, record)
+            state.drops = state.live_drops(now)
+            state.last_seen = monotonic - (wall_clock - saved_at)
+            self._states[chat_id] = state
+            for drop in state.drops:
+                if drop.get('drop_message_id') is not None:
+                    self.schedule_expiry(chat_id, drop['drop_message_id'], drop['expiry_time'])
+            revived += 1
+        return revived
+
+    # --- Accounting ---
+
+    def memory_report(self, limit: int = 5) -> List[dict]:
+        """Largest chats by estimated bytes held"""
+        sizes = [(state.memory_bytes(), state) for state in self._states.values()]
+        sizes.sort(key=lambda item: item[0], reverse=True)
+        return [
+            {'chat_id': state.chat_id, 'bytes': size, 'drops': len(state.drops), 'jackpot': state.jackpot is not None}
+            for size, state in sizes[:limit]
+        ]
+
+    def stats(self) -> dict:
+        total = sys.getsizeof(self._states) + sys.getsizeof(self._drop_times)
+        drops = 0
+        for state in self._states.values():
+            total += state.memory_bytes()
+            drops += len(state.drops)
+        return {
+            'chats': len(self._states),
+            'max_chats': self.max_chats,
+            'drops': drops,
+            'timers': self.scheduler.pending('drop'),
+            'custom_drop_times': len(self._drop_times),
+            'dirty': len(self._dirty),
+            'evictions': self.evictions,
+            'expired': self.expired,
+            'bytes': total,
+        }
+
+
+_drop_states = DropStateRegistry()
+
+
+def get_drop_states() -> DropStateRegistry:
+    """Get the process-wide per-chat drop state registry"""
+    return _drop_states
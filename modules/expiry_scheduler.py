@@ -0,0 +1,145 @@
+import asyncio
+import heapq
+import inspect
+import itertools
+import logging
+import time
+from typing import Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiryScheduler:
+    """One heap of deadlines for everything in the bot that expires.
+
+    Entries are (deadline, seq, key, callback, args) on a min-heap, so
+    scheduling is O(log n) and a single task sleeps exactly until the
+    earliest deadline instead of each feature polling its own dict. A key
+    (a tuple whose first item names the kind, e.g. ('ban', user_id)) can be
+    rescheduled or cancelled; superseded heap entries are skipped when they
+    come up. Callbacks may be plain functions or coroutine functions; the
+    latter run as their own tasks so a slow one can't hold up the rest.
+    Deadlines are Unix timestamps.
+    """
+
+    def __init__(self):
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._live: Dict[Hashable, int] = {}  # key -> seq of its current entry
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._background: set = set()
+        self.fired = 0
+        self.cancelled = 0
+        self.errors = 0
+
+    def __len__(self):
+        return len(self._live)
+
+    def schedule_at(self, deadline: float, callback: Callable, *args, key: Hashable = None):
+        """Call `callback(*args)` at Unix time `deadline`; a keyed entry replaces any earlier one"""
+        seq = next(self._seq)
+        if key is None:
+            key = ('_', seq)
+        elif key in self._live:
+            self.cancelled += 1
+        self._live[key] = seq
+        heapq.heappush(self._heap, (deadline, seq, key, callback, args))
+        if self._task is None or self._task.done():
+            self.start()
+        elif self._heap[0][1] == seq:
+            self._wakeup.set()  # new earliest deadline
+        return key
+
+    def schedule_in(self, delay: float, callback: Callable, *args, key: Hashable = None):
+        return self.schedule_at(time.time() + delay, callback, *args, key=key)
+
+    def cancel(self, key: Hashable) -> bool:
+        if self._live.pop(key, None) is None:
+            return False
+        self.cancelled += 1
+        return True
+
+    def pending(self, kind: str = None) -> int:
+        """Scheduled entries, optionally only those whose key starts with `kind`"""
+        if kind is None:
+            return len(self._live)
+        return sum(1 for key in self._live if key[0] == kind)
+
+    def start(self):
+        """Start the timer task (idempotent)"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def run_due(self, now: float = None) -> int:
+        """Fire every entry whose deadline has passed; returns how many fired"""
+        now = now if now is not None else time.time()
+        fired = 0
+        while self._heap and self._heap[0][0] <= now:
+            _, seq, key, callback, args = heapq.heappop(self._heap)
+            if self._live.get(key) != seq:
+                continue  # cancelled or rescheduled
+            del self._live[key]
+            fired += 1
+            try:
+                result = callback(*args)
+                if inspect.isawaitable(result):
+                    task = asyncio.ensure_future(result)
+                    self._background.add(task)
+                    task.add_done_callback(self._finished)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error running expiry {key}: {e}")
+        self.fired += fired
+        return fired
+
+    def _finished(self, task: asyncio.Task):
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+            logger.error(f"Error running expiry task: {task.exception()}")
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            timeout = max(self._heap[0][0] - time.time(), 0) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self.run_due()
+            # Cancelled entries stay in the heap until due; rebuild if they dominate it
+            if len(self._heap) > 1024 and len(self._heap) > 4 * len(self._live):
+                self._heap = [entry for entry in self._heap if self._live.get(entry[2]) == entry[1]]
+                heapq.heapify(self._heap)
+
+    def stats(self) -> dict:
+        kinds: Dict[str, int] = {}
+        for key in self._live:
+            kinds[key[0]] = kinds.get(key[0], 0) + 1
+        return {
+            'pending': len(self._live),
+            'heap': len(self._heap),
+            'by_kind': kinds,
+            'fired': self.fired,
+            'cancelled': self.cancelled,
+            'errors': self.errors,
+        }
+
+
+_expiry_scheduler = ExpiryScheduler()
+
+
+def get_expiry_scheduler() -> ExpiryScheduler:
+    """Get the process-wide expiry scheduler"""
+    return _expiry_scheduler
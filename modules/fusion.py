@@ -130,11 +130,8 @@ async def fuse_command(client: Client, message: Message):
             result_type = "elite" if random.random() < FUSION_CONFIG["elite_chance"] else "tokens"
             
             # Remove characters from user's collection
-            chars = list(user.get('characters', []))
-            chars.remove(char_id1)
-            chars.remove(char_id2)
-            # Immediately update the user's collection in the database
-            await db.update_user(user_id, {'characters': chars})
+            await db.remove_single_character_from_user(user_id, char_id1)
+            await db.remove_single_character_from_user(user_id, char_id2)
             now = datetime.utcnow()
             
             if result_type == "elite":
@@ -145,8 +142,7 @@ async def fuse_command(client: Client, message: Message):
                     result_type = "tokens"
                     logging.warning(f"No Elite characters available for fusion, falling back to tokens for user {user_id}")
                 else:
-                    chars.append(elite['character_id'])
-                    await db.update_user(user_id, {'characters': chars})
+                    await db.add_character_to_user(user_id, elite['character_id'], source='fusion')
                     
                     # Log transaction
                     await db.log_user_transaction(user_id, "fusion_elite", {
@@ -184,7 +180,7 @@ async def fuse_command(client: Client, message: Message):
                 tokens = int((price1 + price2) * multiplier)
                 
                 wallet = user.get('wallet', 0) + tokens
-                await db.update_user(user_id, {'characters': chars, 'wallet': wallet})
+                await db.update_user(user_id, {'wallet': wallet})
                 
                 # Log transaction
                 await db.log_user_transaction(user_id, "fusion_tokens", {
@@ -169,20 +169,15 @@ async def massgive_command(client: Client, message: Message):
     requested_counts = {cid: char_ids_int.count(cid) for cid in set(char_ids_int)}
     # Remove the check for insufficient copies
     # If we reach here, all requests are valid
-    characters = []
+    found = await db.get_characters(char_ids_int)
     for cid in char_ids_int:
-        char = await db.get_character(cid)
-        if not char:
+        if cid not in found:
             await message.reply_text(f"❌ <b>Character not found: {cid}</b>")
             return
-        characters.append(char)
     # Build summary for confirmation message
     rarity_counter = Counter()
     for cid in char_ids_int:
-        char = await db.get_character(cid)
-        if not char:
-            continue
-        rarity = char.get('rarity', '?')
+        rarity = found[cid].get('rarity', '?')
         rarity_counter[rarity] += 1
     summary_lines = []
     for rarity, count in rarity_counter.items():
@@ -236,7 +231,8 @@ async def give_take_massgive_callback(client: Client, callback_query: CallbackQu
         
         # Get character(s)
         if pending['type'] == 'massgive':
-            characters = [await db.get_character(cid) for cid in pending['char_ids']]
+            found = await db.get_characters(pending['char_ids'])
+            characters = [found.get(cid) for cid in pending['char_ids']]
         else:
             character = await db.get_character(pending['char_id'])
         # Handle confirm/cancel
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import time
+from typing import Dict, FrozenSet, Optional
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class MembershipSnapshots:
+    """Cached Telegram member lists per chat.
+
+    Walking get_chat_members is slow for big groups, so each chat's member IDs
+    are fetched at most once per `refresh_after` seconds. A stale snapshot is
+    still served while a single background task refreshes it; snapshots unused
+    for `max_age` seconds are evicted.
+    """
+
+    def __init__(self, refresh_after: int = 900, max_age: int = 6 * 3600, max_chats: int = 2000):
+        self.refresh_after = refresh_after
+        self._snapshots = TTLCache(maxsize=max_chats, ttl=max_age)  # chat_id -> (fetched_at, frozenset)
+        self._refreshing: Dict[int, asyncio.Task] = {}
+
+    async def get(self, client, chat_id: int) -> Optional[FrozenSet[int]]:
+        """Member IDs of a chat, or None if Telegram would not list them"""
+        entry = self._snapshots.get(chat_id)
+        if entry is None:
+            return await self._schedule_refresh(client, chat_id)
+        if time.time() - entry[0] > self.refresh_after:
+            self._schedule_refresh(client, chat_id)
+        return entry[1]
+
+    def add_member(self, chat_id: int, user_id: int):
+        """Fold a join (or any sign of membership) into an existing snapshot"""
+        entry = self._snapshots.get(chat_id)
+        if entry is not None and user_id not in entry[1]:
+            self._snapshots[chat_id] = (entry[0], entry[1] | {user_id})
+
+    def remove_member(self, chat_id: int, user_id: int):
+        entry = self._snapshots.get(chat_id)
+        if entry is not None and user_id in entry[1]:
+            self._snapshots[chat_id] = (entry[0], entry[1] - {user_id})
+
+    def invalidate(self, chat_id: int):
+        self._snapshots.pop(chat_id, None)
+
+    def _schedule_refresh(self, client, chat_id: int) -> asyncio.Task:
+        # One member walk per chat at a time; concurrent callers share the task
+        task = self._refreshing.get(chat_id)
+        if task is None or task.done():
+            task = asyncio.create_task(self._refresh(client, chat_id))
+            self._refreshing[chat_id] = task
+        return task
+
+    async def _refresh(self, client, chat_id: int) -> Optional[FrozenSet[int]]:
+        try:
+            members = set()
+            async for member in client.get_chat_members(chat_id):
+                if member.user and not member.user.is_bot:
+                    members.add(member.user.id)
+        except Exception as e:
+            logger.warning(f"Could not list members of chat {chat_id}: {e}")
+            return None
+        finally:
+            self._refreshing.pop(chat_id, None)
+        snapshot = frozenset(members)
+        self._snapshots[chat_id] = (time.time(), snapshot)
+        return snapshot
+
+
+_membership_snapshots = MembershipSnapshots()
+
+
+def get_membership_snapshots() -> MembershipSnapshots:
+    """Get the process-wide membership snapshot cache"""
+    return _membership_snapshots
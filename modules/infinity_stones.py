@@ -784,20 +784,13 @@ async def is_stone_drop_valid(chat_id: int, stone_type: str) -> bool:
         return False
     
     if stone_type not in recent_infinity_stone_drops[chat_id]:
-        # Fallback: check active_drops from drop module to avoid rare desync
+        # Fallback: check the drop module's live drops to avoid rare desync
         try:
-            from modules.drop import active_drops, drop_expiry_times
-            if chat_id in active_drops and active_drops[chat_id]:
-                # Check latest relevant drop
-                for drop in reversed(active_drops[chat_id]):
-                    if drop.get('is_infinity_stone') and drop.get('stone_type') == stone_type:
-                        msg_id = drop.get('drop_message_id')
-                        expiry_time = drop_expiry_times.get(msg_id)
-                        if expiry_time:
-                            from datetime import datetime as _dt
-                            if _dt.now() < expiry_time:
-                                return True
-                        break
+            from modules.drop import get_live_drops
+            # Check latest relevant drop
+            for drop in reversed(get_live_drops(chat_id)):
+                if drop.get('is_infinity_stone') and drop.get('stone_type') == stone_type:
+                    return True
         except Exception:
             pass
         return False
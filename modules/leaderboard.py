@@ -0,0 +1,81 @@
+import asyncio
+import time
+from array import array
+from bisect import bisect_right
+from typing import Dict, List, Optional
+
+from modules.postgres_database import LEADERBOARD_BOARDS
+
+
+class LeaderboardService:
+    """Top-K boards and O(log n) rank lookups for the global leaderboards.
+
+    Scores live in indexed columns (users.wallet/bank/shards) and in the
+    user_collection_stats table, which a trigger on user_characters keeps up
+    to date on every write. This service only caches what it reads:
+    - the top rows of each board, refreshed every `top_ttl` seconds with an
+      index-ordered LIMIT query;
+    - a sorted array of every positive score, refreshed every `rank_ttl`
+      seconds, so "my rank" is a bisect instead of a table scan.
+    """
+
+    def __init__(self, top_ttl: int = 30, rank_ttl: int = 300, top_size: int = 25):
+        self.top_ttl = top_ttl
+        self.rank_ttl = rank_ttl
+        self.top_size = top_size
+        self._top: Dict[str, tuple] = {}  # board -> (loaded_at, rows)
+        self._scores: Dict[str, tuple] = {}  # board -> (loaded_at, array('q') ascending)
+        self._locks: Dict[str, asyncio.Lock] = {board: asyncio.Lock() for board in LEADERBOARD_BOARDS}
+
+    async def top(self, db, board: str, limit: int = 10) -> List[dict]:
+        """Top `limit` rows of a board (limit is capped at `top_size`)"""
+        entry = self._top.get(board)
+        if entry is None or time.time() - entry[0] > self.top_ttl:
+            async with self._locks[board]:
+                entry = self._top.get(board)
+                if entry is None or time.time() - entry[0] > self.top_ttl:
+                    rows = await db.get_board_top(board, self.top_size)
+                    entry = (time.time(), rows)
+                    self._top[board] = entry
+        return entry[1][:limit]
+
+    async def rank(self, db, board: str, score: Optional[int]) -> int:
+        """1-based rank a score holds on a board (ties share the better rank)"""
+        scores = await self._get_scores(db, board)
+        return len(scores) - bisect_right(scores, score or 0) + 1
+
+    async def user_rank(self, db, board: str, user_id: int) -> tuple:
+        """(score, rank) of one user on a board"""
+        score = await db.get_board_score(board, user_id)
+        return score, await self.rank(db, board, score)
+
+    async def size(self, db, board: str) -> int:
+        """Number of users with a positive score on a board"""
+        return len(await self._get_scores(db, board))
+
+    def invalidate(self, board: Optional[str] = None):
+        """Drop cached rows and scores so the next read goes to the database"""
+        if board is None:
+            self._top.clear()
+            self._scores.clear()
+        else:
+            self._top.pop(board, None)
+            self._scores.pop(board, None)
+
+    async def _get_scores(self, db, board: str) -> array:
+        entry = self._scores.get(board)
+        if entry is None or time.time() - entry[0] > self.rank_ttl:
+            async with self._locks[board]:
+                entry = self._scores.get(board)
+                if entry is None or time.time() - entry[0] > self.rank_ttl:
+                    entry = (time.time(), array('q', await db.get_board_scores(board)))
+                    self._scores[board] = entry
+        return entry[1]
+
+
+_leaderboard_service = LeaderboardService()
+
+
+def get_leaderboard_service() -> LeaderboardService:
+    """Get the process-wide leaderboard service"""
+    return _leaderboard_service
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules import ban_manager, drop
+from modules.drop_state import DropStateRegistry
+from modules.message_pipeline import MessagePipeline
+
+MESSAGES = int(os.environ.get('LOAD_TEST_MESSAGES', 200_000))
+CHATS = 5_000
+USERS = 50_000
+# Stand-in for the permanent-ban lookup check_user_ban_status awaits
+BAN_CHECK_SECONDS = float(os.environ.get('LOAD_TEST_BAN_CHECK_SECONDS', 0.0005))
+BURST = 500  # messages submitted between yields to the event loop
+
+
+def uniform_stream(count):
+    return [(random.randrange(CHATS), random.randrange(USERS)) for _ in range(count)]
+
+
+def skewed_stream(count):
+    """Most traffic in a few busy chats, as in practice"""
+    weights = [1 / (rank + 1) for rank in range(CHATS)]
+    chats = random.choices(range(CHATS), weights=weights, k=count)
+    return [(chat_id, random.randrange(USERS)) for chat_id in chats]
+
+
+def flood_stream(count):
+    """One chat being spammed by a handful of users"""
+    return [(42, random.randrange(20)) for _ in range(count)]
+
+
+def _message(chat_id, user_id):
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id, type='supergroup'), from_user=SimpleNamespace(id=user_id))
+
+
+class StubDatabase:
+    async def is_banned(self, user_id):
+        if BAN_CHECK_SECONDS:
+            await asyncio.sleep(BAN_CHECK_SECONDS)
+        return False
+
+
+class Stubs:
+    """Swaps the database, Telegram sends and spam tracking in drop for counters.
+
+    Everything else (handle_message, ingest_messages, the ban checks and the
+    drop state registry) is the production code.
+    """
+
+    def __init__(self):
+        self.drops = 0
+        self.jackpots = 0
+
+    async def process_drop(self, chat_id, client, current_time):
+        self.drops += 1
+
+    async def drop_jackpot(self, client, chat_id):
+        self.jackpots += 1
+
+    @staticmethod
+    async def handle_spam_and_bans_pyrogram(message, client, user_id, current_time):
+        pass
+
+    def install(self, pipeline):
+        database = StubDatabase()
+        drop.get_database = lambda: database
+        drop.process_drop = self.process_drop
+        drop.drop_jackpot = self.drop_jackpot
+        drop.handle_spam_and_bans_pyrogram = self.handle_spam_and_bans_pyrogram
+        drop.drop_states = DropStateRegistry()
+        drop.message_pipeline = pipeline
+        ban_manager.ban_manager.temporary_bans.clear()
+
+
+async def run_pipeline(stream, workers):
+    stubs = Stubs()
+    pipeline = MessagePipeline(drop.ingest_messages, workers=workers)
+    stubs.install(pipeline)
+    start = time.perf_counter()
+    for i, (chat_id, user_id) in enumerate(stream):
+        await drop.handle_message(None, _message(chat_id, user_id))
+        if i % BURST == 0:
+            await asyncio.sleep(0)
+    await pipeline.stop()
+    elapsed = time.perf_counter() - start
+    return len(stream) / elapsed, pipeline.stats(), stubs
+
+
+async def run_inline(stream):
+    # The old path: every message awaits its own checks before the next one
+    stubs = Stubs()
+    stubs.install(MessagePipeline(drop.ingest_messages))
+    now = drop.datetime.now()
+    start = time.perf_counter()
+    for chat_id, user_id in stream:
+        await drop.ingest_messages([(None, _message(chat_id, user_id), now)])
+    return len(stream) / (time.perf_counter() - start)
+
+
+async def main():
+    streams = {'uniform': uniform_stream, 'skewed': skewed_stream, 'flood': flood_stream}
+    print(f"=== {MESSAGES:,} messages, ban check {BAN_CHECK_SECONDS * 1000:.2f} ms (messages/second) ===")
+    for name, make_stream in streams.items():
+        stream = make_stream(MESSAGES)
+        inline = await run_inline(stream[:MESSAGES // 100])
+        print(f"{name:>8}: inline {inline:>10,.0f}")
+        for workers in (1, 4, 8, 16):
+            rate, stats, stubs = await run_pipeline(stream, workers)
+            print(f"{'':>8}  {workers:>2} workers {rate:>10,.0f}  avg batch {stats['avg_batch']:>6}  "
+                  f"shed {stats['shed']:>7,}  drops {stubs.drops:,}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List
+
+logger = logging.getLogger(__name__)
+
+
+class MessagePipeline:
+    """Group-message ingestion spread over `workers` consumer tasks.
+
+    Each message goes to the shard `chat_id % workers`, and a shard is
+    drained by exactly one task, so messages of a chat are handled in order
+    while different chats proceed in parallel. A worker takes whatever has
+    piled up in its queue (up to `batch_size`) and hands it to `handler` in
+    one call, so counters can be updated once per chat per batch. `submit`
+    never waits: when a shard's queue is full it returns False and the
+    caller sheds the message (counted in `shed`). Slow follow-up work such
+    as sending a drop goes through `spawn`, off the workers' path.
+    """
+
+    def __init__(self, handler: Callable[[List[tuple]], Awaitable[None]], workers: int = 8,
+                 queue_size: int = 1000, batch_size: int = 64):
+        self.handler = handler
+        self.workers = workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self._background: set = set()
+        self.received = 0
+        self.processed = 0
+        self.shed = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks) and not all(task.done() for task in self._tasks)
+
+    def start(self):
+        """Start the workers (idempotent; needs a running event loop)"""
+        if self.running:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._work(queue)) for queue in self._queues]
+
+    async def stop(self, drain: bool = True):
+        """Stop the workers, first letting them finish what is queued when `drain` is set"""
+        if drain:
+            for queue in self._queues:
+                await queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, chat_id: int, item: tuple) -> bool:
+        """Queue `item` on the chat's shard; False if it had to be shed"""
+        self.start()
+        self.received += 1
+        try:
+            self._queues[chat_id % self.workers].put_nowait(item)
+        except asyncio.QueueFull:
+            self.shed += 1
+            return False
+        return True
+
+    def spawn(self, coro: Awaitable) -> asyncio.Task:
+        """Run follow-up work in the background, keeping a reference until it ends"""
+        task = asyncio.ensure_future(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            started = time.perf_counter()
+            try:
+                await self.handler(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error handling a batch of {len(batch)} messages: {e}")
+            finally:
+                self.busy_seconds += time.perf_counter() - started
+                self.processed += len(batch)
+                self.batches += 1
+                self.largest_batch = max(self.largest_batch, len(batch))
+                for _ in batch:
+                    queue.task_done()
+
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    def stats(self) -> dict:
+        return {
+            'workers': self.workers,
+            'running': self.running,
+            'queued': self.depth(),
+            'received': self.received,
+            'processed': self.processed,
+            'shed': self.shed,
+            'shed_rate': round(self.shed / self.received, 4) if self.received else 0.0,
+            'batches': self.batches,
+            'avg_batch': round(self.processed / self.batches, 2) if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+            'errors': self.errors,
+            'background_tasks': len(self._background),
+            'busy_seconds': round(self.busy_seconds, 3),
+        }
@@ -1,9 +1,12 @@
+import asyncio
 import base64
-from datetime import datetime
+from datetime import datetime, timedelta
 import gc
 import json
 import logging
 import random
+import re
+import sys
 import time
 from typing import Any, Dict, List, Optional
 
@@ -12,6 +15,16 @@ import asyncpg
 from cachetools import TTLCache
 import pytz
 
+from modules.character_catalog import CharacterCatalog, get_character_catalog, normalize_name
+from modules.character_search import CharacterSearchIndex, get_character_search
+from modules.ban_registry import get_ban_registry
+from modules.character_index import get_character_id_index
+from modules.collection_view import get_collection_views
+from modules.drop_sampler import get_drop_sampler
+from modules.transaction_log import get_transaction_log
+from modules.user_cache import get_user_cache
+from modules.user_fetch_report import get_user_fetch_report
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -19,12 +32,27 @@ logger = logging.getLogger(__name__)
 _pg_pool = None
 _postgres_uri = None
 
+# Set once every users.characters array has been moved into user_characters
+_user_characters_backfilled = False
+
 # Caches
-_character_cache = TTLCache(maxsize=500, ttl=1800)  # 30 minutes
 _drop_settings_cache = TTLCache(maxsize=5, ttl=900)  # 15 minutes
 _user_stats_cache = TTLCache(maxsize=100, ttl=600)  # 10 minutes
 _leaderboard_cache = TTLCache(maxsize=3, ttl=180)  # 3 minutes
 _chat_settings_cache = TTLCache(maxsize=25, ttl=900)  # 15 minutes
+_group_member_seen_cache = TTLCache(maxsize=20000, ttl=600)  # 10 minutes
+
+# Characters never offered in the store
+STORE_EXCLUDED_CHARACTER_IDS = frozenset({531, 664, 678, 849, 853, 877, 957, 1109, 1248, 1305})
+
+
+def _is_store_eligible(character: dict) -> bool:
+    """Not Supreme, not a video and not explicitly excluded"""
+    return (
+        character.get('rarity') != 'Supreme'
+        and character.get('is_video') in (None, False, 'false')
+        and character['character_id'] not in STORE_EXCLUDED_CHARACTER_IDS
+    )
 
 # Performance tracking
 _performance_stats = {
@@ -71,6 +99,142 @@ RARITY_EMOJIS = {
     "Premium": "🧿"
 }
 
+# Leaderboards: board name -> (table, indexed score column)
+LEADERBOARD_BOARDS = {
+    'total': ('user_collection_stats', 'total_count'),
+    'unique': ('user_collection_stats', 'unique_count'),
+    'wallet': ('users', 'wallet'),
+    'bank': ('users', 'bank'),
+    'shards': ('users', 'shards'),
+}
+
+# Ledger: balance columns that credit/debit/transfer may touch, and the
+# timestamp column each periodic reward is gated on
+LEDGER_COLUMNS = ('wallet', 'bank', 'shards')
+PERIODIC_REWARD_COLUMNS = ('last_daily', 'last_weekly', 'last_monthly')
+
+
+def _ledger_column(column: str, allowed=LEDGER_COLUMNS) -> str:
+    # Column names are interpolated into SQL, so only known ones get through
+    if column not in allowed:
+        raise ValueError(f"Unknown ledger column: {column}")
+    return column
+
+# JSONB columns of users and the value used when one can't be decoded
+USER_JSONB_DEFAULTS = {
+    'active_action': None,
+    'collection_history': [],
+    'store_offer': {},
+    'supreme_store_offer': {},
+}
+
+# Column names of users, loaded on the first projected fetch
+_users_columns = None
+
+
+class UserRecord(dict):
+    """A users row whose JSONB columns are only decoded when read"""
+    __slots__ = ('_pending',)
+
+    def __init__(self, row):
+        super().__init__(row)
+        self._pending = {key for key in USER_JSONB_DEFAULTS if isinstance(dict.get(self, key), str)}
+
+    def _decode(self, key):
+        if key not in self._pending:
+            return
+        self._pending.discard(key)
+        raw = dict.get(self, key)
+        if not isinstance(raw, str):
+            return
+        try:
+            value = json.loads(raw)
+        except (json.JSONDecodeError, TypeError):
+            value = USER_JSONB_DEFAULTS[key]
+            value = value.copy() if value is not None else None
+        dict.__setitem__(self, key, value)
+
+    def _decode_all(self):
+        for key in list(self._pending):
+            self._decode(key)
+
+    def __getitem__(self, key):
+        self._decode(key)
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        self._pending.discard(key)
+        super().__setitem__(key, value)
+
+    def __iter__(self):
+        # Defined so dict(record) and {**record} go through __getitem__
+        return super().__iter__()
+
+    def get(self, key, default=None):
+        self._decode(key)
+        return super().get(key, default)
+
+    def pop(self, key, *default):
+        self._decode(key)
+        self._pending.discard(key)
+        return super().pop(key, *default)
+
+    def setdefault(self, key, default=None):
+        self._decode(key)
+        return super().setdefault(key, default)
+
+    def items(self):
+        self._decode_all()
+        return super().items()
+
+    def values(self):
+        self._decode_all()
+        return super().values()
+
+    def copy(self):
+        self._decode_all()
+        return dict(super().items())
+
+    def clone(self, fields=None):
+        """Independent copy (optionally only user_id + `fields`) that keeps lazy decoding"""
+        keys = dict.keys(self) if fields is None else dict.fromkeys(('user_id',) + tuple(fields))
+        record = UserRecord.__new__(UserRecord)
+        dict.update(record, (
+            (key, _copy_container(dict.__getitem__(self, key))) for key in keys if dict.__contains__(self, key)
+        ))
+        record._pending = self._pending & set(dict.keys(record))
+        return record
+
+    def project(self, fields):
+        return self.clone(fields)
+
+
+def _copy_container(value):
+    # One level is enough: callers append to lists or set keys, they don't edit nested values
+    if isinstance(value, list):
+        return list(value)
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+
+def _projection_fields(projection: Optional[dict]):
+    """Fields named by a MongoDB-style inclusion projection, or None for the whole row"""
+    if not projection:
+        return None
+    fields = [key for key, include in projection.items() if include and key != '_id']
+    return fields or None
+
+
+def _fetch_site() -> str:
+    # First frame outside the database and cache modules, for the user fetch report
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals.get('__name__') in (__name__, 'modules.user_cache'):
+        frame = frame.f_back
+    if frame is None:
+        return __name__
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+
 def get_rarity_display(rarity: str) -> str:
     """Get the display format for a rarity (emoji + name)"""
     emoji = RARITY_EMOJIS.get(rarity, "❓")
@@ -99,15 +263,24 @@ OLD_TO_NEW_RARITIES = {
 
 def get_performance_stats():
     """Get performance statistics"""
-    return _performance_stats.copy()
+    stats = _performance_stats.copy()
+    stats['transaction_log'] = get_transaction_log().stats()
+    stats['user_cache'] = get_user_cache().stats()
+    stats['character_catalog'] = get_character_catalog().stats()
+    stats['character_search'] = get_character_search().stats()
+    stats['ban_registry'] = get_ban_registry().stats()
+    stats['collection_views'] = get_collection_views().stats()
+    return stats
 
 def clear_all_caches():
     """Clear all caches"""
-    _character_cache.clear()
+    get_character_catalog().invalidate()
     _drop_settings_cache.clear()
     _user_stats_cache.clear()
     _leaderboard_cache.clear()
     _chat_settings_cache.clear()
+    get_user_cache().invalidate()
+    get_collection_views().invalidate()
 
 def get_postgres_pool():
     """Get the PostgreSQL connection pool"""
@@ -144,6 +317,26 @@ async def init_database(postgres_uri: str):
             pass  # Connection pool initialized
             # Run migrations for missing columns
             await run_column_migrations()
+            # Batched, write-behind user_transactions logging
+            get_transaction_log().start(_pg_pool)
+            # The whole character catalog fits in memory; load it before serving
+            # and keep it in sync through the characters_changed notifications
+            try:
+                await get_character_catalog().warm(_pg_pool)
+            except Exception as e:
+                logger.error(f"Error warming character catalog: {e}")
+            get_character_catalog().start_listening(postgres_uri, _pg_pool)
+            # Banned user IDs are checked on every message; keep them in memory too
+            try:
+                await get_ban_registry().load(_pg_pool)
+            except Exception as e:
+                logger.error(f"Error loading ban registry: {e}")
+            get_ban_registry().start_listening(postgres_uri, _pg_pool)
+            # Move legacy characters arrays into user_characters in the background
+            asyncio.create_task(backfill_user_characters())
+            # Keep daily collection_events partitions ahead of time and stream in legacy history
+            asyncio.create_task(maintain_collection_event_partitions())
+            asyncio.create_task(migrate_collection_history())
             
             # Ensure redeem_codes table is properly set up
             try:
@@ -312,23 +505,498 @@ async def run_column_migrations():
                 END IF;
             END$$;
         ''')
+        # Normalized ownership table (one row per user/character pair)
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS user_characters (
+                user_id BIGINT NOT NULL,
+                character_id INTEGER NOT NULL,
+                count INTEGER NOT NULL DEFAULT 1
+            );
+            ALTER TABLE user_characters
+            ADD COLUMN IF NOT EXISTS count INTEGER NOT NULL DEFAULT 1;
+            ALTER TABLE user_characters
+            ADD COLUMN IF NOT EXISTS acquired_seq BIGSERIAL;
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_user_characters_user_char
+            ON user_characters (user_id, character_id);
+            CREATE INDEX IF NOT EXISTS idx_user_characters_character
+            ON user_characters (character_id, count DESC);
+            ALTER TABLE users ALTER COLUMN characters DROP DEFAULT;
+        ''')
+        # Per-user collection totals, kept in step with user_characters by a trigger
+        stats_existed = await conn.fetchval("SELECT to_regclass('user_collection_stats') IS NOT NULL")
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS user_collection_stats (
+                user_id BIGINT PRIMARY KEY,
+                total_count BIGINT NOT NULL DEFAULT 0,
+                unique_count INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_user_collection_stats_total
+            ON user_collection_stats (total_count DESC);
+            CREATE INDEX IF NOT EXISTS idx_user_collection_stats_unique
+            ON user_collection_stats (unique_count DESC);
+
+            CREATE OR REPLACE FUNCTION user_characters_stats_trigger() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    UPDATE user_collection_stats
+                    SET total_count = total_count - OLD.count,
+                        unique_count = unique_count - 1
+                    WHERE user_id = OLD.user_id;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO user_collection_stats (user_id, total_count, unique_count)
+                    VALUES (NEW.user_id, NEW.count, 1)
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET total_count = user_collection_stats.total_count + EXCLUDED.total_count,
+                        unique_count = user_collection_stats.unique_count + 1;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS trg_user_characters_stats ON user_characters;
+            CREATE TRIGGER trg_user_characters_stats
+            AFTER INSERT OR UPDATE OR DELETE ON user_characters
+            FOR EACH ROW EXECUTE FUNCTION user_characters_stats_trigger();
+
+            -- Tell every bot process which character changed so in-memory catalogs stay fresh
+            CREATE OR REPLACE FUNCTION notify_characters_changed() RETURNS trigger AS $$
+            BEGIN
+                IF TG_LEVEL = 'STATEMENT' THEN
+                    PERFORM pg_notify('characters_changed', '*');
+                ELSIF TG_OP = 'DELETE' THEN
+                    PERFORM pg_notify('characters_changed', OLD.character_id::text);
+                ELSE
+                    PERFORM pg_notify('characters_changed', NEW.character_id::text);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS trg_characters_notify ON characters;
+            CREATE TRIGGER trg_characters_notify
+            AFTER INSERT OR UPDATE OR DELETE ON characters
+            FOR EACH ROW EXECUTE FUNCTION notify_characters_changed();
+
+            DROP TRIGGER IF EXISTS trg_characters_truncate_notify ON characters;
+            CREATE TRIGGER trg_characters_truncate_notify
+            AFTER TRUNCATE ON characters
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_characters_changed();
+
+            -- Same for bans, so every process's ban registry follows is_banned
+            CREATE OR REPLACE FUNCTION notify_bans_changed() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    PERFORM pg_notify('bans_changed', OLD.user_id::text || ':f');
+                ELSE
+                    PERFORM pg_notify('bans_changed', NEW.user_id::text || CASE WHEN NEW.is_banned THEN ':t' ELSE ':f' END);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS trg_users_bans_notify ON users;
+            CREATE TRIGGER trg_users_bans_notify
+            AFTER UPDATE OF is_banned ON users
+            FOR EACH ROW WHEN (OLD.is_banned IS DISTINCT FROM NEW.is_banned)
+            EXECUTE FUNCTION notify_bans_changed();
+
+            DROP TRIGGER IF EXISTS trg_users_bans_delete_notify ON users;
+            CREATE TRIGGER trg_users_bans_delete_notify
+            AFTER DELETE ON users
+            FOR EACH ROW WHEN (OLD.is_banned)
+            EXECUTE FUNCTION notify_bans_changed();
+
+            CREATE INDEX IF NOT EXISTS idx_users_wallet ON users (wallet DESC NULLS LAST);
+            CREATE INDEX IF NOT EXISTS idx_users_bank ON users (bank DESC NULLS LAST);
+            CREATE INDEX IF NOT EXISTS idx_users_shards ON users (shards DESC NULLS LAST);
+        ''')
+        if not stats_existed:
+            await conn.execute('''
+                INSERT INTO user_collection_stats (user_id, total_count, unique_count)
+                SELECT user_id, SUM(count), COUNT(*) FROM user_characters GROUP BY user_id
+                ON CONFLICT (user_id) DO UPDATE
+                SET total_count = EXCLUDED.total_count, unique_count = EXCLUDED.unique_count
+            ''')
+        # Per-user, per-rarity totals for collection headers; follows user_characters and rarity edits
+        rarity_stats_existed = await conn.fetchval("SELECT to_regclass('user_rarity_stats') IS NOT NULL")
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS user_rarity_stats (
+                user_id BIGINT NOT NULL,
+                rarity TEXT NOT NULL,
+                total_count BIGINT NOT NULL DEFAULT 0,
+                unique_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, rarity)
+            );
+
+            CREATE OR REPLACE FUNCTION user_characters_rarity_trigger() RETURNS trigger AS $$
+            DECLARE
+                r TEXT;
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    SELECT rarity INTO r FROM characters WHERE character_id = OLD.character_id;
+                    IF r IS NOT NULL THEN
+                        UPDATE user_rarity_stats
+                        SET total_count = total_count - OLD.count,
+                            unique_count = unique_count - 1
+                        WHERE user_id = OLD.user_id AND rarity = r;
+                    END IF;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    SELECT rarity INTO r FROM characters WHERE character_id = NEW.character_id;
+                    IF r IS NOT NULL THEN
+                        INSERT INTO user_rarity_stats (user_id, rarity, total_count, unique_count)
+                        VALUES (NEW.user_id, r, NEW.count, 1)
+                        ON CONFLICT (user_id, rarity) DO UPDATE
+                        SET total_count = user_rarity_stats.total_count + EXCLUDED.total_count,
+                            unique_count = user_rarity_stats.unique_count + 1;
+                    END IF;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS trg_user_characters_rarity_stats ON user_characters;
+            CREATE TRIGGER trg_user_characters_rarity_stats
+            AFTER INSERT OR UPDATE OR DELETE ON user_characters
+            FOR EACH ROW EXECUTE FUNCTION user_characters_rarity_trigger();
+
+            -- A re-rarity (or delete) of a character moves every owner's counts with it
+            CREATE OR REPLACE FUNCTION characters_rarity_stats_trigger() RETURNS trigger AS $$
+            BEGIN
+                UPDATE user_rarity_stats s
+                SET total_count = s.total_count - uc.count,
+                    unique_count = s.unique_count - 1
+                FROM user_characters uc
+                WHERE uc.character_id = OLD.character_id
+                  AND s.user_id = uc.user_id AND s.rarity = OLD.rarity;
+                IF TG_OP = 'UPDATE' THEN
+                    INSERT INTO user_rarity_stats (user_id, rarity, total_count, unique_count)
+                    SELECT uc.user_id, NEW.rarity, uc.count, 1
+                    FROM user_characters uc
+                    WHERE uc.character_id = NEW.character_id
+                    ON CONFLICT (user_id, rarity) DO UPDATE
+                    SET total_count = user_rarity_stats.total_count + EXCLUDED.total_count,
+                        unique_count = user_rarity_stats.unique_count + 1;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS trg_characters_rarity_stats ON characters;
+            CREATE TRIGGER trg_characters_rarity_stats
+            AFTER UPDATE OF rarity ON characters
+            FOR EACH ROW WHEN (OLD.rarity IS DISTINCT FROM NEW.rarity)
+            EXECUTE FUNCTION characters_rarity_stats_trigger();
+
+            DROP TRIGGER IF EXISTS trg_characters_delete_rarity_stats ON characters;
+            CREATE TRIGGER trg_characters_delete_rarity_stats
+            AFTER DELETE ON characters
+            FOR EACH ROW EXECUTE FUNCTION characters_rarity_stats_trigger();
+        ''')
+        if not rarity_stats_existed:
+            await conn.execute('''
+                INSERT INTO user_rarity_stats (user_id, rarity, total_count, unique_count)
+                SELECT uc.user_id, c.rarity, SUM(uc.count), COUNT(*)
+                FROM user_characters uc
+                JOIN characters c ON c.character_id = uc.character_id
+                GROUP BY uc.user_id, c.rarity
+                ON CONFLICT (user_id, rarity) DO UPDATE
+                SET total_count = EXCLUDED.total_count, unique_count = EXCLUDED.unique_count
+            ''')
+        # Group membership index (replaces scanning users.groups arrays)
+        members_existed = await conn.fetchval("SELECT to_regclass('group_members') IS NOT NULL")
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS group_members (
+                chat_id BIGINT NOT NULL,
+                user_id BIGINT NOT NULL,
+                last_seen TIMESTAMP NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (chat_id, user_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_group_members_user ON group_members (user_id);
+        ''')
+        if not members_existed:
+            await conn.execute('''
+                INSERT INTO group_members (chat_id, user_id)
+                SELECT DISTINCT g.chat_id, u.user_id
+                FROM users u, unnest(u.groups) AS g(chat_id)
+                WHERE u.groups IS NOT NULL AND g.chat_id IS NOT NULL
+                ON CONFLICT DO NOTHING
+            ''')
+        # Broadcast progress (resumable checkpoints) and chats that can no longer be reached
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                broadcast_id SERIAL PRIMARY KEY,
+                started_by BIGINT,
+                method TEXT NOT NULL,
+                content JSONB NOT NULL,
+                status TEXT NOT NULL DEFAULT 'running',
+                users_after BIGINT,
+                users_done BOOLEAN NOT NULL DEFAULT FALSE,
+                groups_after BIGINT,
+                groups_done BOOLEAN NOT NULL DEFAULT FALSE,
+                success INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                dead INTEGER NOT NULL DEFAULT 0,
+                started_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+            );
+            CREATE TABLE IF NOT EXISTS dead_chats (
+                chat_id BIGINT PRIMARY KEY,
+                reason TEXT,
+                detected_at TIMESTAMP NOT NULL DEFAULT NOW()
+            );
+        ''')
+        # Trigram index for fuzzy character name search (installing pg_trgm may need extra privileges)
+        try:
+            await conn.execute('''
+                CREATE EXTENSION IF NOT EXISTS pg_trgm;
+                CREATE INDEX IF NOT EXISTS idx_characters_name_trgm
+                ON characters USING gin (lower(name) gin_trgm_ops);
+            ''')
+        except Exception as e:
+            logger.warning(f"pg_trgm name index unavailable: {e}")
+        # Append-only collection log, one partition per UTC day
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS collection_events (
+                user_id BIGINT NOT NULL,
+                character_id INTEGER,
+                source TEXT NOT NULL,
+                chat_id BIGINT,
+                collected_at TIMESTAMP NOT NULL DEFAULT NOW()
+            ) PARTITION BY RANGE (collected_at);
+            CREATE TABLE IF NOT EXISTS collection_events_default
+            PARTITION OF collection_events DEFAULT;
+            CREATE INDEX IF NOT EXISTS idx_collection_events_collected_at
+            ON collection_events (collected_at);
+            CREATE INDEX IF NOT EXISTS idx_collection_events_user
+            ON collection_events (user_id, source, collected_at);
+        ''')
+        today = datetime.utcnow().date()
+        await ensure_collection_event_partitions(conn, [today + timedelta(days=i) for i in range(3)])
+
+# Moves one user's legacy characters array into user_characters and clears the
+# array. A NULL array means the user has been migrated; this is a no-op then.
+_MIGRATE_USER_CHARACTERS_SQL = """
+    WITH pending AS (
+        SELECT characters FROM users
+        WHERE user_id = $1 AND characters IS NOT NULL
+        FOR UPDATE
+    ), moved AS (
+        INSERT INTO user_characters (user_id, character_id, count)
+        SELECT $1, e.character_id, COUNT(*)
+        FROM pending, unnest(pending.characters) WITH ORDINALITY AS e(character_id, ord)
+        GROUP BY e.character_id
+        ORDER BY MIN(e.ord)
+        ON CONFLICT (user_id, character_id)
+        DO UPDATE SET count = user_characters.count + EXCLUDED.count
+    )
+    UPDATE users SET characters = NULL
+    WHERE user_id = $1 AND characters IS NOT NULL
+"""
+
+# Same as above for a batch of not-yet-migrated users
+_BACKFILL_USER_CHARACTERS_SQL = """
+    WITH batch AS (
+        SELECT user_id, characters FROM users
+        WHERE characters IS NOT NULL
+        LIMIT $1
+        FOR UPDATE SKIP LOCKED
+    ), moved AS (
+        INSERT INTO user_characters (user_id, character_id, count)
+        SELECT b.user_id, e.character_id, COUNT(*)
+        FROM batch b, unnest(b.characters) WITH ORDINALITY AS e(character_id, ord)
+        GROUP BY b.user_id, e.character_id
+        ORDER BY b.user_id, MIN(e.ord)
+        ON CONFLICT (user_id, character_id)
+        DO UPDATE SET count = user_characters.count + EXCLUDED.count
+    )
+    UPDATE users u SET characters = NULL
+    FROM batch b
+    WHERE u.user_id = b.user_id
+"""
+
+async def backfill_user_characters(batch_size: int = 500, pause: float = 0.05):
+    """Online migration of users.characters arrays into the user_characters table.
+
+    Runs in small batches with SKIP LOCKED so live writes are never blocked;
+    users touched by a write before their batch runs are migrated on the spot.
+    """
+    global _user_characters_backfilled
+    migrated = 0
+    try:
+        while True:
+            async with _pg_pool.acquire() as conn:
+                result = await conn.execute(_BACKFILL_USER_CHARACTERS_SQL, batch_size)
+            updated = int(result.split()[-1])
+            migrated += updated
+            if updated == 0:
+                # Rows skipped because a live write held them are migrated by
+                # that write; wait for them before declaring the backfill done
+                async with _pg_pool.acquire() as conn:
+                    remaining = await conn.fetchval(
+                        "SELECT EXISTS (SELECT 1 FROM users WHERE characters IS NOT NULL)"
+                    )
+                if not remaining:
+                    break
+            await asyncio.sleep(pause)
+        _user_characters_backfilled = True
+        if migrated:
+            logger.info(f"Backfilled user_characters for {migrated} users")
+    except Exception as e:
+        logger.error(f"Error backfilling user_characters: {e}")
+
+# Days that already have a collection_events partition (per process)
+_collection_event_partitions = set()
+
+async def ensure_collection_event_partitions(conn, days):
+    """Create the daily collection_events partitions for the given dates if missing"""
+    for day in sorted(set(days) - _collection_event_partitions):
+        try:
+            await conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS collection_events_p{day:%Y%m%d}
+                PARTITION OF collection_events
+                FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')
+            """)
+            _collection_event_partitions.add(day)
+        except Exception as e:
+            # Rows for this day stay in the default partition
+            logger.error(f"Error creating collection_events partition for {day}: {e}")
+
+async def maintain_collection_event_partitions(days_ahead: int = 3, interval: int = 6 * 3600):
+    """Create partitions for today and the next few days, so inserts never need DDL"""
+    while True:
+        try:
+            today = datetime.utcnow().date()
+            async with _pg_pool.acquire() as conn:
+                await ensure_collection_event_partitions(conn, [today + timedelta(days=i) for i in range(days_ahead)])
+        except Exception as e:
+            logger.error(f"Error maintaining collection_events partitions: {e}")
+        await asyncio.sleep(interval)
+
+def _event_time(value):
+    """Naive UTC datetime from a history timestamp (datetime or ISO string)"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(pytz.UTC).replace(tzinfo=None)
+    return value
+
+def _history_entry_to_event(user_id, entry, default_time=None):
+    """collection_events row for a collection_history-style entry, or None if it has no usable time"""
+    if not isinstance(entry, dict):
+        return None
+    when = None
+    for key in ('collected_at', 'sold_at', 'timestamp'):
+        if entry.get(key):
+            when = _event_time(entry[key])
+            break
+    when = when or default_time
+    if when is None:
+        return None
+    character_id = entry.get('character_id')
+    chat_id = entry.get('chat_id')
+    return (
+        user_id,
+        int(character_id) if isinstance(character_id, (int, str)) and str(character_id).isdigit() else None,
+        entry.get('source') or 'collected',
+        chat_id if isinstance(chat_id, int) else None,
+        when,
+    )
+
+async def _insert_collection_events(conn, rows):
+    """Bulk insert (user_id, character_id, source, chat_id, collected_at) rows"""
+    if not rows:
+        return
+    await conn.execute("""
+        INSERT INTO collection_events (user_id, character_id, source, chat_id, collected_at)
+        SELECT * FROM unnest($1::bigint[], $2::int[], $3::text[], $4::bigint[], $5::timestamp[])
+    """, *[list(column) for column in zip(*rows)])
+
+async def migrate_collection_history(batch_size: int = 200, pause: float = 0.05):
+    """Stream legacy users.collection_history JSONB into collection_events.
+
+    Each batch of users is copied and has its JSONB cleared in one
+    transaction, so a NULL collection_history means the user is migrated.
+    """
+    migrated = 0
+    skipped = 0
+    try:
+        while True:
+            async with _pg_pool.acquire() as conn:
+                async with conn.transaction():
+                    batch = await conn.fetch("""
+                        SELECT user_id, collection_history FROM users
+                        WHERE collection_history IS NOT NULL
+                        LIMIT $1
+                        FOR UPDATE SKIP LOCKED
+                    """, batch_size)
+                    rows = []
+                    for record in batch:
+                        history = record['collection_history']
+                        if isinstance(history, str):
+                            try:
+                                history = json.loads(history)
+                            except ValueError:
+                                history = []
+                        for entry in history if isinstance(history, list) else []:
+                            row = _history_entry_to_event(record['user_id'], entry)
+                            if row:
+                                rows.append(row)
+                            else:
+                                skipped += 1
+                    await ensure_collection_event_partitions(conn, {row[4].date() for row in rows})
+                    await _insert_collection_events(conn, rows)
+                    await conn.execute(
+                        "UPDATE users SET collection_history = NULL WHERE user_id = ANY($1::bigint[])",
+                        [record['user_id'] for record in batch]
+                    )
+                for record in batch:
+                    get_user_cache().invalidate(record['user_id'])
+                if not batch:
+                    remaining = await conn.fetchval(
+                        "SELECT EXISTS (SELECT 1 FROM users WHERE collection_history IS NOT NULL)"
+                    )
+                    if not remaining:
+                        break
+            migrated += len(batch)
+            await asyncio.sleep(pause)
+        if migrated:
+            logger.info(f"Migrated collection_history for {migrated} users ({skipped} entries without a timestamp skipped)")
+    except Exception as e:
+        logger.error(f"Error migrating collection_history: {e}")
 
 class PostgresDatabase:
     async def reset_character_from_collections(self, character_id: int):
         """Remove character from all users' collections but keep in database."""
         async with self.pool.acquire() as conn:
-            await conn.execute("UPDATE users SET characters = array_remove(characters, $1)", character_id)
+            await conn.execute("DELETE FROM user_characters WHERE character_id = $1", character_id)
+            await conn.execute(
+                "UPDATE users SET characters = array_remove(characters, $1) WHERE $1 = ANY(characters)",
+                character_id
+            )
+        get_user_cache().invalidate()
+        get_collection_views().invalidate()
         return True
     async def delete_character(self, character_id: int):
         """Delete character from database and remove from all user collections."""
         async with self.pool.acquire() as conn:
             # Remove character from characters table
             await conn.execute("DELETE FROM characters WHERE character_id = $1", character_id)
-            # Remove character from all users' characters arrays
-            await conn.execute("UPDATE users SET characters = array_remove(characters, $1)", character_id)
-        # Invalidate character cache
-        if character_id in _character_cache:
-            del _character_cache[character_id]
+            # Remove character from all users' collections (and any unmigrated arrays)
+            await conn.execute("DELETE FROM user_characters WHERE character_id = $1", character_id)
+            await conn.execute(
+                "UPDATE users SET characters = array_remove(characters, $1) WHERE $1 = ANY(characters)",
+                character_id
+            )
+        get_character_catalog().remove(character_id)
+        get_user_cache().invalidate()
+        get_collection_views().invalidate()
         return True
     async def edit_character(self, character_id: int, update_data: dict):
         """Edit character fields by character_id."""
@@ -341,13 +1009,13 @@ class PostgresDatabase:
             set_clauses.append(f"{key} = ${idx}")
             params.append(value)
             idx += 1
-        sql = f"UPDATE characters SET {', '.join(set_clauses)} WHERE character_id = ${idx}"
+        sql = f"UPDATE characters SET {', '.join(set_clauses)} WHERE character_id = ${idx} RETURNING *"
         params.append(character_id)
         async with self.pool.acquire() as conn:
-            await conn.execute(sql, *params)
-        # Invalidate character cache so updates are reflected
-        if character_id in _character_cache:
-            del _character_cache[character_id]
+            row = await conn.fetchrow(sql, *params)
+        # Update the catalog right away; the change notification only confirms it
+        if row:
+            get_character_catalog().put(dict(row))
         return True
     async def add_character(self, character_data: dict):
         """Add a new character to the database and return its ID."""
@@ -358,7 +1026,7 @@ class PostgresDatabase:
                 """
                 INSERT INTO characters (name, rarity, file_id, img_url, is_video, added_by, created_at)
                 VALUES ($1, $2, $3, $4, $5, $6, CURRENT_TIMESTAMP)
-                RETURNING character_id
+                RETURNING *
                 """,
                 data.get("name"),
                 data.get("rarity"),
@@ -367,36 +1035,78 @@ class PostgresDatabase:
                 data.get("is_video", False),
                 data.get("added_by")
             )
-            return result["character_id"] if result else None
+            if not result:
+                return None
+            data["character_id"] = result["character_id"]
+            get_character_catalog().put(dict(result))
+            return result["character_id"]
     async def add_user_to_group(self, user_id, group_id):
-        """Add a user to a group by updating their groups array."""
+        """Record a user as a member of a group in the group_members index."""
+        # Called on every collect; skip the write if we saw this pair recently
+        key = (group_id, user_id)
+        if key in _group_member_seen_cache:
+            return
         try:
             async with self.pool.acquire() as conn:
-                # First ensure the groups column exists
-                column_check = await conn.fetchrow("""
-                    SELECT column_name FROM information_schema.columns 
-                    WHERE table_name = 'users' AND column_name = 'groups'
-                """)
-                
-                if not column_check:
-                    # Add the groups column if it doesn't exist
-                    await conn.execute("""
-                        ALTER TABLE users ADD COLUMN groups BIGINT[] DEFAULT ARRAY[]::BIGINT[];
-                    """)
-                
-                # Add group_id to user's groups array if not already present
+                # last_seen is only bumped once an hour to avoid rewriting the row on every call
                 await conn.execute("""
-                    UPDATE users 
-                    SET groups = CASE 
-                        WHEN groups IS NULL THEN ARRAY[$2::bigint] 
-                        WHEN NOT ($2 = ANY(groups)) THEN array_append(groups, $2::bigint)
-                        ELSE groups
-                    END
-                    WHERE user_id = $1
-                """, user_id, group_id)
-                
+                    INSERT INTO group_members (chat_id, user_id, last_seen)
+                    VALUES ($1, $2, NOW())
+                    ON CONFLICT (chat_id, user_id) DO UPDATE
+                    SET last_seen = EXCLUDED.last_seen
+                    WHERE group_members.last_seen < NOW() - INTERVAL '1 hour'
+                """, group_id, user_id)
+            _group_member_seen_cache[key] = True
         except Exception as e:
             logger.error(f"Error adding user {user_id} to group {group_id}: {e}")
+
+    async def remove_user_from_group(self, user_id, group_id):
+        """Remove a user from a group's membership index."""
+        _group_member_seen_cache.pop((group_id, user_id), None)
+        try:
+            async with self.pool.acquire() as conn:
+                await conn.execute(
+                    "DELETE FROM group_members WHERE chat_id = $1 AND user_id = $2",
+                    group_id, user_id
+                )
+        except Exception as e:
+            logger.error(f"Error removing user {user_id} from group {group_id}: {e}")
+
+    async def get_group_top_collectors(self, chat_id: int, limit: int = 10, member_ids=None) -> List[Dict[str, Any]]:
+        """Top collectors among a group's members, optionally restricted to `member_ids`"""
+        try:
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch("""
+                    SELECT gm.user_id, u.first_name, s.total_count, s.unique_count
+                    FROM group_members gm
+                    JOIN user_collection_stats s ON s.user_id = gm.user_id
+                    JOIN users u ON u.user_id = gm.user_id
+                    WHERE gm.chat_id = $1 AND s.total_count > 0
+                      AND ($3::bigint[] IS NULL OR gm.user_id = ANY($3::bigint[]))
+                    ORDER BY s.total_count DESC
+                    LIMIT $2
+                """, chat_id, limit, list(member_ids) if member_ids is not None else None)
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting top collectors for group {chat_id}: {e}")
+            return []
+
+    async def get_group_rank(self, chat_id: int, user_id: int, member_ids=None) -> Optional[int]:
+        """1-based position of a user by total characters among a group's members"""
+        try:
+            async with self.pool.acquire() as conn:
+                return await conn.fetchval("""
+                    SELECT COUNT(*) + 1
+                    FROM group_members gm
+                    JOIN user_collection_stats s ON s.user_id = gm.user_id
+                    WHERE gm.chat_id = $1 AND gm.user_id <> $2
+                      AND s.total_count > COALESCE(
+                          (SELECT total_count FROM user_collection_stats WHERE user_id = $2), 0)
+                      AND ($3::bigint[] IS NULL OR gm.user_id = ANY($3::bigint[]))
+                """, chat_id, user_id, list(member_ids) if member_ids is not None else None)
+        except Exception as e:
+            logger.error(f"Error getting rank of {user_id} in group {chat_id}: {e}")
+            return None
     async def get_daily_drops(self, rarity):
         """Stub for get_daily_drops to prevent AttributeError. Returns 0."""
         return 0
@@ -475,38 +1185,24 @@ class PostgresDatabase:
             raise
 
     async def update_user_atomic(self, user_id, new_characters, wallet_delta, sold_entries):
-        # Ensure collection_history column exists before update
-        await self.ensure_collection_history_column()
-        """Atomically update characters, wallet, and append to collection_history for a user."""
-        query = """
-        UPDATE users
-        SET characters = $1,
-            wallet = wallet + $2,
-            collection_history = 
-                CASE 
-                    WHEN collection_history IS NULL OR jsonb_typeof(collection_history) != 'array' THEN 
-                        $3::jsonb
-                    ELSE 
-                        collection_history || $3::jsonb
-                END
-        WHERE user_id = $4
-        """
-        import json
-        def convert(obj):
-            if isinstance(obj, dict):
-                return {k: convert(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [convert(i) for i in obj]
-            elif hasattr(obj, 'isoformat'):
-                return obj.isoformat()
-            else:
-                return obj
-        safe_entries = convert(sold_entries)
+        """Atomically update characters, wallet, and log the entries to collection_events for a user."""
+        now = datetime.utcnow()
+        events = [_history_entry_to_event(user_id, entry, now) for entry in sold_entries]
         try:
-            await self.pool.execute(query, new_characters, wallet_delta, json.dumps(safe_entries), user_id)
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    await self._migrate_user_characters(conn, user_id)
+                    await self._replace_user_characters(conn, user_id, new_characters)
+                    await conn.execute(
+                        "UPDATE users SET wallet = wallet + $1 WHERE user_id = $2", wallet_delta, user_id
+                    )
+                    await _insert_collection_events(conn, [e for e in events if e])
         except Exception as e:
             pass  # Error handling, optionally print or raise
             raise
+        finally:
+            get_user_cache().invalidate(user_id)
+            get_collection_views().invalidate(user_id)
     async def set_favorite_character(self, user_id, character_id):
         """Set the user's favorite character by updating the favorite_character field."""
         query = """
@@ -519,77 +1215,68 @@ class PostgresDatabase:
         except Exception as e:
             pass  # Error handling, optionally print or raise
             raise
+        finally:
+            get_user_cache().invalidate(user_id)
     async def get_all_characters(self) -> list:
-        """Fetch all characters from the database as a list of dicts."""
+        """All characters as a list of dicts (from the in-memory catalog)."""
         try:
-            async with self.pool.acquire() as conn:
-                rows = await conn.fetch("SELECT * FROM characters")
-                return [dict(row) for row in rows]
+            catalog = await self.get_catalog()
+            return [dict(row) for row in catalog.all()]
         except Exception as e:
             pass  # Error fetching all characters
             return []
 
-    async def get_store_eligible_characters(self, count: int = 10) -> list:
-        """Fetch characters eligible for store offers using PostgreSQL aggregation.
-        Excludes Supreme rarity, is_video=True characters, and specific excluded IDs."""
+    async def get_all_store_eligible(self) -> list:
+        """Every store-eligible character (memoised catalog rows; don't modify them)"""
+        catalog = await self.get_catalog()
+        return catalog.filter(_is_store_eligible, key='store_eligible')
+
+    async def reset_store_offers(self, day: str, salt: str) -> int:
+        """Give every user a fresh store for `day` in one statement; returns how many were reset"""
+        async with self.pool.acquire() as conn:
+            result = await conn.execute("""
+                UPDATE users SET store_offer = jsonb_build_object(
+                    'date', $1::text, 'refreshes', 0, 'purchased', '[]'::jsonb, 'pending_buy', NULL, 'salt', $2::text
+                )
+            """, day, salt)
+        get_user_cache().invalidate()
+        return int(result.split()[-1])
+
+    async def search_characters_by_name(self, query: str, limit: int = 50, cursor: str = None):
+        """Ranked fuzzy name search through the pg_trgm index, for when the catalog isn't loaded.
+        Same ranking and cursor format as the in-memory search index; returns (rows, next_cursor)."""
+        query = normalize_name(query)
+        after = CharacterSearchIndex.parse_cursor(cursor) or (float('-inf'), 0)
         try:
             async with self.pool.acquire() as conn:
-                # First check if is_video column exists
-                column_check = await conn.fetchrow("""
-                    SELECT column_name FROM information_schema.columns 
-                    WHERE table_name = 'characters' AND column_name = 'is_video'
-                """)
-                
-                # Get total count of eligible characters for debugging
-                if column_check:
-                    count_query = """
-                        SELECT COUNT(*) FROM characters 
-                        WHERE rarity != 'Supreme' 
-                        AND (is_video IS NULL OR is_video = false OR is_video = 'false')
-                        AND character_id NOT IN (531, 664, 678, 849, 853, 877, 957, 1109, 1248, 1305)
-                    """
-                else:
-                    count_query = """
-                        SELECT COUNT(*) FROM characters 
-                        WHERE rarity != 'Supreme' 
-                        AND character_id NOT IN (531, 664, 678, 849, 853, 877, 957, 1109, 1248, 1305)
-                    """
-                
-                total_count = await conn.fetchval(count_query)
-                print(f"[DEBUG] get_store_eligible_characters: total eligible characters in DB: {total_count}")
-                
-                if column_check:
-                    # Use PostgreSQL aggregation to filter and randomly select characters
-                    # Handle is_video field more robustly - it might be NULL or not exist
-                    query = """
-                        SELECT * FROM characters 
-                        WHERE rarity != 'Supreme' 
-                        AND (is_video IS NULL OR is_video = false OR is_video = 'false')
-                        AND character_id NOT IN (531, 664, 678, 849, 853, 877, 957, 1109, 1248, 1305)
-                        ORDER BY RANDOM()
-                        LIMIT $1
-                    """
-                else:
-                    # Fallback if is_video column doesn't exist
-                    query = """
-                        SELECT * FROM characters 
-                        WHERE rarity != 'Supreme' 
-                        AND character_id NOT IN (531, 664, 678, 849, 853, 877, 957, 1109, 1248, 1305)
-                        ORDER BY RANDOM()
-                        LIMIT $1
-                    """
-                
-                rows = await conn.fetch(query, count)
-                result = [dict(row) for row in rows]
-                print(f"[DEBUG] Store eligible characters: {len(result)} found, requested: {count}")
-                # Log any characters with is_video=True that might have slipped through
-                for char in result:
-                    if char.get('is_video'):
-                        print(f"[WARNING] Character {char.get('character_id')} has is_video=True but was included in store!")
-                return result
+                rows = await conn.fetch("""
+                    SELECT * FROM (
+                        SELECT *, ROUND((CASE
+                            WHEN lower(name) = $1 THEN 3
+                            ELSE similarity(lower(name), $1) + CASE
+                                WHEN lower(name) LIKE $1 || '%' THEN 1.5
+                                WHEN ' ' || lower(name) LIKE '% ' || $1 || '%' THEN 1.0
+                                WHEN lower(name) LIKE '%' || $1 || '%' THEN 0.5
+                                ELSE 0 END
+                        END)::numeric, 4)::float8 AS search_score
+                        FROM characters
+                        WHERE lower(name) % $1 OR lower(name) LIKE '%' || $1 || '%'
+                    ) ranked
+                    WHERE (-search_score, character_id) > ($2::float8, $3::int)
+                    ORDER BY search_score DESC, character_id
+                    LIMIT $4
+                """, query, after[0], after[1], limit + 1)
         except Exception as e:
-            print(f"[ERROR] Failed to fetch store eligible characters: {e}")
-            return []
+            pass  # Error searching characters by name
+            return [], ""
+        results = [dict(row) for row in rows[:limit]]
+        next_cursor = ""
+        if len(rows) > limit:
+            last = results[-1]
+            next_cursor = f"{last['search_score']}:{last['character_id']}"
+        for row in results:
+            row.pop('search_score', None)
+        return results, next_cursor
 
     async def get_all_user_ids(self) -> list:
         """Fetch all user IDs from the database."""
@@ -603,18 +1290,18 @@ class PostgresDatabase:
 
     async def get_characters_by_ids(self, char_ids: list) -> list:
         """Fetch characters by a list of character IDs."""
+        characters = await self.get_characters(char_ids)
+        return [characters[cid] for cid in dict.fromkeys(char_ids) if cid in characters]
+
+    async def get_characters(self, char_ids) -> Dict[int, Dict]:
+        """Characters by ID from the catalog; all misses are fetched in one query"""
         if not char_ids:
-            return []
+            return {}
         try:
-            async with self.pool.acquire() as conn:
-                rows = await conn.fetch(
-                    "SELECT * FROM characters WHERE character_id = ANY($1::int[])",
-                    char_ids
-                )
-                return [dict(row) for row in rows]
+            return await get_character_catalog().get_many(self.pool, char_ids)
         except Exception as e:
             pass  # Error fetching characters by ids
-            return []
+            return {}
     def __init__(self):
         self.pool = _pg_pool
         # Add collection-like attributes for compatibility with MongoDB interface
@@ -625,53 +1312,119 @@ class PostgresDatabase:
         self.drop_settings = self  # Use self for drop settings operations
         self.propose_settings = self  # Use self for propose settings operations
         self.redeem_codes = self  # Use self for redeem codes operations
-        
-    async def get_user(self, user_id: int) -> Optional[Dict]:
-        """Get user data by ID"""
+
+    async def _migrate_user_characters(self, conn, user_id: int):
+        """Move the user's legacy characters array into user_characters if still pending."""
+        if not _user_characters_backfilled:
+            await conn.execute(_MIGRATE_USER_CHARACTERS_SQL, user_id)
+
+    async def _fetch_owned_character_ids(self, conn, user_id: int) -> list:
+        """Expand the user's ownership rows into a flat ID list (one entry per copy)."""
+        rows = await conn.fetch("""
+            SELECT uc.character_id
+            FROM user_characters uc, generate_series(1, uc.count)
+            WHERE uc.user_id = $1
+            ORDER BY uc.acquired_seq
+        """, user_id)
+        return [row['character_id'] for row in rows]
+
+    async def _attach_owned_characters(self, conn, users: list):
+        """Fill in 'characters' for migrated user rows with a single query."""
+        user_ids = [u['user_id'] for u in users if 'characters' in u and u['characters'] is None]
+        if not user_ids:
+            return
+        rows = await conn.fetch("""
+            SELECT uc.user_id, array_agg(uc.character_id ORDER BY uc.acquired_seq) AS characters
+            FROM user_characters uc, generate_series(1, uc.count)
+            WHERE uc.user_id = ANY($1::bigint[])
+            GROUP BY uc.user_id
+        """, user_ids)
+        owned = {row['user_id']: list(row['characters']) for row in rows}
+        for u in users:
+            if 'characters' in u and u['characters'] is None:
+                u['characters'] = owned.get(u['user_id'], [])
+
+    async def _add_user_characters(self, conn, user_id: int, character_ids: list):
+        """Add one copy per listed ID to the user's ownership rows."""
+        await conn.execute("""
+            INSERT INTO user_characters (user_id, character_id, count)
+            SELECT $1, e.character_id, COUNT(*)
+            FROM unnest($2::int[]) WITH ORDINALITY AS e(character_id, ord)
+            WHERE EXISTS (SELECT 1 FROM users WHERE user_id = $1)
+            GROUP BY e.character_id
+            ORDER BY MIN(e.ord)
+            ON CONFLICT (user_id, character_id)
+            DO UPDATE SET count = user_characters.count + EXCLUDED.count
+        """, user_id, character_ids)
+
+    async def _replace_user_characters(self, conn, user_id: int, character_ids: list):
+        """Make the user's ownership rows match a full ID list, touching only changed rows."""
+        await conn.execute("""
+            WITH desired AS (
+                SELECT e.character_id, COUNT(*)::int AS count, MIN(e.ord) AS ord
+                FROM unnest($2::int[]) WITH ORDINALITY AS e(character_id, ord)
+                GROUP BY e.character_id
+            ), removed AS (
+                DELETE FROM user_characters uc
+                WHERE uc.user_id = $1
+                AND NOT EXISTS (SELECT 1 FROM desired d WHERE d.character_id = uc.character_id)
+            )
+            INSERT INTO user_characters (user_id, character_id, count)
+            SELECT $1, d.character_id, d.count
+            FROM desired d
+            WHERE EXISTS (SELECT 1 FROM users WHERE user_id = $1)
+            ORDER BY d.ord
+            ON CONFLICT (user_id, character_id)
+            DO UPDATE SET count = EXCLUDED.count
+            WHERE user_characters.count <> EXCLUDED.count
+        """, user_id, list(character_ids or []))
+
+    async def _user_columns(self, conn, fields) -> List[str]:
+        """Known users columns among `fields`, always led by user_id"""
+        global _users_columns
+        if _users_columns is None:
+            rows = await conn.fetch(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = 'users'"
+            )
+            _users_columns = frozenset(row['column_name'] for row in rows)
+        columns = ['user_id']
+        for field in fields:
+            if field in _users_columns and field not in columns:
+                columns.append(field)
+        return columns
+
+    async def get_user(self, user_id: int, fields=None) -> Optional[Dict]:
+        """Get user data by ID.
+
+        `fields` limits the fetch to those columns (plus user_id); unknown names
+        are skipped. JSONB columns are decoded on first access. Rows are served
+        from the user cache when possible; concurrent misses share one query.
+        """
+        return await get_user_cache().get(user_id, fields, lambda: self._load_user(user_id, fields))
+
+    async def _load_user(self, user_id: int, fields=None) -> Optional[Dict]:
+        started = time.perf_counter()
         async with self.pool.acquire() as conn:
-            row = await conn.fetchrow("SELECT * FROM users WHERE user_id = $1", user_id)
+            if fields is None:
+                row = await conn.fetchrow("SELECT * FROM users WHERE user_id = $1", user_id)
+            else:
+                columns = await self._user_columns(conn, fields)
+                row = await conn.fetchrow(
+                    f"SELECT {', '.join(columns)} FROM users WHERE user_id = $1", user_id
+                )
+            get_user_fetch_report().record(_fetch_site(), row, time.perf_counter() - started, fields is not None)
             if not row:
                 return None
-            user = dict(row)
+            user = UserRecord(row)
+            # Migrated users keep their collection in user_characters
+            if 'characters' in user and user['characters'] is None:
+                user['characters'] = await self._fetch_owned_character_ids(conn, user_id)
             # Ensure last_propose is always an ISO string if present
             if 'last_propose' in user and user['last_propose']:
                 if isinstance(user['last_propose'], datetime):
                     user['last_propose'] = user['last_propose'].isoformat()
                 else:
                     user['last_propose'] = str(user['last_propose'])
-            
-            # Parse active_action if it's stored as JSON string
-            if 'active_action' in user and isinstance(user['active_action'], str):
-                try:
-                    import json
-                    user['active_action'] = json.loads(user['active_action'])
-                except (json.JSONDecodeError, TypeError):
-                    user['active_action'] = None
-            
-            # Parse collection_history if it's stored as JSON string
-            if 'collection_history' in user and isinstance(user['collection_history'], str):
-                try:
-                    import json
-                    user['collection_history'] = json.loads(user['collection_history'])
-                except (json.JSONDecodeError, TypeError):
-                    user['collection_history'] = []
-            
-            # Parse store_offer if it's stored as JSON string
-            if 'store_offer' in user and isinstance(user['store_offer'], str):
-                try:
-                    import json
-                    user['store_offer'] = json.loads(user['store_offer'])
-                except (json.JSONDecodeError, TypeError):
-                    user['store_offer'] = {}
-            
-            # Parse supreme_store_offer if it's stored as JSON string
-            if 'supreme_store_offer' in user and isinstance(user['supreme_store_offer'], str):
-                try:
-                    import json
-                    user['supreme_store_offer'] = json.loads(user['supreme_store_offer'])
-                except (json.JSONDecodeError, TypeError):
-                    user['supreme_store_offer'] = {}
-            
             return user
 
     async def insert_redeem_code(self, redeem_data: dict):
@@ -759,6 +1512,8 @@ class PostgresDatabase:
                 """, user_data['user_id'], user_data.get('username'),
                      user_data.get('first_name'), user_data.get('last_name'),
                      user_data.get('wallet', 0), user_data.get('shards', 0))
+            get_user_cache().invalidate(user_data['user_id'])
+            get_collection_views().invalidate(user_data['user_id'])
         except Exception as e:
             pass  # Error adding user
     
@@ -780,6 +1535,10 @@ class PostgresDatabase:
             else:
                 return obj
         
+        # Ownership lives in user_characters; everything else is a users column
+        update_data = dict(update_data)
+        new_characters = update_data.pop('characters', None)
+        
         for key, value in update_data.items():
             # Serialize dicts and lists for JSONB columns
             if key in ['active_action', 'collection_preferences'] and isinstance(value, dict):
@@ -800,33 +1559,179 @@ class PostgresDatabase:
             set_clauses.append(f"{key} = ${idx}")
             params.append(value)
             idx += 1
-        if not set_clauses:
+        if not set_clauses and new_characters is None:
             return False
         sql = f"UPDATE users SET {', '.join(set_clauses)} WHERE user_id = ${idx}"
         params.append(user_id)
         async with self.pool.acquire() as conn:
-            await conn.execute(sql, *params)
+            async with conn.transaction():
+                if new_characters is not None:
+                    await self._migrate_user_characters(conn, user_id)
+                    await self._replace_user_characters(conn, user_id, new_characters)
+                if set_clauses:
+                    await conn.execute(sql, *params)
+        get_user_cache().invalidate(user_id)
+        if new_characters is not None:
+            get_collection_views().invalidate(user_id)
         return True
-    
+
+    # --- Ledger ---
+    # Balances only ever change through a single conditional UPDATE ... RETURNING,
+    # so concurrent commands (in this process or another) can't lose updates or
+    # overdraw, and callers never need to read the user row first.
+
+    async def _ledger_fetchrow(self, conn, sql: str, *args):
+        if conn is not None:
+            return await conn.fetchrow(sql, *args)
+        async with self.pool.acquire() as conn:
+            return await conn.fetchrow(sql, *args)
+
+    async def _ensure_ledger_user(self, conn, user_id: int, profile: dict):
+        await conn.execute("""
+            INSERT INTO users (user_id, username, first_name, wallet, shards)
+            VALUES ($1, $2, $3, 0, 0)
+            ON CONFLICT (user_id) DO NOTHING
+        """, user_id, profile.get('username'), profile.get('first_name'))
+
+    async def credit(self, user_id: int, amount: int, column: str = 'wallet', profile: dict = None,
+                     conn=None) -> Optional[int]:
+        """Add `amount` to a balance and return the new balance.
+
+        Returns None if the user doesn't exist, unless `profile` (username,
+        first_name) is given, in which case the user is created first. When a
+        `conn` is passed the caller owns the transaction and the user cache.
+        """
+        column = _ledger_column(column)
+        if profile is not None:
+            if conn is None:
+                async with self.pool.acquire() as conn:
+                    async with conn.transaction():
+                        balance = await self.credit(user_id, amount, column, profile, conn)
+                get_user_cache().invalidate(user_id)
+                return balance
+            await self._ensure_ledger_user(conn, user_id, profile)
+        row = await self._ledger_fetchrow(conn, f"""
+            UPDATE users SET {column} = COALESCE({column}, 0) + $2
+            WHERE user_id = $1
+            RETURNING {column}
+        """, user_id, amount)
+        if row and conn is None:
+            get_user_cache().set_field(user_id, **{column: row[0]})
+        return row[0] if row else None
+
+    async def credit_many(self, user_id: int, amounts: Dict[str, int], conn=None) -> Optional[Dict[str, int]]:
+        """Add to several balances of one user in a single UPDATE.
+
+        Returns the new balances by column, or None if the user doesn't exist.
+        """
+        columns = [_ledger_column(column) for column in amounts]
+        assignments = ', '.join(f"{column} = COALESCE({column}, 0) + ${i}" for i, column in enumerate(columns, 2))
+        row = await self._ledger_fetchrow(conn, f"""
+            UPDATE users SET {assignments}
+            WHERE user_id = $1
+            RETURNING {', '.join(columns)}
+        """, user_id, *amounts.values())
+        if row is None:
+            return None
+        balances = dict(row)
+        if conn is None:
+            get_user_cache().set_field(user_id, **balances)
+        return balances
+
+    async def debit_if_sufficient(self, user_id: int, amount: int, column: str = 'wallet',
+                                  conn=None) -> Optional[int]:
+        """Take `amount` from a balance if it covers it; returns the new balance or None"""
+        column = _ledger_column(column)
+        row = await self._ledger_fetchrow(conn, f"""
+            UPDATE users SET {column} = COALESCE({column}, 0) - $2
+            WHERE user_id = $1 AND COALESCE({column}, 0) >= $2
+            RETURNING {column}
+        """, user_id, amount)
+        if row and conn is None:
+            get_user_cache().set_field(user_id, **{column: row[0]})
+        return row[0] if row else None
+
+    async def move_balance(self, user_id: int, amount: int, from_column: str, to_column: str) -> Optional[tuple]:
+        """Move `amount` between two balances of one user (deposit/withdraw).
+
+        Returns (from_balance, to_balance), or None if `from_column` can't cover it.
+        """
+        from_column = _ledger_column(from_column)
+        to_column = _ledger_column(to_column)
+        row = await self._ledger_fetchrow(None, f"""
+            UPDATE users
+            SET {from_column} = COALESCE({from_column}, 0) - $2,
+                {to_column} = COALESCE({to_column}, 0) + $2
+            WHERE user_id = $1 AND COALESCE({from_column}, 0) >= $2
+            RETURNING {from_column}, {to_column}
+        """, user_id, amount)
+        if not row:
+            return None
+        get_user_cache().set_field(user_id, **{from_column: row[0], to_column: row[1]})
+        return row[0], row[1]
+
+    async def transfer(self, from_id: int, to_id: int, amount: int, column: str = 'wallet',
+                       to_profile: dict = None) -> Optional[tuple]:
+        """Move `amount` of a balance from one user to another in one transaction.
+
+        The receiver is created if missing (named from `to_profile`). Returns
+        (sender_balance, receiver_balance), or None if the sender can't cover it.
+        """
+        column = _ledger_column(column)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Lock both rows in a fixed order so opposite transfers can't deadlock
+                await conn.execute(
+                    "SELECT 1 FROM users WHERE user_id = ANY($1::bigint[]) ORDER BY user_id FOR UPDATE",
+                    [from_id, to_id]
+                )
+                sender_balance = await self.debit_if_sufficient(from_id, amount, column, conn=conn)
+                if sender_balance is None:
+                    return None
+                # Only create the receiver once the debit went through, so a refused transfer writes nothing
+                await self._ensure_ledger_user(conn, to_id, to_profile or {})
+                receiver_balance = await self.credit(to_id, amount, column, conn=conn)
+        get_user_cache().set_field(from_id, **{column: sender_balance})
+        get_user_cache().invalidate(to_id)
+        return sender_balance, receiver_balance
+
+    async def claim_periodic_reward(self, user_id: int, last_column: str, cooldown: timedelta,
+                                    reward: int) -> Dict[str, Any]:
+        """Credit a daily/weekly/monthly reward if its cooldown has passed.
+
+        Returns {'claimed', 'wallet', 'last_claimed'}; when the claim is refused,
+        'last_claimed' is the timestamp that is still blocking it.
+        """
+        last_column = _ledger_column(last_column, PERIODIC_REWARD_COLUMNS)
+        now = datetime.utcnow()
+        row = await self._ledger_fetchrow(None, f"""
+            WITH claimed AS (
+                UPDATE users SET wallet = COALESCE(wallet, 0) + $2, {last_column} = $3
+                WHERE user_id = $1 AND ({last_column} IS NULL OR {last_column} <= $3 - $4::interval)
+                RETURNING wallet
+            )
+            SELECT (SELECT wallet FROM claimed) AS wallet,
+                   (SELECT {last_column} FROM users WHERE user_id = $1) AS last_claimed
+        """, user_id, reward, now, cooldown)
+        claimed = row['wallet'] is not None
+        if claimed:
+            get_user_cache().set_field(user_id, wallet=row['wallet'], **{last_column: now})
+        return {
+            'claimed': claimed,
+            'wallet': row['wallet'],
+            'last_claimed': now if claimed else row['last_claimed'],
+        }
+
+    async def get_catalog(self) -> CharacterCatalog:
+        """The in-memory character catalog, loaded if it isn't yet"""
+        catalog = get_character_catalog()
+        await catalog.ensure_loaded(self.pool)
+        return catalog
+
     async def get_character(self, char_id: int) -> Optional[Dict]:
-        """Get character data by ID"""
-        # Check cache first
-        if char_id in _character_cache:
-            _performance_stats['cache_hits'] += 1
-            return _character_cache[char_id]
-        
+        """Get character data by ID (from the in-memory catalog)"""
         try:
-            async with self.pool.acquire() as conn:
-                row = await conn.fetchrow(
-                    "SELECT * FROM characters WHERE character_id = $1",
-                    char_id
-                )
-                if row:
-                    character_data = dict(row)
-                    _character_cache[char_id] = character_data
-                    _performance_stats['cache_hits'] += 1
-                    return character_data
-                return None
+            return await get_character_catalog().get(self.pool, char_id)
         except Exception as e:
             pass  # Error getting character
             return None
@@ -835,152 +1740,229 @@ class PostgresDatabase:
         """Get user's character collection"""
         try:
             async with self.pool.acquire() as conn:
-                # First get the user's character IDs from the characters array
-                user_result = await conn.fetchrow(
+                # Users not migrated yet still have their legacy array
+                pending = await conn.fetchval(
                     "SELECT characters FROM users WHERE user_id = $1",
                     user_id
                 )
-                
-                if not user_result or not user_result[0]:
-                    return []
-                
-                character_ids = user_result[0]
-                if not character_ids:
-                    return []
-                
-                # Get character details for all character IDs
-                char_ids_tuple = tuple(character_ids)
-                if len(char_ids_tuple) == 1:
-                    char_ids_tuple = (char_ids_tuple[0],)
-                
-                rows = await conn.fetch("""
-                    SELECT character_id, name, rarity, img_url, file_id, is_video
-                    FROM characters 
-                    WHERE character_id = ANY($1::int[])
-                    ORDER BY character_id
-                """, char_ids_tuple)
-                
-                # Convert to list of dictionaries and add count information
-                char_counts = {}
-                for char_id in character_ids:
-                    char_counts[char_id] = char_counts.get(char_id, 0) + 1
-                
-                collection = []
-                for row in rows:
-                    char_dict = dict(row)
-                    char_dict['count'] = char_counts.get(char_dict['character_id'], 1)
-                    collection.append(char_dict)
-                
-                return collection
+                if pending is not None:
+                    rows = await conn.fetch("""
+                        SELECT c.character_id, c.name, c.rarity, c.img_url, c.file_id, c.is_video,
+                               o.count
+                        FROM (
+                            SELECT e AS character_id, COUNT(*) AS count
+                            FROM unnest($1::int[]) AS e
+                            GROUP BY e
+                        ) o
+                        JOIN characters c ON c.character_id = o.character_id
+                        ORDER BY c.character_id
+                    """, pending)
+                else:
+                    rows = await conn.fetch("""
+                        SELECT c.character_id, c.name, c.rarity, c.img_url, c.file_id, c.is_video,
+                               uc.count
+                        FROM user_characters uc
+                        JOIN characters c ON c.character_id = uc.character_id
+                        WHERE uc.user_id = $1
+                        ORDER BY c.character_id
+                    """, user_id)
+                return [dict(row) for row in rows]
         except Exception as e:
             pass  # Error getting user collection
             return []
-    
-    async def add_character_to_user(self, user_id: int, character_id: int, collected_at: datetime = None, source: str = 'collected'):
-        import json
-        if collected_at is None:
-            # Always use UTC time
-            collected_at = datetime.utcnow()
-        else:
-            # If a timestamp is provided, ensure it's in UTC
-            if collected_at.tzinfo is not None:
-                collected_at = collected_at.astimezone(pytz.UTC).replace(tzinfo=None)
-        
-        # Always ensure collected_at is an ISO string in UTC
-        if isinstance(collected_at, datetime):
-            collected_at_str = collected_at.isoformat()
-        else:
-            # fallback: use current UTC time
-            collected_at_str = datetime.utcnow().isoformat()
-        
-        entry = {
-            "character_id": character_id,
-            "collected_at": collected_at_str,
-            "source": source
+
+    async def get_owned_character_counts(self, user_id: int, character_ids: list = None) -> List[tuple]:
+        """(character_id, count) pairs for a user, in acquisition order (no catalog join)
+
+        With `character_ids`, only those characters are looked up (an ownership check).
+        """
+        try:
+            async with self.pool.acquire() as conn:
+                pending = await conn.fetchval(
+                    "SELECT characters FROM users WHERE user_id = $1",
+                    user_id
+                )
+                if pending is not None:
+                    counts: Dict[int, int] = {}
+                    for character_id in pending:
+                        if character_ids is None or character_id in character_ids:
+                            counts[character_id] = counts.get(character_id, 0) + 1
+                    return list(counts.items())
+                rows = await conn.fetch("""
+                    SELECT character_id, count FROM user_characters
+                    WHERE user_id = $1 AND ($2::int[] IS NULL OR character_id = ANY($2::int[]))
+                    ORDER BY acquired_seq
+                """, user_id, character_ids)
+                return [(row['character_id'], row['count']) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting owned characters for {user_id}: {e}")
+            raise
+
+    async def get_user_collection_summary(self, user_id: int) -> Dict:
+        """Unique/total counts overall and unique counts per rarity, read from the summary tables"""
+        async with self.pool.acquire() as conn:
+            await self._migrate_user_characters(conn, user_id)
+            totals = await conn.fetchrow(
+                "SELECT total_count, unique_count FROM user_collection_stats WHERE user_id = $1", user_id
+            )
+            rows = await conn.fetch(
+                "SELECT rarity, unique_count FROM user_rarity_stats WHERE user_id = $1 AND unique_count > 0",
+                user_id
+            )
+        return {
+            'unique': totals['unique_count'] if totals else 0,
+            'total': totals['total_count'] if totals else 0,
+            'rarities': {row['rarity']: row['unique_count'] for row in rows},
         }
+
+    async def get_user_collection_page(self, user_id: int, mode: str = 'default', rarity_filter: str = None,
+                                       cursor: str = None, page_size: int = 10, sort: str = None,
+                                       search: str = None) -> Dict:
+        """One page of a user's collection, paginated by keyset in SQL.
+
+        `sort` 'rarity' orders by rarity, highest first, and 'recent' by
+        acquisition, newest first; ties and the default go by character ID.
+        Without a sort, 'detailed' mode (and no rarity filter) means
+        'rarity'. `cursor` is None for the first page, or a 'next'/'prev'
+        value from a previous result. `search` keeps rows whose name or
+        rarity contains it (case-insensitive). Only the page's rows leave the
+        database.
+        """
+        backward = cursor is not None and cursor.startswith('b')
+        rank_after = id_after = None
+        if cursor:
+            rank, _, character_id = cursor[1:].partition('.')
+            rank_after, id_after = int(rank), int(character_id)
+        if sort is None:
+            sort = 'rarity' if mode == 'detailed' and not rarity_filter else 'id'
+        ranks = sorted(RARITIES, key=RARITIES.get)
+        pattern = None
+        if search:
+            pattern = '%' + re.sub(r'([\\%_])', r'\\\1', search.strip()) + '%'
+        # sort_rank is negated so one ascending row comparison serves both orders
+        sql = f'''
+            SELECT * FROM (
+                SELECT uc.character_id, c.name, c.rarity, c.img_url, c.file_id, c.is_video, uc.count,
+                       CASE $7::text
+                           WHEN 'rarity' THEN -COALESCE(array_position($2::text[], c.rarity), 0)
+                           WHEN 'recent' THEN -uc.acquired_seq
+                           ELSE 0
+                       END AS sort_rank
+                FROM user_characters uc
+                JOIN characters c ON c.character_id = uc.character_id
+                WHERE uc.user_id = $1 AND ($3::text IS NULL OR c.rarity = $3)
+                  AND ($8::text IS NULL OR c.name ILIKE $8 OR c.rarity ILIKE $8)
+            ) o
+            WHERE $4::bigint IS NULL OR (o.sort_rank, o.character_id) {'<' if backward else '>'} ($4, $5::int)
+            ORDER BY o.sort_rank {'DESC' if backward else 'ASC'}, o.character_id {'DESC' if backward else 'ASC'}
+            LIMIT $6
+        '''
         async with self.pool.acquire() as conn:
-            # Add character to user's collection
-            await conn.execute("""
-                UPDATE users 
-                SET characters = CASE 
-                    WHEN characters IS NULL THEN ARRAY[$2::integer] 
-                    ELSE array_append(characters, $2::integer) 
-                END
-                WHERE user_id = $1
-            """, user_id, character_id)
-
-            # Append to collection_history - handle both NULL and object cases
-            await conn.execute("""
-                UPDATE users
-                SET collection_history = 
-                    CASE 
-                        WHEN collection_history IS NULL OR jsonb_typeof(collection_history) != 'array' THEN 
-                            to_jsonb(ARRAY[$2::jsonb])
-                        ELSE 
-                            collection_history || to_jsonb(ARRAY[$2::jsonb])
-                    END
-                WHERE user_id = $1
-            """, user_id, json.dumps(entry))
+            await self._migrate_user_characters(conn, user_id)
+            rows = await conn.fetch(sql, user_id, ranks, rarity_filter, rank_after, id_after, page_size + 1, sort,
+                                    pattern)
+        items = [dict(row) for row in rows[:page_size]]
+        more = len(rows) > page_size
+        key = lambda item: f"{item['sort_rank']}.{item['character_id']}"
+        if backward:
+            items.reverse()
+            prev_cursor = 'b' + key(items[0]) if more else None
+            next_cursor = 'a' + key(items[-1]) if items else None
+        else:
+            next_cursor = 'a' + key(items[-1]) if more else None
+            prev_cursor = 'b' + key(items[0]) if cursor and items else None
+        for item in items:
+            del item['sort_rank']
+        return {'items': items, 'next': next_cursor, 'prev': prev_cursor}
+    
+    async def add_character_to_user(self, user_id: int, character_id: int, collected_at: datetime = None,
+                                    source: str = 'collected', chat_id: int = None):
+        # Always store UTC; fall back to now if the timestamp is unusable
+        collected_at = _event_time(collected_at) or datetime.utcnow()
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Add character to user's collection
+                await self._migrate_user_characters(conn, user_id)
+                await self._add_user_characters(conn, user_id, [character_id])
+                await _insert_collection_events(conn, [(user_id, character_id, source, chat_id, collected_at)])
+        get_user_cache().invalidate(user_id)
+        get_collection_views().invalidate(user_id)
+
+    async def log_collection_events(self, user_id: int, entries: list):
+        """Append collection_history-style entries ({character_id, source, collected_at}) to collection_events"""
+        now = datetime.utcnow()
+        rows = [row for row in (_history_entry_to_event(user_id, e, now) for e in entries) if row]
+        try:
+            async with self.pool.acquire() as conn:
+                await _insert_collection_events(conn, rows)
+        except Exception as e:
+            logger.error(f"Error logging collection events for {user_id}: {e}")
+
+    async def count_collection_events(self, user_id: int, sources=('collected',), since: datetime = None,
+                                      until: datetime = None) -> int:
+        """Number of a user's collection events from the given sources, optionally within [since, until)"""
+        try:
+            async with self.pool.acquire() as conn:
+                return await conn.fetchval("""
+                    SELECT COUNT(*) FROM collection_events
+                    WHERE user_id = $1 AND source = ANY($2::text[])
+                      AND ($3::timestamp IS NULL OR collected_at >= $3)
+                      AND ($4::timestamp IS NULL OR collected_at < $4)
+                """, user_id, list(sources), since, until)
+        except Exception as e:
+            logger.error(f"Error counting collection events for {user_id}: {e}")
+            return 0
     async def remove_character_from_user(self, user_id: int, character_id: int):
         """Remove character from user's collection"""
         try:
             async with self.pool.acquire() as conn:
-                await conn.execute("""
-                    DELETE FROM user_characters 
-                    WHERE user_id = $1 AND character_id = $2
-                """, user_id, character_id)
-                
-                # Update user's character array
-                await conn.execute("""
-                    UPDATE users 
-                    SET characters = array_remove(characters, $2)
-                    WHERE user_id = $1
-                """, user_id, character_id)
+                async with conn.transaction():
+                    await self._migrate_user_characters(conn, user_id)
+                    await conn.execute("""
+                        DELETE FROM user_characters 
+                        WHERE user_id = $1 AND character_id = $2
+                    """, user_id, character_id)
+            get_user_cache().invalidate(user_id)
+            get_collection_views().invalidate(user_id)
                 
         except Exception as e:
             pass  # Error removing character from user
     async def remove_single_character_from_user(self, user_id: int, character_id: int):
-        """Remove a single instance of character_id from user's characters array (not all)."""
+        """Remove a single instance of character_id from user's collection (not all)."""
         try:
             async with self.pool.acquire() as conn:
-                # Get current characters array
-                row = await conn.fetchrow("SELECT characters FROM users WHERE user_id = $1", user_id)
-                if not row or not row['characters']:
-                    return False
-                chars = list(row['characters'])
-                if character_id in chars:
-                    chars.remove(character_id)
-                    await conn.execute("UPDATE users SET characters = $1 WHERE user_id = $2", chars, user_id)
-                    return True
-                return False
+                async with conn.transaction():
+                    await self._migrate_user_characters(conn, user_id)
+                    removed = await conn.fetchval("""
+                        WITH decremented AS (
+                            UPDATE user_characters SET count = count - 1
+                            WHERE user_id = $1 AND character_id = $2 AND count > 1
+                            RETURNING 1
+                        ), deleted AS (
+                            DELETE FROM user_characters
+                            WHERE user_id = $1 AND character_id = $2 AND count <= 1
+                            RETURNING 1
+                        )
+                        SELECT (SELECT COUNT(*) FROM decremented) + (SELECT COUNT(*) FROM deleted)
+                    """, user_id, character_id)
+            get_user_cache().invalidate(user_id)
+            get_collection_views().invalidate(user_id)
+            return removed > 0
         except Exception as e:
             pass  # Error removing single character
             return False
     
+    async def _random_characters(self, rarities=None, excluded=None, count: int = 1) -> list:
+        """Uniformly pick `count` distinct characters from the catalog's per-rarity arrays (no table sort)."""
+        index = get_character_id_index()
+        await index.ensure_loaded(self.pool)
+        return [dict(row) for row in index.sample(rarities, excluded, count)]
+
     async def get_random_character(self, locked_rarities=None):
         """Get a random character"""
         try:
-            if locked_rarities is None:
-                locked_rarities = []
-            
-            async with self.pool.acquire() as conn:
-                if locked_rarities:
-                    row = await conn.fetchrow("""
-                        SELECT * FROM characters 
-                        WHERE rarity NOT IN (SELECT unnest($1::text[]))
-                        ORDER BY RANDOM()
-                        LIMIT 1
-                    """, locked_rarities)
-                else:
-                    row = await conn.fetchrow("""
-                        SELECT * FROM characters 
-                        ORDER BY RANDOM()
-                        LIMIT 1
-                    """)
-                
-                if row:
-                    return dict(row)
-                return None
+            rows = await self._random_characters(excluded=locked_rarities or [])
+            return rows[0] if rows else None
                 
         except Exception as e:
             pass  # Error getting random character
@@ -991,17 +1973,8 @@ class PostgresDatabase:
         if not rarities:
             return None
         try:
-            async with self.pool.acquire() as conn:
-                row = await conn.fetchrow("""
-                    SELECT * FROM characters 
-                    WHERE rarity = ANY($1::text[])
-                    ORDER BY RANDOM()
-                    LIMIT 1
-                """, rarities)
-                
-                if row:
-                    return dict(row)
-                return None
+            rows = await self._random_characters(rarities=rarities)
+            return rows[0] if rows else None
         except Exception as e:
             pass  # Error getting random character by rarities
             return None
@@ -1011,31 +1984,15 @@ class PostgresDatabase:
         if count <= 0:
             return []
         try:
-            async with self.pool.acquire() as conn:
-                rows = await conn.fetch("""
-                    SELECT * FROM characters 
-                    WHERE rarity = $1
-                    ORDER BY RANDOM()
-                    LIMIT $2
-                """, rarity, count)
-                
-                result = [dict(row) for row in rows]
-                return result
+            return await self._random_characters(rarities=[rarity], count=count)
         except Exception as e:
             return []
     
     async def get_all_characters_by_rarity(self, rarity: str) -> list:
         """Get all characters of a specific rarity"""
         try:
-            async with self.pool.acquire() as conn:
-                rows = await conn.fetch("""
-                    SELECT * FROM characters 
-                    WHERE rarity = $1
-                    ORDER BY name
-                """, rarity)
-                
-                result = [dict(row) for row in rows]
-                return result
+            catalog = await self.get_catalog()
+            return [dict(row) for row in catalog.by_rarity(rarity, order_by='name')]
         except Exception as e:
             return []
     
@@ -1044,15 +2001,7 @@ class PostgresDatabase:
         if count <= 0:
             return []
         try:
-            async with self.pool.acquire() as conn:
-                rows = await conn.fetch("""
-                    SELECT * FROM characters 
-                    WHERE rarity NOT IN (SELECT unnest($1::text[]))
-                    ORDER BY RANDOM()
-                    LIMIT $2
-                """, excluded_rarities, count)
-                
-                return [dict(row) for row in rows]
+            return await self._random_characters(excluded=excluded_rarities, count=count)
         except Exception as e:
             pass  # Error getting random characters by rarities excluding
             return []
@@ -1221,14 +2170,9 @@ class PostgresDatabase:
             pass  # Error updating claim settings
     
     async def log_user_transaction(self, user_id: int, action_type: str, details: dict):
-        """Log user transaction"""
+        """Log user transaction (queued; written in batches by the transaction log writer)"""
         try:
-            async with self.pool.acquire() as conn:
-                await conn.execute("""
-                    INSERT INTO user_transactions (user_id, action_type, details, created_at)
-                    VALUES ($1, $2, $3, CURRENT_TIMESTAMP)
-                """, user_id, action_type, json.dumps(details))
-                
+            await get_transaction_log().log(user_id, action_type, details)
         except Exception as e:
             pass  # Error handling, optionally print or raise
     
@@ -1272,6 +2216,7 @@ class PostgresDatabase:
                 
                 # Clear cache
                 _drop_settings_cache.clear()
+                get_drop_sampler().set_weights(settings.get('rarity_weights', {}))
                 
         except Exception as e:
             logger.error(f"Error updating drop settings: {e}")
@@ -1286,7 +2231,7 @@ class PostgresDatabase:
             async with self.pool.acquire() as conn:
                 # Get user data
                 user_row = await conn.fetchrow("""
-                    SELECT wallet, shards, characters, created_at
+                    SELECT wallet, shards, created_at
                     FROM users WHERE user_id = $1
                 """, user_id)
                 
@@ -1294,16 +2239,17 @@ class PostgresDatabase:
                     return {}
                 
                 user_data = dict(user_row)
-                character_count = len(user_data.get('characters', []))
+                await self._migrate_user_characters(conn, user_id)
                 
                 # Get collection stats by rarity
                 rarity_stats = await conn.fetch("""
-                    SELECT c.rarity, COUNT(*) as count
+                    SELECT c.rarity, SUM(uc.count) as count
                     FROM user_characters uc
                     JOIN characters c ON uc.character_id = c.character_id
                     WHERE uc.user_id = $1
                     GROUP BY c.rarity
                 """, user_id)
+                character_count = sum(row['count'] for row in rarity_stats)
                 
                 stats = {
                     'user_id': user_id,
@@ -1332,10 +2278,16 @@ class PostgresDatabase:
             async with self.pool.acquire() as conn:
                 rows = await conn.fetch("""
                     SELECT u.user_id, u.first_name, u.username, 
-                           u.wallet, u.shards, array_length(u.characters, 1) as character_count
+                           u.wallet, u.shards,
+                           COALESCE(array_length(u.characters, 1), o.total, 0) as character_count
                     FROM users u
+                    LEFT JOIN (
+                        SELECT user_id, SUM(count) AS total
+                        FROM user_characters
+                        GROUP BY user_id
+                    ) o ON o.user_id = u.user_id
                     WHERE u.is_banned = FALSE
-                    ORDER BY array_length(u.characters, 1) DESC, u.wallet DESC
+                    ORDER BY character_count DESC, u.wallet DESC
                     LIMIT $1
                 """, limit)
                 
@@ -1346,7 +2298,61 @@ class PostgresDatabase:
         except Exception as e:
             logger.error(f"Error getting leaderboard: {e}")
             return []
-    
+
+    async def get_board_top(self, board: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Top `limit` rows of a leaderboard, read straight off its score index"""
+        table, column = LEADERBOARD_BOARDS[board]
+        try:
+            async with self.pool.acquire() as conn:
+                if table == 'user_collection_stats':
+                    rows = await conn.fetch(f"""
+                        SELECT s.user_id, u.first_name, u.username,
+                               s.total_count, s.unique_count, s.{column} AS score
+                        FROM user_collection_stats s
+                        JOIN users u ON u.user_id = s.user_id
+                        WHERE s.{column} > 0
+                        ORDER BY s.{column} DESC
+                        LIMIT $1
+                    """, limit)
+                else:
+                    rows = await conn.fetch(f"""
+                        SELECT user_id, first_name, username, {column} AS score
+                        FROM users
+                        WHERE {column} > 0
+                        ORDER BY {column} DESC NULLS LAST
+                        LIMIT $1
+                    """, limit)
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting {board} leaderboard: {e}")
+            return []
+
+    async def get_board_score(self, board: str, user_id: int) -> int:
+        """One user's score on a leaderboard (primary-key lookup)"""
+        table, column = LEADERBOARD_BOARDS[board]
+        try:
+            async with self.pool.acquire() as conn:
+                score = await conn.fetchval(
+                    f"SELECT {column} FROM {table} WHERE user_id = $1", user_id
+                )
+                return score or 0
+        except Exception as e:
+            logger.error(f"Error getting {board} score for {user_id}: {e}")
+            return 0
+
+    async def get_board_scores(self, board: str) -> List[int]:
+        """Every positive score on a leaderboard in ascending order (for rank lookups)"""
+        table, column = LEADERBOARD_BOARDS[board]
+        try:
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch(
+                    f"SELECT {column} FROM {table} WHERE {column} > 0 ORDER BY {column}"
+                )
+                return [row[0] for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting {board} leaderboard scores: {e}")
+            return []
+
     async def get_chat_settings(self, chat_id: int):
         """Get chat settings"""
         # Check cache first
@@ -1395,7 +2401,10 @@ class PostgresDatabase:
             logger.error(f"Error updating chat settings {chat_id}: {e}")
     
     async def is_banned(self, user_id: int) -> bool:
-        """Check if user is banned"""
+        """Check if user is banned (answered from the ban registry once it is loaded)"""
+        banned = get_ban_registry().is_banned(user_id)
+        if banned is not None:
+            return banned
         try:
             async with self.pool.acquire() as conn:
                 row = await conn.fetchrow("""
@@ -1416,12 +2425,14 @@ class PostgresDatabase:
                         SET is_banned = TRUE, banned_at = CURRENT_TIMESTAMP
                         WHERE user_id = $1
                     """, user_id)
+                    get_ban_registry().add(user_id)
                 else:
                     await conn.execute("""
                         UPDATE users 
                         SET last_temp_ban = CURRENT_TIMESTAMP
                         WHERE user_id = $1
                     """, user_id)
+            get_user_cache().invalidate(user_id)
             return True
         except Exception as e:
             logger.error(f"Error banning user {user_id}: {e}")
@@ -1435,11 +2446,27 @@ class PostgresDatabase:
                     "UPDATE users SET is_banned = FALSE WHERE user_id = $1",
                     user_id
                 )
+                get_ban_registry().discard(user_id)
+                get_user_cache().invalidate(user_id)
                 # Check if any row was affected
                 return result.split()[-1] != '0'  # Returns True if rows were affected
         except Exception as e:
             logger.error(f"Error unbanning user {user_id}: {e}")
             return False
+
+    async def unban_all_users(self) -> int:
+        """Lift every permanent ban; returns how many users were unbanned"""
+        try:
+            async with self.pool.acquire() as conn:
+                result = await conn.execute(
+                    "UPDATE users SET is_banned = FALSE, banned_at = NULL WHERE is_banned = TRUE"
+                )
+            get_ban_registry().clear()
+            get_user_cache().invalidate()
+            return int(result.split()[-1])
+        except Exception as e:
+            logger.error(f"Error unbanning all users: {e}")
+            return 0
     
     async def remove_sudo(self, user_id: int):
         """Remove sudo privileges from a user"""
@@ -1449,6 +2476,7 @@ class PostgresDatabase:
                     "UPDATE users SET sudo = FALSE WHERE user_id = $1",
                     user_id
                 )
+                get_user_cache().invalidate(user_id)
                 # Check if any row was affected
                 return result.split()[-1] != '0'  # Returns True if rows were affected
         except Exception as e:
@@ -1463,6 +2491,7 @@ class PostgresDatabase:
                     "UPDATE users SET og = FALSE WHERE user_id = $1",
                     user_id
                 )
+                get_user_cache().invalidate(user_id)
                 # Check if any row was affected
                 return result.split()[-1] != '0'  # Returns True if rows were affected
         except Exception as e:
@@ -1508,10 +2537,15 @@ class PostgresDatabase:
                 "UPDATE users SET collection_preferences = $1 WHERE user_id = $2",
                 json.dumps(preferences), user_id
             )
+        get_user_cache().invalidate(user_id)
     
     async def close(self):
         """Close the database connection"""
         global _pg_pool
+        # Write out queued transaction rows while the pool is still open
+        await get_transaction_log().close()
+        await get_character_catalog().stop_listening()
+        await get_ban_registry().stop_listening()
         if _pg_pool:
             await _pg_pool.close()
             _pg_pool = None
@@ -1520,7 +2554,7 @@ class PostgresDatabase:
     async def find_one(self, query: dict, projection: dict = None) -> Optional[Dict]:
         """MongoDB-style find_one method"""
         if 'user_id' in query:
-            return await self.get_user(query['user_id'])
+            return await self.get_user(query['user_id'], fields=_projection_fields(projection))
         elif 'character_id' in query:
             return await self.get_character(query['character_id'])
         elif 'chat_id' in query:
@@ -1539,10 +2573,17 @@ class PostgresDatabase:
         push_fields = update.get('$push', {})
         updates = []
         params = []
+        # Ownership changes go to user_characters instead of the users row,
+        # and collection_history appends go to collection_events
+        replace_characters = None
+        added_characters = []
+        history_entries = []
         # $set
         for k, v in set_fields.items():
             param_idx = len(params) + 1
-            if '.' in k:
+            if k == 'characters':
+                replace_characters = list(v or [])
+            elif '.' in k:
                 field, subkey = k.split('.', 1)
                 # Always cast to text for jsonb_set to avoid polymorphic type errors
                 updates.append(f"{field} = jsonb_set(COALESCE({field}, '{{}}'::jsonb), '{{{subkey}}}', to_jsonb(${param_idx}::text), true)")
@@ -1567,9 +2608,9 @@ class PostgresDatabase:
             if isinstance(v, dict) and '$each' in v:
                 values = v['$each']
                 if k == 'characters':
-                    # For integer[] fields, use array concatenation
-                    updates.append(f"{k} = COALESCE({k}, ARRAY[]::integer[]) || ${param_idx}::integer[]")
-                    params.append(values)
+                    added_characters.extend(values)
+                elif k == 'collection_history':
+                    history_entries.extend(values)
                 else:
                     # Default to jsonb array append - convert to JSON string first
                     import json
@@ -1593,20 +2634,35 @@ class PostgresDatabase:
                     updates.append(f"{field} = jsonb_set(COALESCE({field}, '{{}}'::jsonb), '{{{subkey}}}', (COALESCE({field}->'{subkey}', '[]'::jsonb) || to_jsonb(${param_idx}::text)), true)")
                     params.append(v if isinstance(v, str) else str(v))
                 elif k == 'characters':
-                    # For integer[] fields, use array_append
-                    updates.append(f"{k} = array_append(COALESCE({k}, ARRAY[]::integer[]), ${param_idx}::integer)")
-                    params.append(v)
+                    added_characters.append(v)
+                elif k == 'collection_history':
+                    history_entries.append(v)
                 else:
                     # Default to jsonb array append
                     updates.append(f"{k} = COALESCE({k}, '[]'::jsonb) || to_jsonb(${param_idx})")
                     params.append(v)
-        if not updates:
+        if not updates and replace_characters is None and not added_characters and not history_entries:
             return False
         param_idx = len(params) + 1
         sql = f"UPDATE users SET {', '.join(updates)} WHERE user_id = ${param_idx}"
         params.append(user_id)
         async with self.pool.acquire() as conn:
-            await conn.execute(sql, *params)
+            async with conn.transaction():
+                if replace_characters is not None or added_characters:
+                    await self._migrate_user_characters(conn, user_id)
+                    if replace_characters is not None:
+                        await self._replace_user_characters(conn, user_id, replace_characters)
+                    if added_characters:
+                        await self._add_user_characters(conn, user_id, added_characters)
+                if updates:
+                    await conn.execute(sql, *params)
+                if history_entries:
+                    now = datetime.utcnow()
+                    events = (_history_entry_to_event(user_id, e, now) for e in history_entries)
+                    await _insert_collection_events(conn, [e for e in events if e])
+        get_user_cache().invalidate(user_id)
+        if replace_characters is not None or added_characters:
+            get_collection_views().invalidate(user_id)
         return True
     
     async def find(self, query: dict = None, projection: dict = None):
@@ -1641,7 +2697,10 @@ class PostgresDatabase:
         elif 'characters' in query:
             # Count users with specific character
             async with self.pool.acquire() as conn:
-                result = await conn.fetchrow("SELECT COUNT(*) FROM users WHERE $1 = ANY(characters::int[])", query['characters'])
+                result = await conn.fetchrow("""
+                    SELECT (SELECT COUNT(*) FROM user_characters WHERE character_id = $1)
+                         + (SELECT COUNT(*) FROM users WHERE $1 = ANY(characters))
+                """, query['characters'])
                 return result[0] if result else 0
         else:
             # Count all records in the appropriate table
@@ -1660,13 +2719,15 @@ class PostgresDatabase:
             return result[0] if result else 0
         
     async def get_character_collectors(self, character_id: int) -> list:
-        """Return a list of users who have collected the given character_id."""
+        """Return a list of users (user_id, count) who have collected the given character_id."""
         try:
             async with self.pool.acquire() as conn:
-                rows = await conn.fetch(
-                    "SELECT user_id, characters FROM users WHERE $1 = ANY(characters)",
-                    character_id
-                )
+                rows = await conn.fetch("""
+                    SELECT user_id, count FROM user_characters WHERE character_id = $1
+                    UNION ALL
+                    SELECT user_id, (SELECT COUNT(*) FROM unnest(characters) AS c WHERE c = $1) AS count
+                    FROM users WHERE $1 = ANY(characters)
+                """, int(character_id))
                 return [dict(row) for row in rows]
         except Exception as e:
             logger.error(f"Error in get_character_collectors for character {character_id}: {e}")
@@ -1679,11 +2740,15 @@ class PostgresDatabase:
             async with self.pool.acquire() as conn:
                 rows = await conn.fetch(
                     """
-                    SELECT user_id, first_name AS name, username,
-                        (SELECT COUNT(*) FROM unnest(characters) AS c WHERE c = $1) AS count
-                    FROM users
-                    WHERE $1 = ANY(characters)
-                    ORDER BY count DESC
+                    SELECT u.user_id, u.first_name AS name, u.username, o.count
+                    FROM (
+                        SELECT user_id, count FROM user_characters WHERE character_id = $1
+                        UNION ALL
+                        SELECT user_id, (SELECT COUNT(*) FROM unnest(characters) AS c WHERE c = $1)
+                        FROM users WHERE $1 = ANY(characters)
+                    ) o
+                    JOIN users u ON u.user_id = o.user_id
+                    ORDER BY o.count DESC
                     LIMIT $2
                     """,
                     char_id_int, limit
@@ -1698,25 +2763,19 @@ class PostgresDatabase:
         try:
             char_id_int = int(character_id)
             async with self.pool.acquire() as conn:
-                # First check if groups column exists, if not return empty list
-                column_check = await conn.fetchrow("""
-                    SELECT column_name FROM information_schema.columns 
-                    WHERE table_name = 'users' AND column_name = 'groups'
-                """)
-                
-                if not column_check:
-                    # If groups column doesn't exist, return empty list
-                    return []
-                
                 # Get users in the group who have collected this character
                 rows = await conn.fetch(
                     """
-                    SELECT user_id, first_name AS name, username,
-                        (SELECT COUNT(*) FROM unnest(characters) AS c WHERE c = $1) AS count
-                    FROM users
-                    WHERE $1 = ANY(characters)
-                    AND $2::bigint = ANY(groups)
-                    ORDER BY count DESC
+                    SELECT u.user_id, u.first_name AS name, u.username, o.count
+                    FROM (
+                        SELECT user_id, count FROM user_characters WHERE character_id = $1
+                        UNION ALL
+                        SELECT user_id, (SELECT COUNT(*) FROM unnest(characters) AS c WHERE c = $1)
+                        FROM users WHERE $1 = ANY(characters)
+                    ) o
+                    JOIN group_members gm ON gm.chat_id = $2::bigint AND gm.user_id = o.user_id
+                    JOIN users u ON u.user_id = o.user_id
+                    ORDER BY o.count DESC
                     """,
                     char_id_int, chat_id
                 )
@@ -1725,48 +2784,48 @@ class PostgresDatabase:
             logger.error(f"Error in get_group_collectors for character {character_id} in group {chat_id}: {e}")
             return []
     
+    async def get_todays_collect_counts(self, sources=('collected',)):
+        """Every user's count of today's (UTC) events from `sources` (seeds the in-memory tdtop counters)"""
+        today_utc = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        try:
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch("""
+                    SELECT e.user_id, u.first_name, e.count
+                    FROM (
+                        SELECT user_id, COUNT(*) AS count
+                        FROM collection_events
+                        WHERE collected_at >= $1 AND collected_at < $2
+                          AND source = ANY($3::text[])
+                        GROUP BY user_id
+                    ) e
+                    LEFT JOIN users u ON u.user_id = e.user_id
+                """, today_utc, today_utc + timedelta(days=1), list(sources))
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting today's collect counts: {e}")
+            return []
+
     async def get_todays_top_collectors(self, limit: int = 10):
-        """Get today's top collectors efficiently using JSONB queries."""
+        """Get today's top collectors from today's collection_events partition."""
         try:
             # Use UTC only for simplicity and consistency
-            from datetime import datetime, timedelta
-            
-            # Get current UTC time and calculate today's boundaries
             utc_now = datetime.utcnow()
             today_utc = utc_now.replace(hour=0, minute=0, second=0, microsecond=0)
             tomorrow_utc = today_utc + timedelta(days=1)
             
             query = """
-            SELECT 
-                u.user_id,
-                u.first_name,
-                COUNT(*) as today_count
-            FROM users u,
-            LATERAL jsonb_array_elements(
-                CASE 
-                    WHEN jsonb_typeof(u.collection_history) = 'array' THEN 
-                        COALESCE(u.collection_history, '[]'::jsonb)
-                    ELSE 
-                        '[]'::jsonb
-                END
-            ) AS entry
-            WHERE 
-                entry->>'source' = 'collected'
-                AND entry->>'collected_at' IS NOT NULL
-                AND (
-                    -- Handle both timestamp and string formats
-                    CASE 
-                        WHEN jsonb_typeof(entry->'collected_at') = 'string' THEN
-                            (entry->>'collected_at')::timestamp >= $1
-                            AND (entry->>'collected_at')::timestamp < $2
-                        ELSE
-                            (entry->>'collected_at')::timestamp >= $1
-                            AND (entry->>'collected_at')::timestamp < $2
-                    END
-                )
-            GROUP BY u.user_id, u.first_name
-            ORDER BY today_count DESC
-            LIMIT $3
+            SELECT e.user_id, u.first_name, e.today_count
+            FROM (
+                SELECT user_id, COUNT(*) AS today_count
+                FROM collection_events
+                WHERE collected_at >= $1 AND collected_at < $2
+                  AND source = 'collected'
+                GROUP BY user_id
+                ORDER BY today_count DESC
+                LIMIT $3
+            ) e
+            JOIN users u ON u.user_id = e.user_id
+            ORDER BY e.today_count DESC
             """
             
             async with self.pool.acquire() as conn:
@@ -1920,7 +2979,12 @@ class PostgresCursor:
             param_count += 1
             sql = "SELECT * FROM users WHERE og = $" + str(param_count)
             params.append(self.query['og'])
-        
+        elif 'groups' in self.query:
+            param_count += 1
+            sql = ("SELECT * FROM users WHERE user_id IN "
+                   "(SELECT user_id FROM group_members WHERE chat_id = $" + str(param_count) + ")")
+            params.append(self.query['groups'])
+
         # Add sorting
         if self.sort_field:
             sql += f" ORDER BY {self.sort_field}"
@@ -1935,7 +2999,10 @@ class PostgresCursor:
         
         async with self.db.pool.acquire() as conn:
             results = await conn.fetch(sql, *params)
-            return [dict(row) for row in results]
+            rows = [dict(row) for row in results]
+            if sql.startswith("SELECT * FROM users"):
+                await self.db._attach_owned_characters(conn, rows)
+            return rows
         
 
 class PostgresAggregationCursor:
@@ -1962,6 +3029,8 @@ class PostgresAggregationCursor:
                     async with self.db.pool.acquire() as conn:
                         # Count occurrences of this character in each user's collection
                         sql = """
+                            SELECT user_id, count FROM user_characters WHERE character_id = $1
+                            UNION ALL
                             SELECT user_id, 
                                    (SELECT COUNT(*) FROM unnest(characters) AS c WHERE c = $1) as count
                             FROM users 
@@ -2041,6 +3110,9 @@ async def restart_connection_pool():
         
         # Update database instance
         _db_instance = PostgresDatabase()
+        get_transaction_log().start(_pg_pool)
+        get_character_catalog().start_listening(_postgres_uri, _pg_pool)
+        get_ban_registry().start_listening(_postgres_uri, _pg_pool)
         
         logger.info("PostgreSQL connection pool restarted successfully")
         
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.character_catalog import CharacterCatalog
+from modules.character_index import CharacterIdIndex
+
+RARITY_NAMES = [
+    "Common", "Medium", "Rare", "Legendary", "Exclusive", "Elite", "Limited Edition",
+    "Ultimate", "Supreme", "Zenith", "Ethereal", "Mythic", "Premium"
+]
+CATALOG_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+ROUNDS = 200
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    return (
+        statistics.median(samples) * 1000,
+        samples[int(len(samples) * 0.99) - 1] * 1000
+    )
+
+
+def _synthetic_catalog(size):
+    return [(i, random.choice(RARITY_NAMES)) for i in range(1, size + 1)]
+
+
+def _index_for(pairs):
+    """An ID index over a standalone catalog holding the given (character_id, rarity) pairs"""
+    catalog = CharacterCatalog()
+    for character_id, rarity in pairs:
+        catalog.put({'character_id': character_id, 'rarity': rarity})
+    index = CharacterIdIndex(catalog)
+    index.sync()
+    return index
+
+
+def bench_index(size):
+    """Latency of the in-memory ID index for one catalog size"""
+    index = _index_for(_synthetic_catalog(size))
+    timings = {}
+    cases = {
+        'single (all)': dict(),
+        'single (2 rarities)': dict(rarities=['Elite', 'Ultimate']),
+        'excluding 2, count=10': dict(excluded=['Common', 'Medium'], count=10),
+    }
+    for name, kwargs in cases.items():
+        samples = []
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            index.sample(**kwargs)
+            samples.append(time.perf_counter() - start)
+        timings[name] = _percentiles(samples)
+    return timings
+
+
+async def bench_postgres(uri, size):
+    """ORDER BY RANDOM() vs index + primary-key fetch on a temp table of `size` rows"""
+    import asyncpg
+    conn = await asyncpg.connect(uri)
+    try:
+        await conn.execute("""
+            CREATE TEMP TABLE bench_characters AS
+            SELECT g AS character_id,
+                   'Character ' || g AS name,
+                   ($1::text[])[1 + (g % 13)] AS rarity,
+                   'https://example.invalid/' || g AS img_url
+            FROM generate_series(1, $2::int) g
+        """, RARITY_NAMES, size)
+        await conn.execute("ALTER TABLE bench_characters ADD PRIMARY KEY (character_id)")
+        await conn.execute("ANALYZE bench_characters")
+
+        rows = await conn.fetch("SELECT character_id, rarity FROM bench_characters")
+        index = _index_for((r['character_id'], r['rarity']) for r in rows)
+
+        order_by_random, indexed = [], []
+        for _ in range(min(ROUNDS, 50)):
+            start = time.perf_counter()
+            await conn.fetchrow("""
+                SELECT * FROM bench_characters
+                WHERE rarity = ANY($1::text[])
+                ORDER BY RANDOM() LIMIT 1
+            """, ['Elite', 'Ultimate'])
+            order_by_random.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            ids = [r['character_id'] for r in index.sample(['Elite', 'Ultimate'])]
+            await conn.fetch("SELECT * FROM bench_characters WHERE character_id = ANY($1::int[])", ids)
+            indexed.append(time.perf_counter() - start)
+        return _percentiles(order_by_random), _percentiles(indexed)
+    finally:
+        await conn.execute("DROP TABLE IF EXISTS bench_characters")
+        await conn.close()
+
+
+async def main():
+    print("=== In-memory ID index (median / p99 ms) ===")
+    for size in CATALOG_SIZES:
+        timings = bench_index(size)
+        cells = ", ".join(f"{name}: {med:.4f}/{p99:.4f}" for name, (med, p99) in timings.items())
+        print(f"{size:>9,} characters -> {cells}")
+
+    uri = os.environ.get('BENCH_POSTGRES_URI')
+    if not uri:
+        print("\nSet BENCH_POSTGRES_URI to compare against ORDER BY RANDOM() in PostgreSQL.")
+        return
+    print("\n=== PostgreSQL, 2-rarity pick (median / p99 ms) ===")
+    for size in CATALOG_SIZES[:3]:
+        (rand_med, rand_p99), (idx_med, idx_p99) = await bench_postgres(uri, size)
+        print(f"{size:>9,} characters -> ORDER BY RANDOM(): {rand_med:.2f}/{rand_p99:.2f}, "
+              f"index + PK fetch: {idx_med:.2f}/{idx_p99:.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -4,10 +4,12 @@ import os
 
 # Import database based on configuration
 from modules.postgres_database import get_database, RARITIES, RARITY_EMOJIS, get_rarity_display
+from modules.character_search import get_character_search, page_by_id
 import re
 from bson import ObjectId
 
 RESULTS_LIMIT = 50  # Telegram's maximum per page
+RARITY_CURSOR_PREFIX = "r"  # marks cursors of the rarity fallback listing
 
 def create_inline_result(character):
     rarity = character.get('rarity', 'Unknown')
@@ -67,29 +69,22 @@ async def search_command(client: Client, message: Message):
 async def inline_query_handler(client: Client, inline_query: InlineQuery):
     db = get_database()
     query = inline_query.query.lower().strip()
-    offset = inline_query.offset
+    # PostgreSQL pages are keyset cursors; MongoDB still pages by offset
+    cursor = inline_query.offset or ""
     results = []
     # Parse offset
     try:
-        offset = int(offset) if offset else 0
+        offset = int(cursor) if cursor else 0
     except ValueError:
         offset = 0
     
     # If no query, show all characters sorted by ID
     if not query:
-        if hasattr(db, 'pool'):  # PostgreSQL
-            async with db.pool.acquire() as conn:
-                # Get total count
-                count_result = await conn.fetchrow("SELECT COUNT(*) FROM characters")
-                total_count = count_result[0] if count_result else 0
-                
-                # Get characters for current page
-                characters = await conn.fetch(
-                    "SELECT * FROM characters ORDER BY character_id LIMIT $1 OFFSET $2",
-                    RESULTS_LIMIT, offset
-                )
-                for character in characters:
-                    results.append(create_inline_result(character))
+        if hasattr(db, 'pool'):  # PostgreSQL (in-memory catalog)
+            catalog = await db.get_catalog()
+            characters, next_offset = page_by_id(catalog.all(), cursor, RESULTS_LIMIT)
+            for character in characters:
+                results.append(create_inline_result(character))
         else:  # MongoDB
             cursor = db.characters.find().sort("character_id", 1)
             if offset > 0:
@@ -98,8 +93,8 @@ async def inline_query_handler(client: Client, inline_query: InlineQuery):
             async for character in cursor:
                 results.append(create_inline_result(character))
             total_count = await db.characters.count_documents({})
+            next_offset = str(offset + RESULTS_LIMIT) if offset + RESULTS_LIMIT < total_count else ""
         
-        next_offset = str(offset + RESULTS_LIMIT) if offset + RESULTS_LIMIT < total_count else ""
         if not results:
             results.append(InlineQueryResultArticle(
                 id="no_results",
@@ -116,8 +111,7 @@ async def inline_query_handler(client: Client, inline_query: InlineQuery):
     try:
         char_id = int(query)
         if hasattr(db, 'pool'):  # PostgreSQL
-            async with db.pool.acquire() as conn:
-                character = await conn.fetchrow("SELECT * FROM characters WHERE character_id = $1", char_id)
+            character = await db.get_character(char_id)
         else:  # MongoDB
             character = await db.characters.find_one({"character_id": char_id})
         
@@ -130,39 +124,28 @@ async def inline_query_handler(client: Client, inline_query: InlineQuery):
     
     # Search by name
     if hasattr(db, 'pool'):  # PostgreSQL
-        async with db.pool.acquire() as conn:
-            # Search by name
-            characters = await conn.fetch(
-                "SELECT * FROM characters WHERE LOWER(name) LIKE $1 ORDER BY rarity DESC LIMIT $2 OFFSET $3",
-                f"%{query}%", RESULTS_LIMIT, offset
-            )
-            for character in characters:
-                results.append(create_inline_result(character))
-            
-            # Get total count for name search
-            count_result = await conn.fetchrow(
-                "SELECT COUNT(*) FROM characters WHERE LOWER(name) LIKE $1",
-                f"%{query}%"
-            )
-            total_count = count_result[0] if count_result else 0
-            
-            # If no results, try by rarity
-            if not results:
-                for rarity in RARITIES.keys():
-                    if rarity.lower().startswith(query):
-                        characters = await conn.fetch(
-                            "SELECT * FROM characters WHERE rarity = $1 ORDER BY character_id LIMIT $2 OFFSET $3",
-                            rarity, RESULTS_LIMIT, offset
-                        )
-                        for character in characters:
-                            results.append(create_inline_result(character))
-                        
-                        count_result = await conn.fetchrow(
-                            "SELECT COUNT(*) FROM characters WHERE rarity = $1",
-                            rarity
-                        )
-                        total_count = count_result[0] if count_result else 0
-                        break
+        try:
+            catalog = await db.get_catalog()
+            # Ranked fuzzy match; repeated keystrokes and later pages come from the result cache
+            characters, next_offset, _ = get_character_search().page(query, cursor, RESULTS_LIMIT)
+        except Exception:
+            # Catalog unavailable: same ranking from the pg_trgm index
+            catalog = None
+            characters, next_offset = await db.search_characters_by_name(query, RESULTS_LIMIT, cursor)
+        for character in characters:
+            results.append(create_inline_result(character))
+        
+        # If no results, try by rarity
+        if not results and catalog is not None:
+            for rarity in RARITIES.keys():
+                if rarity.lower().startswith(query):
+                    rarity_cursor = cursor[len(RARITY_CURSOR_PREFIX):] if cursor.startswith(RARITY_CURSOR_PREFIX) else ""
+                    characters, next_offset = page_by_id(catalog.by_rarity(rarity), rarity_cursor, RESULTS_LIMIT)
+                    for character in characters:
+                        results.append(create_inline_result(character))
+                    if next_offset:
+                        next_offset = RARITY_CURSOR_PREFIX + next_offset
+                    break
     else:  # MongoDB
         name_query = {"name": {"$regex": query, "$options": "i"}}
         cursor = db.characters.find(name_query).sort("rarity", -1)
@@ -186,10 +169,10 @@ async def inline_query_handler(client: Client, inline_query: InlineQuery):
                         results.append(create_inline_result(character))
                     total_count = await db.characters.count_documents(rarity_query)
                     break
+        next_offset = str(offset + RESULTS_LIMIT) if offset + RESULTS_LIMIT < total_count else ""
     
     # Ensure we don't exceed Telegram's limit
     results = results[:RESULTS_LIMIT]
-    next_offset = str(offset + RESULTS_LIMIT) if offset + RESULTS_LIMIT < total_count else ""
     
     if not results:
         results.append(InlineQueryResultArticle(
@@ -130,21 +130,13 @@ async def show_rarity_list(callback_query: CallbackQuery, rarity: str, page: int
     items_per_page = 15
     try:
         # Use SQL query for PostgreSQL instead of MongoDB find()
-        if hasattr(db, 'pool'):  # PostgreSQL
-            async with db.pool.acquire() as conn:
-                # Get total count
-                count_result = await conn.fetchrow(
-                    "SELECT COUNT(*) FROM characters WHERE rarity = $1",
-                    rarity
-                )
-                total = count_result[0] if count_result else 0
-                
-                # Get characters for current page
-                offset = (page - 1) * items_per_page
-                characters = await conn.fetch(
-                    "SELECT character_id, name FROM characters WHERE rarity = $1 ORDER BY character_id LIMIT $2 OFFSET $3",
-                    rarity, items_per_page, offset
-                )
+        if hasattr(db, 'pool'):  # PostgreSQL (in-memory catalog)
+            rarity_chars = (await db.get_catalog()).by_rarity(rarity)
+            total = len(rarity_chars)
+            
+            # Get characters for current page
+            offset = (page - 1) * items_per_page
+            characters = rarity_chars[offset:offset + items_per_page]
         else:  # MongoDB
             characters = await db.characters.find({'rarity': rarity}, {'character_id': 1, 'name': 1}).sort('character_id', 1).to_list(None)
             total = len(characters)
@@ -4,6 +4,7 @@ from .decorators import check_banned
 from .logging_utils import send_new_user_log, send_new_group_log
 # Import database based on configuration
 from modules.postgres_database import get_database
+from modules.group_membership import get_membership_snapshots
 import random
 from datetime import datetime
 
@@ -60,7 +61,7 @@ async def start_command(client: Client, message: Message):
     
     # Check if user exists (only if database is available)
     if db:
-        existing_user = await db.get_user(user.id)
+        existing_user = await db.get_user(user.id, fields=())
         is_new_user = not existing_user
         
         if is_new_user:
@@ -123,7 +124,11 @@ async def new_chat_members(client: Client, message: Message):
     # Check if bot was added
     new_members = message.new_chat_members
     bot_id = (await client.get_me()).id
+    snapshots = get_membership_snapshots()
     
+    for member in new_members:
+        if not member.is_bot:
+            snapshots.add_member(message.chat.id, member.id)
     for member in new_members:
         if member.id == bot_id:
             # Bot was added to the group
@@ -146,6 +151,16 @@ async def new_chat_members(client: Client, message: Message):
             
             break
 
+async def left_chat_member(client: Client, message: Message):
+    """Keep group membership in step when someone leaves or is removed"""
+    member = message.left_chat_member
+    if member.id == (await client.get_me()).id:
+        get_membership_snapshots().invalidate(message.chat.id)
+        return
+    get_membership_snapshots().remove_member(message.chat.id, member.id)
+    db = get_database()
+    await db.remove_user_from_group(member.id, message.chat.id)
+
 async def help_callback(client: Client, callback_query: CallbackQuery):
     """Handle help button callback"""
     help_text = (
@@ -230,4 +245,5 @@ def setup_start_handlers(app: Client):
     app.on_callback_query(filters.regex("^help$"))(help_callback)
     app.on_callback_query(filters.regex("^back$"))(back_callback)
     app.on_message(filters.new_chat_members)(new_chat_members)
+    app.on_message(filters.left_chat_member)(left_chat_member)
     print("All start handlers registered successfully!")
\ No newline at end of file
@@ -6,6 +6,8 @@ import os
 # Import database based on configuration
 
 from modules.postgres_database import get_database, RARITY_EMOJIS, RARITIES
+from modules.user_cache import get_user_cache
+from modules.user_fetch_report import get_user_fetch_report
 
 from datetime import datetime, timedelta
 from config import BOT_VERSION
@@ -69,20 +71,20 @@ async def stats_command(client: Client, message: Message):
         
         if hasattr(db, 'pool'):  # PostgreSQL
             async with db.pool.acquire() as conn:
-                # Get total groups using union of chat_settings and users.groups
+                # Get total groups using union of chat_settings and group_members
                 try:
                     groups_result = await conn.fetchrow(
                         """
                         SELECT COUNT(*) FROM (
                             SELECT chat_id FROM chat_settings
                             UNION
-                            SELECT DISTINCT unnest(groups) AS chat_id FROM users WHERE groups IS NOT NULL
+                            SELECT DISTINCT chat_id FROM group_members
                         ) t
                         """
                     )
                     total_groups = groups_result[0] if groups_result else 0
                 except Exception:
-                    # Fallback to chat_settings only if users.groups not available
+                    # Fallback to chat_settings only if group_members not available
                     groups_result = await conn.fetchrow("SELECT COUNT(*) FROM chat_settings")
                     total_groups = groups_result[0] if groups_result else 0
                 
@@ -90,38 +92,26 @@ async def stats_command(client: Client, message: Message):
                 users_result = await conn.fetchrow("SELECT COUNT(*) FROM users")
                 total_users = users_result[0] if users_result else 0
                 
-                # Get total characters
-                chars_result = await conn.fetchrow("SELECT COUNT(*) FROM characters")
-                total_characters = chars_result[0] if chars_result else 0
+                # Character totals come from the in-memory catalog
+                catalog = await db.get_catalog()
+                total_characters = catalog.count()
                 
                 # Get total harem count (sum of all characters in users' collections)
                 harem_result = await conn.fetchrow("""
-                    SELECT COALESCE(SUM(
-                        CASE 
-                            WHEN characters IS NOT NULL AND array_length(characters, 1) IS NOT NULL
-                            THEN array_length(characters, 1)
-                            ELSE 0
-                        END
-                    ), 0) FROM users
+                    SELECT (SELECT COALESCE(SUM(count), 0) FROM user_characters)
+                         + (SELECT COALESCE(SUM(array_length(characters, 1)), 0) FROM users
+                            WHERE characters IS NOT NULL)
                 """)
                 total_harem = harem_result[0] if harem_result else 0
                 
                 # Get character count by rarity
-                rarity_counts_result = await conn.fetch("""
-                    SELECT rarity, COUNT(*) as count 
-                    FROM characters 
-                    GROUP BY rarity 
-                    ORDER BY rarity
-                """)
-                rarity_counts = [{'count': row['count'], '_id': row['rarity']} for row in rarity_counts_result]
+                rarity_counts = [
+                    {'count': count, '_id': rarity}
+                    for rarity, count in sorted(catalog.rarity_counts().items(), key=lambda item: item[0] or '')
+                ]
                 
                 # Get latest characters
-                latest_chars_result = await conn.fetch("""
-                    SELECT name FROM characters 
-                    ORDER BY character_id DESC 
-                    LIMIT 5
-                """)
-                latest_chars = [{'name': row['name']} for row in latest_chars_result]
+                latest_chars = [{'name': row['name']} for row in catalog.latest(5)]
                 
         else:  # MongoDB
             # Get total groups using union of chat_settings and users.groups
@@ -234,6 +224,37 @@ async def stats_command(client: Client, message: Message):
             "<b>❌ An error occurred while getting stats!</b>"
         )
 
+async def fetch_report_command(client: Client, message: Message):
+    """Show bytes and latency of user row fetches per call site (owner only)"""
+    if not is_owner(message.from_user.id):
+        await message.reply_text("<b>❌ This command is restricted to the owner only!</b>")
+        return
+    report = get_user_fetch_report()
+    if len(message.command) > 1 and message.command[1].lower() == 'reset':
+        report.reset()
+        await message.reply_text("✅ User fetch report reset.")
+        return
+    rows = report.summary()
+    if not rows:
+        await message.reply_text("No user fetches recorded yet.")
+        return
+    since = datetime.utcfromtimestamp(report.started_at).strftime("%Y-%m-%d %H:%M UTC")
+    cache = get_user_cache().stats()
+    lines = [
+        "<b>📦 User fetches by call site</b>",
+        f"Full row ≈ <code>{report.full_row_bytes:,.0f}</code> bytes",
+        f"User cache: <code>{cache['hit_rate']:.1%}</code> hit rate "
+        f"({cache['hits']:,} hits, {cache['coalesced']:,} coalesced, {cache['misses']:,} misses)\n",
+    ]
+    for row in rows:
+        lines.append(
+            f"<code>{row['site']}</code>\n"
+            f"  {row['calls']:,} calls ({row['projected']:,} projected) · "
+            f"{row['avg_bytes']:,.0f} B · {row['avg_ms']:.2f} ms · saved {row['saved_bytes'] / 1024:,.1f} KB"
+        )
+    lines.append(f"\n<i>Since {since}</i>")
+    await message.reply_text("\n".join(lines))
+
 def setup_stats_handlers(application):
     """Setup stats command handler"""
     application.add_handler(stats_command)
@@ -10,7 +10,25 @@ from datetime import datetime
 import random
 import asyncio
 from modules.collection import batch_fetch_characters
-import time
+from modules.leaderboard import get_leaderboard_service
+from modules.group_membership import get_membership_snapshots
+from modules.drop_state import get_drop_states
+from modules.decorators import is_owner
+
+def format_drop_state_memory(chat_id=None) -> str:
+    """Owner footer: drop state registry size, ingestion counters and this chat's share"""
+    drop_states = get_drop_states()
+    stats = drop_states.stats()
+    text = "\n\n━━━━━━━━━━━━━━━\n"
+    text += f"━|🧠| Drop State → {stats['chats']:,}/{stats['max_chats']:,} chats, {stats['bytes'] / 1024:.1f} KB\n"
+    text += f"━|⏱| Live Drops → {stats['drops']:,} ({stats['timers']:,} timers, {stats['evictions']:,} evicted)"
+    from modules.drop import message_pipeline
+    ingest = message_pipeline.stats()
+    text += f"\n━|📨| Ingestion → {ingest['processed']:,} handled, {ingest['shed']:,} shed, {ingest['queued']:,} queued"
+    state = drop_states.get(chat_id) if chat_id is not None else None
+    if state is not None:
+        text += f"\n━|💬| This Chat → {state.memory_bytes():,} bytes"
+    return text
 
 # Remove @check_banned so banned users can use status
 async def status_command(client: Client, message: Message):
@@ -42,9 +60,7 @@ async def status_command(client: Client, message: Message):
         unique_collected = len(unique_ids)
         
         if hasattr(db, 'pool'):  # PostgreSQL
-            async with db.pool.acquire() as conn:
-                all_characters_result = await conn.fetchrow("SELECT COUNT(*) FROM characters")
-                all_characters = all_characters_result[0] if all_characters_result else 0
+            all_characters = (await db.get_catalog()).count()
         else:  # MongoDB
             all_characters = await db.characters.count_documents({})
         
@@ -75,79 +91,23 @@ async def status_command(client: Client, message: Message):
         progress_percentage = (unique_collected / all_characters) * 100 if all_characters else 0
         progress = int((progress_percentage / 100) * 10)
         progress_bar = "▰" * progress + "▱" * (10 - progress)
-        # Simple in-memory cache for global position (PostgreSQL version)
-        _global_position_cache = {'users': [], 'time': 0}
-        _CACHE_TTL = 60  # seconds
-        now = time.time()
-        users = []
-        if hasattr(db, 'pool'):
-            if _global_position_cache['users'] and now - _global_position_cache['time'] < _CACHE_TTL:
-                users = _global_position_cache['users']
-            else:
-                try:
-                    async with db.pool.acquire() as conn:
-                        rows = await conn.fetch("SELECT user_id, array_length(characters, 1) AS total_count FROM users ORDER BY total_count DESC NULLS LAST")
-                        users = [row['user_id'] for row in rows]
-                        _global_position_cache['users'] = users
-                        _global_position_cache['time'] = now
-                except Exception as e:
-                    pass
-                    users = []
-                    _global_position_cache['users'] = users
-                    _global_position_cache['time'] = now
-        else:
-            # Fallback for MongoDB (should not be used)
-            users = []
-        global_position = users.index(user.id) + 1 if users and user.id in users else "N/A"
+        # Global position from the leaderboard service (bisect over cached scores)
+        try:
+            global_position = await get_leaderboard_service().rank(db, 'total', total_collected) if total_collected else "N/A"
+        except Exception:
+            global_position = "N/A"
         
-        # Calculate chat position (group-specific position) using exact same logic as top command
+        # Calculate chat position (group-specific position) with the same member set as the top command
         chat_position = "N/A"
         if is_group:
             try:
-                # First, ensure the current user is added to this group (same as top command)
                 await db.add_user_to_group(user.id, message.chat.id)
-                
-                # Get all users who are members of this specific group (same query as top command)
-                cursor = await db.users.find({"groups": message.chat.id})
-                group_users = await cursor.to_list(length=None)
-                
-                pass
-                
-
-                # Always include the current user in the group collectors list
-                collectors = []
-                user_in_group = False
-                for group_user in group_users:
-                    if group_user['user_id'] == user.id:
-                        user_in_group = True
-                    characters = group_user.get('characters', [])
-                    total_chars = len(characters) if characters else 0
-                    collectors.append({
-                        'user_id': group_user['user_id'],
-                        'total_count': total_chars
-                    })
-                if not user_in_group:
-                    # Add current user if not present
-                    collectors.append({
-                        'user_id': user.id,
-                        'total_count': len(user_data.get('characters', []))
-                    })
-                pass
-                pass
-                pass
-                # Sort by total characters collected (same as top command)
-                collectors_sorted = sorted(collectors, key=lambda x: x['total_count'], reverse=True)
-                # Find user's position in this group
-                chat_position = "N/A"
-                for i, collector in enumerate(collectors_sorted):
-                    if collector['user_id'] == user.id:
-                        chat_position = str(i + 1).zfill(2)
-                        pass
-                        break
-                if chat_position == "N/A":
-                    # If for some reason not found, set to 1
-                    chat_position = "01"
-                        
+                current_members = await get_membership_snapshots().get(client, message.chat.id)
+                if current_members is not None and user.id not in current_members:
+                    current_members = current_members | {user.id}
+                position = await db.get_group_rank(message.chat.id, user.id, current_members)
+                if position:
+                    chat_position = str(position).zfill(2)
             except Exception as e:
                 pass
                 chat_position = "N/A"
@@ -202,46 +162,6 @@ async def status_command(client: Client, message: Message):
         status_text += f"━|🟠| Rare → {rarity_counts.get('Rare', 0)}\n"
         status_text += f"━|🟢| Medium → {rarity_counts.get('Medium', 0)}\n"
         status_text += f"━|⚪️| Common → {rarity_counts.get('Common', 0)}\n"
-        # Calculate chat position using only users currently present in the group
-        chat_position = "N/A"
-        if is_group:
-            try:
-                await db.add_user_to_group(user.id, message.chat.id)
-                chat_members = []
-                try:
-                    async for member in client.get_chat_members(message.chat.id):
-                        if not member.user.is_bot:
-                            chat_members.append(member.user.id)
-                except Exception as e:
-                    pass
-                pass
-                collectors = []
-                for member_id in chat_members:
-                    db_user = await db.get_user(member_id)
-                    if db_user:
-                        characters = db_user.get('characters', [])
-                        total_chars = len(characters) if characters else 0
-                        collectors.append({
-                            'user_id': member_id,
-                            'total_count': total_chars
-                        })
-                if user.id not in chat_members:
-                    collectors.append({
-                        'user_id': user.id,
-                        'total_count': len(user_data.get('characters', []))
-                    })
-                pass
-                collectors_sorted = sorted(collectors, key=lambda x: x['total_count'], reverse=True)
-                for i, collector in enumerate(collectors_sorted):
-                    if collector['user_id'] == user.id:
-                        chat_position = str(i + 1).zfill(2)
-                        pass
-                        break
-                if chat_position == "N/A":
-                    chat_position = "01"
-            except Exception as e:
-                pass
-                chat_position = "N/A"
         status_text += f"━|🔴| Mythic → {rarity_counts.get('Mythic', 0)}\n"
         status_text += f"━|💫| Zenith → {rarity_counts.get('Zenith', 0)}\n"
         status_text += f"━|❄️| Ethereal → {rarity_counts.get('Ethereal', 0)}\n"
@@ -250,6 +170,9 @@ async def status_command(client: Client, message: Message):
         status_text += f"━━━━━━━━━━━━━━━\n"
         status_text += f"━|🌍| Position Globally → {global_position}\n"
         status_text += f"━|💬| Chat Position → {chat_position}"
+        # Drop engine memory accounting, for the owner only
+        if is_owner(user.id):
+            status_text += format_drop_state_memory(message.chat.id if is_group else None)
         # Try to get user's first profile photo
         profile_photo = None
         try:
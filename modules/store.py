@@ -1,4 +1,5 @@
-import random
+import json
+import secrets
 from datetime import datetime
 ## No shared daily_store import needed for per-user store
 from pyrogram import Client, filters
@@ -6,6 +7,7 @@ from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton,
 from modules.postgres_database import get_database
 from pyrogram.enums import ChatType
 from modules.decorators import owner_only
+from modules.store_offers import get_store_offers
 
 RARITY_EMOJIS = {
     "Common": "⚪️",
@@ -85,112 +87,35 @@ def get_store_keyboard(refreshes):
     
     return InlineKeyboardMarkup(buttons) if buttons else None
 
-# Define weights for rarities
-RARITY_WEIGHTS = {
-    "Common": 1,
-    "Medium": 1,
-    "Rare": 1,
-    "Legendary": 1,
-    "Exclusive": 1,
-    "Elite": 1,
-    "Limited Edition": 1,
-    "Ultimate": 2,
-    "Ethereal": 1,
-    "Mythic": 1,
-    "Zenith": 1,
-    "Premium": 3  # Added Premium with weight 1
-    # "Supreme" is excluded
-}
-
-def get_weighted_random_characters_sync(all_chars, count=10):
-    # Prepare weights
-    weights = [RARITY_WEIGHTS.get(c["rarity"], 1) for c in all_chars]
-    # Select without replacement, but with weights
-    selected = []
-    pool = all_chars[:]
-    pool_weights = weights[:]
-    
-    # First try to select without replacement
-    for _ in range(min(count, len(pool))):
-        if not pool:
-            break
-        chosen = random.choices(pool, weights=pool_weights, k=1)[0]
-        selected.append(chosen)
-        idx = pool.index(chosen)
-        pool.pop(idx)
-        pool_weights.pop(idx)
-    
-    # If we still need more characters, duplicate some from the selected ones
-    while len(selected) < count:
-        if selected:
-            # Randomly select from already selected characters
-            chosen = random.choice(selected)
-            selected.append(chosen)
-        else:
-            # If no characters were selected at all, this shouldn't happen but handle it
-            break
-    return selected
-
-async def get_weighted_random_characters(db, count=10):
-    # Use PostgreSQL aggregation to get store-eligible characters
-    # This method already handles filtering for Supreme rarity, is_video=True, and excluded IDs
-    # Request more characters than needed to account for potential filtering
-    request_count = max(count * 2, 20)  # Request at least 20 characters to ensure we get enough
-    eligible_chars = await db.get_store_eligible_characters(request_count)
-    
-    if not eligible_chars:
-        return []
-    
-    # Apply weighted random selection from the filtered characters
-    selected = get_weighted_random_characters_sync(eligible_chars, count)
-    
-    # If we still don't have enough characters, try to get more from the database
-    if len(selected) < count and len(eligible_chars) < request_count:
-        # Try to get more characters from the database
-        additional_chars = await db.get_store_eligible_characters(request_count * 2)
-        if additional_chars:
-            # Combine and deduplicate
-            all_chars = eligible_chars + [c for c in additional_chars if c not in eligible_chars]
-            selected = get_weighted_random_characters_sync(all_chars, count)
-    return selected
-
-async def get_daily_store_offer(db, user_id):
-    """Get or generate the shared daily store offer for all users."""
-    today = datetime.utcnow().strftime("%Y-%m-%d")
-    user = await db.get_user(user_id)
-    offer = user.get("store_offer", {}) if user else {}
+def _store_state(raw, today):
+    """The user's store state for today (a fresh one if what is stored is from another day)"""
     # Defensive: If offer is a string, parse it as JSON
-    import json
-    if isinstance(offer, str):
+    if isinstance(raw, str):
         try:
-            offer = json.loads(offer)
+            raw = json.loads(raw)
         except Exception:
-            offer = {}
-    if not isinstance(offer, dict):
-        offer = None
-    # Only generate a new store if it's a new day or offer is missing or offer['date'] != today
-    if not offer or offer.get("date") != today:
-        offer_chars = await get_weighted_random_characters(db, 10)
-        offer = {
-            "date": today,
-            "characters": [c.get("character_id") or c.get("id") or c.get("_id") for c in offer_chars],
-            "refreshes": 0,
-            "purchased": [],
-            "pending_buy": None
-        }
-        await db.update_user(user_id, {"store_offer": offer})
+            raw = {}
+    if not isinstance(raw, dict) or raw.get("date") != today:
+        return {"date": today, "refreshes": 0, "purchased": [], "pending_buy": None}
+    offer = dict(raw)
     # Ensure all required fields exist for compatibility
-    if "refreshes" not in offer:
-        offer["refreshes"] = 0
-    if "purchased" not in offer:
-        offer["purchased"] = []
-    if "pending_buy" not in offer:
-        offer["pending_buy"] = None
-    if "characters" not in offer or not isinstance(offer["characters"], list) or not offer["characters"]:
-        # Generate a new offer if characters is missing or invalid
-        offer_chars = await get_weighted_random_characters(db, 10)
-        offer["characters"] = [c.get("character_id") or c.get("id") or c.get("_id") for c in offer_chars]
-        await db.update_user(user_id, {"store_offer": offer})
+    offer.setdefault("refreshes", 0)
+    offer.setdefault("purchased", [])
+    offer.setdefault("pending_buy", None)
+    return offer
+
+async def get_offer_characters(db, user_id, offer):
+    """Character IDs on the user's store: derived from (user, day, refreshes, salt), or an old stored list"""
+    if offer.get("characters"):
+        return offer["characters"]
+    return await get_store_offers().offer(db, user_id, offer["date"], offer["refreshes"], offer.get("salt", ""))
+
+async def get_daily_store_offer(db, user_id):
+    """Get today's store offer for a user; nothing is stored until they refresh or buy."""
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    user = await db.get_user(user_id, fields=['store_offer'])
+    offer = _store_state(user.get("store_offer") if user else None, today)
+    offer["characters"] = await get_offer_characters(db, user_id, offer)
     return offer
 
 @Client.on_message(filters.command("mystore"))
@@ -246,30 +171,8 @@ async def refresh_store_callback(client: Client, callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
     today = datetime.utcnow().strftime("%Y-%m-%d")
     user = await db.get_user(user_id)
-    offer = user.get("store_offer", {}) if user else {}
-    # Defensive: If offer is a string, parse it as JSON
-    import json
-    if isinstance(offer, str):
-        try:
-            offer = json.loads(offer)
-        except Exception:
-            offer = {}
-    refreshes = offer.get("refreshes", 0)
-    # If offer is not for today, reset refreshes and offer in DB
-    if offer.get("date") != today:
-        refreshes = 0
-        # Reset offer for today, preserving purchased and pending_buy if present
-        purchased = offer.get("purchased", [])
-        pending_buy = offer.get("pending_buy", None)
-        offer["date"] = today
-        offer["refreshes"] = 0
-        offer["purchased"] = purchased
-        offer["pending_buy"] = pending_buy
-        await db.update_user(user_id, {"store_offer": offer})
-        # Re-fetch offer from DB to ensure we have the latest state
-        user = await db.get_user(user_id)
-        offer = user.get("store_offer", {}) if user else {}
-        refreshes = offer.get("refreshes", 0)
+    offer = _store_state(user.get("store_offer") if user else None, today)
+    refreshes = offer["refreshes"]
     if refreshes >= MAX_REFRESHES:
         await callback_query.answer("No refreshes left today!", show_alert=True)
         return
@@ -281,24 +184,19 @@ async def refresh_store_callback(client: Client, callback_query: CallbackQuery):
     # Deduct tokens if not free
     if not free_refresh:
         await db.update_user(user_id, {"wallet": user["wallet"] - REFRESH_COST})
-    # Generate new offer using fast random sampling
-    offer_chars = await get_weighted_random_characters(db, 10)
-    
+    # The new offer follows from the refresh count; only the state is stored
     new_refreshes = refreshes + 1
-    # Preserve purchased and pending_buy fields
-    purchased = offer.get("purchased", [])
-    pending_buy = offer.get("pending_buy", None)
     new_offer = {
         "date": today,
-        "characters": [c.get("character_id") or c.get("id") or c.get("_id") for c in offer_chars],
         "refreshes": new_refreshes,
-        "purchased": purchased,
-        "pending_buy": pending_buy
+        "purchased": offer["purchased"],
+        "pending_buy": offer["pending_buy"],
+        "salt": offer.get("salt", "")
     }
     
     await db.update_user(user_id, {"store_offer": new_offer})
     # Batch fetch all characters for speed using PostgreSQL
-    char_ids = new_offer["characters"]
+    char_ids = await get_offer_characters(db, user_id, new_offer)
     char_docs = await db.get_characters_by_ids(char_ids)
     
     id_to_char = {c.get('character_id') or c.get('id') or c.get('_id'): c for c in char_docs}
@@ -351,25 +249,11 @@ async def process_buy_request(client: Client, message: Message, char_id: int):
     db = get_database()
     user_id = message.from_user.id
     user = await db.get_user(user_id)
-    offer = user.get("store_offer", {}) if user else {}
-    # Defensive: If offer is a string, parse it as JSON
-    import json
-    if isinstance(offer, str):
-        try:
-            offer = json.loads(offer)
-        except Exception:
-            offer = {}
-    if not isinstance(offer, dict):
-        offer = {}
     today = datetime.utcnow().strftime("%Y-%m-%d")
-    # Reset purchased list if new day
-    if offer.get("date") != today:
-        offer["purchased"] = []
-        offer["date"] = today
-        offer["pending_buy"] = None
-        await db.update_user(user_id, {"store_offer": offer})
+    # A state from another day starts over (purchases, pending buy, refreshes)
+    offer = _store_state(user.get("store_offer") if user else None, today)
     purchased = offer.get("purchased", [])
-    offer_chars = offer.get("characters", [])
+    offer_chars = await get_offer_characters(db, user_id, offer)
     pending_buy = offer.get("pending_buy")
     if char_id not in offer_chars:
         await message.reply("This character is not available in your store offer.")
@@ -432,25 +316,11 @@ async def confirm_buy_callback(client: Client, callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
     char_id = int(callback_query.data.split("_")[-1])
     user = await db.get_user(user_id)
-    offer = user.get("store_offer", {}) if user else {}
-    # Defensive: If offer is a string, parse it as JSON
-    import json
-    if isinstance(offer, str):
-        try:
-            offer = json.loads(offer)
-        except Exception:
-            offer = {}
-    if not isinstance(offer, dict):
-        offer = {}
     today = datetime.utcnow().strftime("%Y-%m-%d")
-    # Reset purchased list if new day
-    if offer.get("date") != today:
-        offer["purchased"] = []
-        offer["date"] = today
-        offer["pending_buy"] = None
-        await db.update_user(user_id, {"store_offer": offer})
+    # A state from another day starts over (purchases, pending buy, refreshes)
+    offer = _store_state(user.get("store_offer") if user else None, today)
     purchased = offer.get("purchased", [])
-    offer_chars = offer.get("characters", [])
+    offer_chars = await get_offer_characters(db, user_id, offer)
     pending_buy = offer.get("pending_buy")
     if char_id not in offer_chars:
         await callback_query.answer("Not in your store offer.", show_alert=True)
@@ -521,23 +391,9 @@ async def cancel_buy_callback(client: Client, callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
     char_id = int(callback_query.data.split("_")[-1])
     user = await db.get_user(user_id)
-    offer = user.get("store_offer", {}) if user else {}
-    # Defensive: If offer is a string, parse it as JSON
-    import json
-    if isinstance(offer, str):
-        try:
-            offer = json.loads(offer)
-        except Exception:
-            offer = {}
-    if not isinstance(offer, dict):
-        offer = {}
     today = datetime.utcnow().strftime("%Y-%m-%d")
-    # Reset purchased list if new day
-    if offer.get("date") != today:
-        offer["purchased"] = []
-        offer["date"] = today
-        offer["pending_buy"] = None
-        await db.update_user(user_id, {"store_offer": offer})
+    # A state from another day starts over (purchases, pending buy, refreshes)
+    offer = _store_state(user.get("store_offer") if user else None, today)
     pending_buy = offer.get("pending_buy")
     if not pending_buy:
         await callback_query.edit_message_caption(
@@ -558,16 +414,7 @@ async def cancel_buy_callback(client: Client, callback_query: CallbackQuery):
 async def refresh_all_stores_command(client: Client, message: Message):
     db = get_database()
     today = datetime.utcnow().strftime("%Y-%m-%d")
-    user_ids = await db.get_all_user_ids()
-    updated = 0
-    for user_id in user_ids:
-        offer_chars = await get_weighted_random_characters(db, 10)
-        offer = {
-            "date": today,
-            "characters": [c.get("character_id") or c.get("id") or c.get("_id") for c in offer_chars],
-            "refreshes": 0
-        }
-        await db.update_user(user_id, {"store_offer": offer})
-        updated += 1
+    # New salt for everyone in one UPDATE; offers are derived from it when viewed
+    updated = await db.reset_store_offers(today, secrets.token_hex(4))
     await message.reply(f"✅ Refreshed store for <b>{updated}</b> users.")
 
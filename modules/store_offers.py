@@ -0,0 +1,115 @@
+import hashlib
+import heapq
+import math
+from collections import OrderedDict
+from typing import List
+
+# Relative chance of each rarity showing up in a store offer ("Supreme" is never eligible)
+RARITY_WEIGHTS = {
+    "Common": 1,
+    "Medium": 1,
+    "Rare": 1,
+    "Legendary": 1,
+    "Exclusive": 1,
+    "Elite": 1,
+    "Limited Edition": 1,
+    "Ultimate": 2,
+    "Ethereal": 1,
+    "Mythic": 1,
+    "Zenith": 1,
+    "Premium": 3
+}
+
+
+_MASK = (1 << 64) - 1
+
+
+def _offer_seed(user_id: int, day: str, refresh_n: int, salt: str = '') -> int:
+    digest = hashlib.blake2b(f"{user_id}:{day}:{refresh_n}:{salt}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def _unit(seed: int, character_id: int) -> float:
+    """Uniform [0, 1) value for one character under a seed (splitmix64 finaliser)"""
+    z = (seed + character_id * 0x9E3779B97F4A7C15) & _MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK
+    return ((z ^ (z >> 31)) >> 11) * 2.0 ** -53
+
+
+class StoreOfferService:
+    """Daily store offers computed from a seed instead of stored per user.
+
+    The eligible characters (ascending ID) and their inverse weights are
+    taken from the catalog once per catalog version. An offer is a weighted
+    sample without replacement (Efraimidis–Spirakis: every character gets
+    the key log(u) / weight and the `count` largest keys win), where each
+    character's u is a hash of its ID and a seed made from (user_id, day,
+    refresh number, salt). The same inputs give the same offer in every
+    process. A character's key doesn't depend on the rest of the list, so
+    uploading, deleting or re-flagging characters mid-day only changes an
+    offer by the characters that join or leave it, and a buy re-derives
+    the offer the user was shown. Recent offers are memoised in a small LRU.
+    """
+
+    def __init__(self, count: int = 10, cache_size: int = 5000):
+        self.count = count
+        self.cache_size = cache_size
+        self._version = None
+        self._ids: List[int] = []
+        self._inverse_weights: List[float] = []
+        self._offers: 'OrderedDict[tuple, List[int]]' = OrderedDict()
+        self.generated = 0
+        self.hits = 0
+
+    async def _eligible(self, db):
+        catalog = await db.get_catalog()
+        if self._version != catalog.version:
+            rows = sorted(await db.get_all_store_eligible(), key=lambda row: row['character_id'])
+            self._ids = [row['character_id'] for row in rows]
+            self._inverse_weights = [1.0 / RARITY_WEIGHTS.get(row['rarity'], 1) for row in rows]
+            self._offers.clear()
+            self._version = catalog.version
+        return self._ids, self._inverse_weights
+
+    async def offer(self, db, user_id: int, day: str, refresh_n: int = 0, salt: str = '') -> List[int]:
+        """Character IDs on a user's store for a day and refresh number"""
+        ids, inverse_weights = await self._eligible(db)
+        key = (user_id, day, refresh_n, salt)
+        offer = self._offers.get(key)
+        if offer is not None:
+            self.hits += 1
+            self._offers.move_to_end(key)
+            return offer
+        offer = self.sample(ids, inverse_weights, _offer_seed(user_id, day, refresh_n, salt), self.count)
+        self.generated += 1
+        self._offers[key] = offer
+        if len(self._offers) > self.cache_size:
+            self._offers.popitem(last=False)
+        return offer
+
+    @staticmethod
+    def sample(ids: List[int], inverse_weights: List[float], seed: int, count: int) -> List[int]:
+        """`count` IDs drawn by weight without replacement, highest key first"""
+        log = math.log
+        keys = [
+            log(1.0 - _unit(seed, character_id)) * inverse_weight
+            for character_id, inverse_weight in zip(ids, inverse_weights)
+        ]
+        return [ids[i] for i in heapq.nlargest(count, range(len(keys)), key=keys.__getitem__)]
+
+    def stats(self) -> dict:
+        return {
+            'eligible': len(self._ids),
+            'cached_offers': len(self._offers),
+            'generated': self.generated,
+            'hits': self.hits,
+        }
+
+
+_store_offers = StoreOfferService()
+
+
+def get_store_offers() -> StoreOfferService:
+    """Get the process-wide store offer service"""
+    return _store_offers
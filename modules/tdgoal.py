@@ -5,7 +5,11 @@ import os
 from modules.postgres_database import get_database
 
 
-from datetime import datetime
+from datetime import datetime, timedelta
+
+# Sources from collection_events that count towards the daily tasks ('collected' is a drop
+# collect; trades and /claim log their own sources and don't count)
+TDGOAL_SOURCES = ('collected', 'infinity_stone', 'daily')
 
 # Only two daily collection tasks (no test)
 TASKS = [
@@ -37,6 +41,17 @@ TASKS = [
     }
 ]
 
+def _today_utc():
+    """Start of the current UTC day (the same day tdtop uses)"""
+    return datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+async def get_today_progress(db, user_id: int) -> int:
+    """Today's task progress, counted from the collection_events log"""
+    today_start = _today_utc()
+    return await db.count_collection_events(
+        user_id, TDGOAL_SOURCES, since=today_start, until=today_start + timedelta(days=1)
+    )
+
 async def tdgoal_command(client: Client, message_or_user, edit_message=None):
     if isinstance(message_or_user, int):
         user_id = message_or_user
@@ -53,23 +68,10 @@ async def tdgoal_command(client: Client, message_or_user, edit_message=None):
         if not user:
             await message_or_user.reply_text("❌ User not found!")
             return
-    today = datetime.now().date().isoformat()
+    today = _today_utc().date().isoformat()
     import json
 
-    progress = user.get('tdgoal_progress')
-    if not progress:
-        progress = {}
-    elif isinstance(progress, str):
-        try:
-            progress = json.loads(progress)
-        except Exception:
-            progress = {}
-    today_progress = progress.get(today, 0)
-    if isinstance(today_progress, str):
-        try:
-            today_progress = int(today_progress)
-        except Exception:
-            today_progress = 0
+    today_progress = await get_today_progress(db, user_id)
 
     claimed = user.get('tdgoal_claimed')
     if not claimed:
@@ -125,10 +127,11 @@ async def tdgoal_callback(client: Client, callback_query: CallbackQuery):
         return
     if data.startswith("tdgoal_claim_"):
         task_id = data.replace("tdgoal_claim_", "")
-        today = datetime.now().date().isoformat()
+        today = _today_utc().date().isoformat()
         try:
             # Only fetch needed fields
-            user = await db.users.find_one({"user_id": user_id}, {"user_id": 1, "tdgoal_progress": 1, "tdgoal_claimed": 1, "wallet": 1, "characters": 1})
+            user = await db.users.find_one({"user_id": user_id}, {"user_id": 1, "tdgoal_claimed": 1, "wallet": 1, "characters": 1})
+            today_progress = await get_today_progress(db, user_id)
         except Exception as e:
             await callback_query.answer("Database error!", show_alert=True)
             print(f"tdgoal_callback DB error: {e}")
@@ -136,22 +139,6 @@ async def tdgoal_callback(client: Client, callback_query: CallbackQuery):
         if not user:
             await callback_query.answer("User not found!", show_alert=True)
             return
-        progress = user.get('tdgoal_progress', {})
-        # Ensure progress is a dict, not a string
-        if not progress:
-            progress = {}
-        elif isinstance(progress, str):
-            try:
-                import json
-                progress = json.loads(progress)
-            except Exception:
-                progress = {}
-        today_progress = progress.get(today, 0)
-        if isinstance(today_progress, str):
-            try:
-                today_progress = int(today_progress)
-            except Exception:
-                today_progress = 0
         claimed = user.get('tdgoal_claimed')
         if not claimed:
             claimed = {}
@@ -216,10 +203,8 @@ async def tdgoal_callback(client: Client, callback_query: CallbackQuery):
                 # First, let's check if there are any Ultimate characters in the database
                 if hasattr(db, 'pool'):
                     try:
-                        async with db.pool.acquire() as conn:
-                            count_result = await conn.fetchrow("SELECT COUNT(*) FROM characters WHERE rarity = 'Ultimate'")
-                            ultimate_count = count_result[0] if count_result else 0
-                            print(f"tdgoal_callback: Found {ultimate_count} Ultimate characters in database")
+                        ultimate_count = (await db.get_catalog()).count('Ultimate')
+                        print(f"tdgoal_callback: Found {ultimate_count} Ultimate characters in database")
                     except Exception as e:
                         print(f"tdgoal_callback error counting Ultimate characters: {e}")
                 
@@ -250,23 +235,12 @@ async def tdgoal_callback(client: Client, callback_query: CallbackQuery):
                     except Exception as e:
                         selected = []
                 
-                # If still no characters, try direct SQL query as final fallback
+                # If still no characters, pick straight from the catalog as final fallback
                 if not selected and hasattr(db, 'pool'):
                     try:
-                        async with db.pool.acquire() as conn:
-                            # Get up to 5 Ultimate characters and randomly select 2
-                            rows = await conn.fetch("""
-                                SELECT character_id, name, rarity FROM characters 
-                                WHERE rarity = 'Ultimate' 
-                                ORDER BY RANDOM() 
-                                LIMIT 5
-                            """)
-                            
-                            if len(rows) >= 2:
-                                import random
-                                selected = random.sample([dict(row) for row in rows], 2)
-                            elif len(rows) == 1:
-                                selected = [dict(rows[0])]
+                        import random
+                        rows = (await db.get_catalog()).by_rarity('Ultimate')
+                        selected = [dict(row) for row in random.sample(rows, min(2, len(rows)))]
                                 
                     except Exception as e:
                         selected = []
@@ -320,33 +294,11 @@ async def tdgoal_callback(client: Client, callback_query: CallbackQuery):
             print(f"tdgoal_callback error answering callback: {e}")
         return
 
-# Call this from collect_handler in main.py after a successful collect
-async def track_collect_drop(user_id: int):
+# Regular collects are logged by add_character_to_user; call this for progress
+# that doesn't add a character (infinity stones, daily claims)
+async def track_collect_drop(user_id: int, source: str = 'collected'):
     try:
         db = get_database()
-        today = datetime.now().date().isoformat()
-        user = await db.get_user(user_id)
-        if not user:
-            return
-        import json
-        progress = user.get('tdgoal_progress')
-        if not progress:
-            progress = {}
-        elif isinstance(progress, str):
-            try:
-                progress = json.loads(progress)
-            except Exception:
-                progress = {}
-        today_val = progress.get(today, 0)
-        if isinstance(today_val, str):
-            try:
-                today_val = int(today_val)
-            except Exception:
-                today_val = 0
-        today_progress = today_val + 1
-        await db.users.update_one(
-            {'user_id': user_id},
-            {'$set': {f'tdgoal_progress.{today}': today_progress}}
-        )
+        await db.log_collection_events(user_id, [{'source': source}])
     except Exception as e:
         print(f"tdgoal track_collect_drop error: {e}")
\ No newline at end of file
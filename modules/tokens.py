@@ -4,6 +4,7 @@ from pyrogram import Client
 from modules.postgres_database import get_database
 from .logging_utils import send_token_log
 from .decorators import is_owner, is_og, is_sudo, check_banned
+from .expiry_scheduler import get_expiry_scheduler
 from pyrogram import filters
 import random
 import asyncio
@@ -15,7 +16,7 @@ from pyrogram.enums import ChatType
 async def balance_command(client: Client, message: Message):
     db = get_database()
     user_id = message.from_user.id
-    user = await db.get_user(user_id)
+    user = await db.get_user(user_id, fields=('wallet', 'bank', 'shards'))
     wallet = user.get('wallet', 0)
     bank = user.get('bank', 0)
     shards = user.get('shards', 0)
@@ -30,92 +31,71 @@ async def balance_command(client: Client, message: Message):
 @check_banned
 async def deposit_command(client: Client, message: Message):
     user_id = message.from_user.id
-    if user_id not in financial_locks:
-        financial_locks[user_id] = asyncio.Lock()
-    
-    async with financial_locks[user_id]:
-        db = get_database()
-        args = message.text.split()
-        if len(args) < 2:
-            await message.reply_text("❌ <b>Please specify an amount to deposit!</b>")
-            return
-        try:
-            amount = int(args[1])
-            if amount <= 0:
-                raise ValueError
-            user = await db.get_user(user_id)
-            wallet = user.get('wallet', 0)
-            if wallet is None:
-                wallet = 0
-            if wallet < amount:
-                await message.reply_text("❌ <b>You don't have enough tokens in your wallet!</b>")
-                return
-            bank = user.get('bank', 0)
-            if bank is None:
-                bank = 0
-            await db.update_user(user_id, {'wallet': wallet - amount, 'bank': bank + amount})
-            await message.reply_text(f"✅ <b>Successfully deposited</b> <code>{amount:,}</code> <b>tokens to your bank!</b>")
-        except ValueError:
-            await message.reply_text("❌ <b>Please provide a valid positive number!</b>")
+    db = get_database()
+    args = message.text.split()
+    if len(args) < 2:
+        await message.reply_text("❌ <b>Please specify an amount to deposit!</b>")
+        return
+    try:
+        amount = int(args[1])
+        if amount <= 0:
+            raise ValueError
+    except ValueError:
+        await message.reply_text("❌ <b>Please provide a valid positive number!</b>")
+        return
+    if await db.move_balance(user_id, amount, 'wallet', 'bank') is None:
+        await message.reply_text("❌ <b>You don't have enough tokens in your wallet!</b>")
+        return
+    await message.reply_text(f"✅ <b>Successfully deposited</b> <code>{amount:,}</code> <b>tokens to your bank!</b>")
 
 # WITHDRAW
 @check_banned
 async def withdraw_command(client: Client, message: Message):
     user_id = message.from_user.id
-    if user_id not in financial_locks:
-        financial_locks[user_id] = asyncio.Lock()
-    
-    async with financial_locks[user_id]:
-        db = get_database()
-        args = message.text.split()
-        if len(args) < 2:
-            await message.reply_text("❌ <b>Please specify an amount to withdraw!</b>")
-            return
-        try:
-            amount = int(args[1])
-            if amount <= 0:
-                raise ValueError
-            user = await db.get_user(user_id)
-            wallet = user.get('wallet', 0)
-            if wallet is None:
-                wallet = 0
-            bank = user.get('bank', 0)
-            if bank is None:
-                bank = 0
-            if bank < amount:
-                await message.reply_text("❌ <b>You don't have enough tokens in your bank!</b>")
-                return
-            await db.update_user(user_id, {'wallet': wallet + amount, 'bank': bank - amount})
-            await message.reply_text(f"✅ <b>Successfully withdrew</b> <code>{amount:,}</code> <b>tokens from your bank!</b>")
-            return
-        except ValueError:
-            await message.reply_text("❌ <b>Please provide a valid positive number!</b>")
+    db = get_database()
+    args = message.text.split()
+    if len(args) < 2:
+        await message.reply_text("❌ <b>Please specify an amount to withdraw!</b>")
+        return
+    try:
+        amount = int(args[1])
+        if amount <= 0:
+            raise ValueError
+    except ValueError:
+        await message.reply_text("❌ <b>Please provide a valid positive number!</b>")
+        return
+    if await db.move_balance(user_id, amount, 'bank', 'wallet') is None:
+        await message.reply_text("❌ <b>You don't have enough tokens in your bank!</b>")
+        return
+    await message.reply_text(f"✅ <b>Successfully withdrew</b> <code>{amount:,}</code> <b>tokens from your bank!</b>")
+
+def _time_until_next_claim(result: dict, cooldown: timedelta):
+    # None means there was no user row to claim on
+    last_claimed = result.get('last_claimed')
+    if last_claimed is None:
+        return None
+    if last_claimed.tzinfo is not None:
+        last_claimed = last_claimed.replace(tzinfo=None)
+    return max(last_claimed + cooldown - datetime.utcnow(), timedelta(0))
 
 # DAILY
 @check_banned
 async def daily_command(client: Client, message: Message):
     db = get_database()
     user_id = message.from_user.id
-    user = await db.get_user(user_id)
-    now = datetime.utcnow()
-    last_daily = user.get('last_daily')
-    if last_daily:
-        if isinstance(last_daily, str):
-            last_daily_dt = datetime.fromisoformat(last_daily)
-        else:
-            last_daily_dt = last_daily
-        next_daily = last_daily_dt + timedelta(days=1)
-        if now < next_daily:
-            time_left = next_daily - now
-            hours = time_left.seconds // 3600
-            minutes = (time_left.seconds % 3600) // 60
-            await message.reply_text(
-                f"❌ <b>You've already claimed your daily reward!</b>\nPlease wait: <b>{hours}h {minutes}m</b>"
-            )
-            return
     reward = 5000
-    wallet = user.get('wallet', 0)
-    await db.update_user(user_id, {'wallet': wallet + reward, 'last_daily': now})
+    result = await db.claim_periodic_reward(user_id, 'last_daily', timedelta(days=1), reward)
+    if not result['claimed']:
+        time_left = _time_until_next_claim(result, timedelta(days=1))
+        if time_left is None:
+            await message.reply_text("❌ <b>You need an account to claim rewards. Use /start first!</b>")
+            return
+        hours = time_left.seconds // 3600
+        minutes = (time_left.seconds % 3600) // 60
+        await message.reply_text(
+            f"❌ <b>You've already claimed your daily reward!</b>\nPlease wait: <b>{hours}h {minutes}m</b>"
+        )
+        return
     await message.reply_text(f"✅ <b>Daily reward claimed!</b>\n\n💰 You received: <b>{reward:,}</b> tokens")
 
 # WEEKLY
@@ -123,26 +103,19 @@ async def daily_command(client: Client, message: Message):
 async def weekly_command(client: Client, message: Message):
     db = get_database()
     user_id = message.from_user.id
-    user = await db.get_user(user_id)
-    now = datetime.utcnow()
-    last_weekly = user.get('last_weekly')
-    if last_weekly:
-        if isinstance(last_weekly, str):
-            last_weekly_dt = datetime.fromisoformat(last_weekly)
-        else:
-            last_weekly_dt = last_weekly
-        next_weekly = last_weekly_dt + timedelta(days=7)
-        if now < next_weekly:
-            time_left = next_weekly - now
-            days = time_left.days
-            hours = time_left.seconds // 3600
-            await message.reply_text(
-                f"❌ <b>You've already claimed your weekly reward!</b>\nPlease wait: <b>{days}d {hours}h</b>"
-            )
-            return
     reward = 15000
-    wallet = user.get('wallet', 0)
-    await db.update_user(user_id, {'wallet': wallet + reward, 'last_weekly': now})
+    result = await db.claim_periodic_reward(user_id, 'last_weekly', timedelta(days=7), reward)
+    if not result['claimed']:
+        time_left = _time_until_next_claim(result, timedelta(days=7))
+        if time_left is None:
+            await message.reply_text("❌ <b>You need an account to claim rewards. Use /start first!</b>")
+            return
+        days = time_left.days
+        hours = time_left.seconds // 3600
+        await message.reply_text(
+            f"❌ <b>You've already claimed your weekly reward!</b>\nPlease wait: <b>{days}d {hours}h</b>"
+        )
+        return
     await message.reply_text(f"✅ <b>Weekly reward claimed!</b>\n\n💰 You received: <b>{reward:,}</b> tokens")
 
 # MONTHLY
@@ -150,26 +123,19 @@ async def weekly_command(client: Client, message: Message):
 async def monthly_command(client: Client, message: Message):
     db = get_database()
     user_id = message.from_user.id
-    user = await db.get_user(user_id)
-    now = datetime.utcnow()
-    last_monthly = user.get('last_monthly')
-    if last_monthly:
-        if isinstance(last_monthly, str):
-            last_monthly_dt = datetime.fromisoformat(last_monthly)
-        else:
-            last_monthly_dt = last_monthly
-        next_monthly = last_monthly_dt + timedelta(days=30)
-        if now < next_monthly:
-            time_left = next_monthly - now
-            days = time_left.days
-            hours = time_left.seconds // 3600
-            await message.reply_text(
-                f"❌ <b>You've already claimed your monthly reward!</b>\nPlease wait: <b>{days}d {hours}h</b>"
-            )
-            return
     reward = 35000
-    wallet = user.get('wallet', 0)
-    await db.update_user(user_id, {'wallet': wallet + reward, 'last_monthly': now})
+    result = await db.claim_periodic_reward(user_id, 'last_monthly', timedelta(days=30), reward)
+    if not result['claimed']:
+        time_left = _time_until_next_claim(result, timedelta(days=30))
+        if time_left is None:
+            await message.reply_text("❌ <b>You need an account to claim rewards. Use /start first!</b>")
+            return
+        days = time_left.days
+        hours = time_left.seconds // 3600
+        await message.reply_text(
+            f"❌ <b>You've already claimed your monthly reward!</b>\nPlease wait: <b>{days}d {hours}h</b>"
+        )
+        return
     await message.reply_text(f"✅ <b>Monthly reward claimed!</b>\n\n💰 You received: <b>{reward:,}</b> tokens")
 
 # GIVE TOKENS (ADMIN, REPLY)
@@ -177,7 +143,7 @@ async def monthly_command(client: Client, message: Message):
 async def give_tokens(client: Client, message: Message):
     db = get_database()
     user_id = message.from_user.id
-    user = await db.get_user(user_id)
+    user = await db.get_user(user_id, fields=('og', 'sudo'))
     # Check admin
     if not (is_owner(user_id) or user.get('og', False) or user.get('sudo', False)):
         await message.reply_text("❌ <b>This command is restricted to admins only!</b>")
@@ -194,25 +160,10 @@ async def give_tokens(client: Client, message: Message):
         if amount <= 0:
             raise ValueError
         target_user = message.reply_to_message.from_user
-        target_data = await db.get_user(target_user.id)
-        if not target_data:
-            await db.add_user({
-                'user_id': target_user.id,
-                'username': target_user.username,
-                'first_name': target_user.first_name,
-                'wallet': amount,
-                'bank': 0,
-                'characters': [],
-                'last_daily': None,
-                'last_weekly': None,
-                'last_monthly': None,
-                'sudo': False,
-                'og': False,
-                'collection_preferences': {'mode': 'default', 'filter': None}
-            })
-        else:
-            new_balance = target_data.get('wallet', 0) + amount
-            await db.update_user(target_user.id, {'wallet': new_balance})
+        await db.credit(target_user.id, amount, 'wallet', profile={
+            'username': target_user.username,
+            'first_name': target_user.first_name
+        })
         await message.reply_text(f"✅ <b>Successfully gave</b> <code>{amount:,}</code> <b>tokens to</b> {target_user.mention}")
         await send_token_log(client, message.from_user, target_user, amount, action="give_tokens (gbheek)")
     except ValueError:
@@ -223,7 +174,7 @@ async def give_tokens(client: Client, message: Message):
 async def take_tokens(client: Client, message: Message):
     db = get_database()
     user_id = message.from_user.id
-    user = await db.get_user(user_id)
+    user = await db.get_user(user_id, fields=('og', 'sudo'))
     if not (is_owner(user_id) or user.get('og', False) or user.get('sudo', False)):
         await message.reply_text("❌ <b>This command is restricted to admins only!</b>")
         return
@@ -239,16 +190,9 @@ async def take_tokens(client: Client, message: Message):
         if amount <= 0:
             raise ValueError
         target_user = message.reply_to_message.from_user
-        target_data = await db.get_user(target_user.id)
-        if not target_data:
-            await message.reply_text("❌ <b>User not found!</b>")
-            return
-        wallet = target_data.get('wallet', 0)
-        if wallet < amount:
+        if await db.debit_if_sufficient(target_user.id, amount, 'wallet') is None:
             await message.reply_text("❌ <b>User doesn't have enough tokens!</b>")
             return
-        new_balance = wallet - amount
-        await db.update_user(target_user.id, {'wallet': new_balance})
         await message.reply_text(f"✅ <b>Successfully taken</b> <code>{amount:,}</code> <b>tokens from</b> {target_user.mention}")
         await send_token_log(client, message.from_user, target_user, amount, action="take_tokens (gbheek)")
     except ValueError:
@@ -258,81 +202,61 @@ async def take_tokens(client: Client, message: Message):
 @check_banned
 async def pay_command(client: Client, message: Message):
     user_id = message.from_user.id
-    if user_id not in financial_locks:
-        financial_locks[user_id] = asyncio.Lock()
+    now = datetime.utcnow()
+    last_used = pay_last_used.get(user_id)
+    if last_used and (now - last_used).total_seconds() < PAY_COOLDOWN:
+        seconds_left = PAY_COOLDOWN - int((now - last_used).total_seconds())
+        await message.reply_text(f"⏳ Please wait {seconds_left} seconds before making another payment.")
+        return
     
-    async with financial_locks[user_id]:
-        now = datetime.utcnow()
-        last_used = pay_last_used.get(user_id)
-        if last_used and (now - last_used).total_seconds() < PAY_COOLDOWN:
-            seconds_left = PAY_COOLDOWN - int((now - last_used).total_seconds())
-            await message.reply_text(f"⏳ Please wait {seconds_left} seconds before making another payment.")
-            return
-        
-        pay_last_used[user_id] = now
-        
-        db = get_database()
-        if not message.reply_to_message:
-            await message.reply_text("❌ <b>Please reply to a user's message!</b>")
-            return
-        args = message.text.split()
-        if len(args) < 2:
-            await message.reply_text("❌ <b>Please specify the amount of tokens!</b>")
-            return
-        sender = message.from_user
-        receiver = message.reply_to_message.from_user
-        if sender.id == receiver.id:
-            await message.reply_text("❌ <b>You cannot pay tokens to yourself!</b>")
-            return
-        if receiver.is_bot:
-            await message.reply_text("❌ <b>You cannot pay tokens to the bot!</b>")
-            return
-        try:
-            amount = int(args[1])
-            if amount <= 0:
-                raise ValueError
-        except ValueError:
-            await message.reply_text("❌ <b>Please provide a valid positive number!</b>")
-            return
-        sender_data = await db.get_user(sender.id)
-        if not sender_data:
-            await message.reply_text("❌ <b>You don't have an account!</b>")
-            return
-        sender_wallet = sender_data.get('wallet', 0)
-        if sender_wallet < amount:
-            await message.reply_text("❌ <b>You don't have enough tokens!</b>")
-            return
-        receiver_data = await db.get_user(receiver.id)
-        if not receiver_data:
-            await db.add_user({
-                'user_id': receiver.id,
-                'username': receiver.username,
-                'first_name': receiver.first_name,
-                'wallet': amount,
-                'bank': 0,
-                'characters': [],
-                'groups': []
-            })
-        else:
-            receiver_wallet = receiver_data.get('wallet', 0)
-            await db.update_user(receiver.id, {'wallet': receiver_wallet + amount})
-        await db.update_user(sender.id, {'wallet': sender_wallet - amount})
-        await message.reply_text(f"✅ <b>Payment successful!</b>\n\n💰 <b>{amount:,}</b> tokens paid to {receiver.mention}")
-
-        # Log transaction for both sender and receiver
-        now = datetime.utcnow().strftime('%Y-%m-%d %H:%M')
-        await db.log_user_transaction(sender.id, "pay_sent", {
-            "to_user_id": receiver.id,
-            "to_user_name": receiver.first_name,
-            "amount": amount,
-            "date": now
-        })
-        await db.log_user_transaction(receiver.id, "pay_received", {
-            "from_user_id": sender.id,
-            "from_user_name": sender.first_name,
-            "amount": amount,
-            "date": now
-        })
+    pay_last_used[user_id] = now
+    
+    db = get_database()
+    if not message.reply_to_message:
+        await message.reply_text("❌ <b>Please reply to a user's message!</b>")
+        return
+    args = message.text.split()
+    if len(args) < 2:
+        await message.reply_text("❌ <b>Please specify the amount of tokens!</b>")
+        return
+    sender = message.from_user
+    receiver = message.reply_to_message.from_user
+    if sender.id == receiver.id:
+        await message.reply_text("❌ <b>You cannot pay tokens to yourself!</b>")
+        return
+    if receiver.is_bot:
+        await message.reply_text("❌ <b>You cannot pay tokens to the bot!</b>")
+        return
+    try:
+        amount = int(args[1])
+        if amount <= 0:
+            raise ValueError
+    except ValueError:
+        await message.reply_text("❌ <b>Please provide a valid positive number!</b>")
+        return
+    paid = await db.transfer(sender.id, receiver.id, amount, 'wallet', to_profile={
+        'username': receiver.username,
+        'first_name': receiver.first_name
+    })
+    if paid is None:
+        await message.reply_text("❌ <b>You don't have enough tokens!</b>")
+        return
+    await message.reply_text(f"✅ <b>Payment successful!</b>\n\n💰 <b>{amount:,}</b> tokens paid to {receiver.mention}")
+
+    # Log transaction for both sender and receiver
+    now = datetime.utcnow().strftime('%Y-%m-%d %H:%M')
+    await db.log_user_transaction(sender.id, "pay_sent", {
+        "to_user_id": receiver.id,
+        "to_user_name": receiver.first_name,
+        "amount": amount,
+        "date": now
+    })
+    await db.log_user_transaction(receiver.id, "pay_received", {
+        "from_user_id": sender.id,
+        "from_user_name": sender.first_name,
+        "amount": amount,
+        "date": now
+    })
 
 @check_banned
 async def shards_pay(client: Client, message: Message):
@@ -357,27 +281,13 @@ async def shards_pay(client: Client, message: Message):
     except ValueError:
         await message.reply_text("❌ <b>Please provide a valid positive number!</b>")
         return
-    sender_data = await db.get_user(user_id)
-    if not sender_data or sender_data.get('shards', 0) < amount:
+    paid = await db.transfer(user_id, receiver.id, amount, 'shards', to_profile={
+        'username': receiver.username,
+        'first_name': receiver.first_name
+    })
+    if paid is None:
         await message.reply_text("❌ <b>You don't have enough 🎐 shards!</b>")
         return
-    receiver_data = await db.get_user(receiver.id)
-    if not receiver_data:
-        await db.add_user({
-            'user_id': receiver.id,
-            'username': receiver.username,
-            'first_name': receiver.first_name,
-            'wallet': 0,
-            'bank': 0,
-            'shards': amount,
-            'characters': [],
-            'groups': []
-        })
-    else:
-        receiver_shards = receiver_data.get('shards', 0)
-        await db.update_user(receiver.id, {'shards': receiver_shards + amount})
-    sender_shards = sender_data.get('shards', 0)
-    await db.update_user(user_id, {'shards': sender_shards - amount})
     await message.reply_text(f"✅ <b>Shards payment successful!</b>\n\n🎐 <b>{amount:,}</b> shards paid to {receiver.mention}")
 
 # GIVE SHARDS (ADMIN, REPLY)
@@ -385,7 +295,7 @@ async def shards_pay(client: Client, message: Message):
 async def give_shards(client: Client, message: Message):
     db = get_database()
     user_id = message.from_user.id
-    user = await db.get_user(user_id)
+    user = await db.get_user(user_id, fields=('og', 'sudo'))
     # Check admin
     if not (is_owner(user_id) or user.get('og', False) or user.get('sudo', False)):
         await message.reply_text("❌ <b>This command is restricted to admins only!</b>")
@@ -402,26 +312,10 @@ async def give_shards(client: Client, message: Message):
         if amount <= 0:
             raise ValueError
         target_user = message.reply_to_message.from_user
-        target_data = await db.get_user(target_user.id)
-        if not target_data:
-            await db.add_user({
-                'user_id': target_user.id,
-                'username': target_user.username,
-                'first_name': target_user.first_name,
-                'wallet': 0,
-                'bank': 0,
-                'shards': amount,
-                'characters': [],
-                'last_daily': None,
-                'last_weekly': None,
-                'last_monthly': None,
-                'sudo': False,
-                'og': False,
-                'collection_preferences': {'mode': 'default', 'filter': None}
-            })
-        else:
-            new_balance = target_data.get('shards', 0) + amount
-            await db.update_user(target_user.id, {'shards': new_balance})
+        await db.credit(target_user.id, amount, 'shards', profile={
+            'username': target_user.username,
+            'first_name': target_user.first_name
+        })
         await message.reply_text(f"✅ <b>Successfully gave</b> <code>{amount:,}</code> <b>🎐 shards to</b> {target_user.mention}")
     except ValueError:
         await message.reply_text("❌ <b>Please provide a valid positive number!</b>")
@@ -431,7 +325,7 @@ async def give_shards(client: Client, message: Message):
 async def take_shards(client: Client, message: Message):
     db = get_database()
     user_id = message.from_user.id
-    user = await db.get_user(user_id)
+    user = await db.get_user(user_id, fields=('og', 'sudo'))
     if not (is_owner(user_id) or user.get('og', False) or user.get('sudo', False)):
         await message.reply_text("❌ <b>This command is restricted to admins only!</b>")
         return
@@ -447,16 +341,9 @@ async def take_shards(client: Client, message: Message):
         if amount <= 0:
             raise ValueError
         target_user = message.reply_to_message.from_user
-        target_data = await db.get_user(target_user.id)
-        if not target_data:
-            await message.reply_text("❌ <b>User not found!</b>")
-            return
-        shards = target_data.get('shards', 0)
-        if shards < amount:
+        if await db.debit_if_sufficient(target_user.id, amount, 'shards') is None:
             await message.reply_text("❌ <b>User doesn't have enough 🎐 shards!</b>")
             return
-        new_balance = shards - amount
-        await db.update_user(target_user.id, {'shards': new_balance})
         await message.reply_text(f"✅ <b>Successfully taken</b> <code>{amount:,}</code> <b>🎐 shards from</b> {target_user.mention}")
     except ValueError:
         await message.reply_text("❌ <b>Please provide a valid positive number!</b>")
@@ -479,9 +366,6 @@ pay_last_used = {}
 sspay_locks = {}
 sspay_last_used = {}
 
-# Financial operation locks to prevent race conditions
-financial_locks = {}
-
 COOLDOWN_MIN = 120
 COOLDOWN_MAX = 180
 football_cooldowns = {}
@@ -523,12 +407,9 @@ async def football_command(client: Client, message: Message):
             if dice.dice.value in (4, 5):
                 reward = random.randint(100, 600)
                 db = get_database()
-                user = await db.get_user(user_id)
-                if not user:
+                if await db.credit(user_id, reward, 'shards') is None:
                     await message.reply_text("❌ <b>You need an account to receive rewards. Use /start first!</b>")
                     return
-                shards = user.get('shards', 0)
-                await db.update_user(user_id, {'shards': shards + reward})
                 await db.log_user_transaction(user_id, "football_win", {
                     "reward": reward,
                     "chat_id": message.chat.id,
@@ -570,12 +451,9 @@ async def dart_command(client: Client, message: Message):
             if dice.dice.value == 6:
                 reward = random.randint(100, 600)
                 db = get_database()
-                user = await db.get_user(user_id)
-                if not user:
+                if await db.credit(user_id, reward, 'shards') is None:
                     await message.reply_text("❌ <b>You need an account to receive rewards. Use /start first!</b>")
                     return
-                shards = user.get('shards', 0)
-                await db.update_user(user_id, {'shards': shards + reward})
                 await db.log_user_transaction(user_id, "dart_win", {
                     "reward": reward,
                     "chat_id": message.chat.id,
@@ -617,12 +495,9 @@ async def basket_command(client: Client, message: Message):
             if dice.dice.value in (4, 5):
                 reward = random.randint(100, 600)
                 db = get_database()
-                user = await db.get_user(user_id)
-                if not user:
+                if await db.credit(user_id, reward, 'shards') is None:
                     await message.reply_text("❌ <b>You need an account to receive rewards. Use /start first!</b>")
                     return
-                shards = user.get('shards', 0)
-                await db.update_user(user_id, {'shards': shards + reward})
                 await db.log_user_transaction(user_id, "basket_win", {
                     "reward": reward,
                     "chat_id": message.chat.id,
@@ -677,12 +552,9 @@ async def roll_command(client: Client, message: Message):
             if rolled == user_number:
                 reward = random.randint(100, 600)
                 db = get_database()
-                user = await db.get_user(user_id)
-                if not user:
+                if await db.credit(user_id, reward, 'shards') is None:
                     await message.reply_text("❌ <b>You need an account to receive rewards. Use /start first!</b>")
                     return
-                shards = user.get('shards', 0)
-                await db.update_user(user_id, {'shards': shards + reward})
                 await message.reply_text(f"🎲 <b>Congrats! You guessed {user_number} and rolled {rolled}!</b>\nYou won <b>{reward} 🎐 shards!</b>", reply_to_message_id=message.id)
             else:
                 await message.reply_text(f"🎲 <b>You guessed {user_number}, but rolled {rolled}. No reward this time!</b>", reply_to_message_id=message.id)
@@ -713,6 +585,32 @@ explore_message_chats = {}  # Track chat_id for each message
 EXPLORE_COOLDOWN = 90  # 3 minutes
 EXPLORE_MESSAGE_EXPIRY = 300  # 5 minutes - messages expire after this time
 
+def forget_explore_message(message_id):
+    """Stop tracking an explore menu (and drop its pending expiry)"""
+    explore_message_owners.pop(message_id, None)
+    explore_message_timestamps.pop(message_id, None)
+    explore_message_chats.pop(message_id, None)
+    get_expiry_scheduler().cancel(('explore', message_id))
+
+async def expire_explore_message(client: Client, message_id):
+    """Delete an unused explore menu once it expires (run by the expiry scheduler)"""
+    chat_id = explore_message_chats.get(message_id)
+    forget_explore_message(message_id)
+    if chat_id:
+        try:
+            await client.delete_messages(chat_id, message_id)
+        except Exception:
+            pass  # Ignore if message deletion fails
+
+def expire_explore_cooldown(user_id):
+    """Forget a user's explore cooldown and lock once the cooldown is over"""
+    last_used = explore_last_used.get(user_id)
+    if last_used and (datetime.utcnow() - last_used).total_seconds() >= EXPLORE_COOLDOWN:
+        del explore_last_used[user_id]
+    lock = explore_locks.get(user_id)
+    if lock is not None and not lock.locked() and user_id not in explore_last_used:
+        del explore_locks[user_id]
+
 @check_banned
 async def explore_command(client: Client, message: Message):
     """Show explore menu with planet buttons"""
@@ -754,9 +652,7 @@ async def explore_command(client: Client, message: Message):
                 return
             else:
                 # Cooldown is over, clean up old session and continue
-                explore_message_owners.pop(active_session, None)
-                explore_message_timestamps.pop(active_session, None)
-                explore_message_chats.pop(active_session, None)
+                forget_explore_message(active_session)
         
         # Check cooldown
         now = datetime.utcnow()
@@ -790,6 +686,10 @@ async def explore_command(client: Client, message: Message):
         explore_message_owners[sent_message.id] = user_id
         explore_message_timestamps[sent_message.id] = now
         explore_message_chats[sent_message.id] = message.chat.id
+        get_expiry_scheduler().schedule_in(
+            EXPLORE_MESSAGE_EXPIRY, expire_explore_message, client, sent_message.id,
+            key=('explore', sent_message.id)
+        )
 
 @check_banned
 async def explore_callback(client: Client, callback_query: CallbackQuery):
@@ -834,9 +734,7 @@ async def explore_callback(client: Client, callback_query: CallbackQuery):
     # Check if message is too old (5 minutes)
     if (now - message_timestamp).total_seconds() > EXPLORE_MESSAGE_EXPIRY:
         # Clean up expired message
-        explore_message_owners.pop(message_id, None)
-        explore_message_timestamps.pop(message_id, None)
-        explore_message_chats.pop(message_id, None)
+        forget_explore_message(message_id)
         # Try to delete the expired message
         try:
             await callback_query.message.delete()
@@ -869,11 +767,12 @@ async def explore_callback(client: Client, callback_query: CallbackQuery):
         
         # Set cooldown
         explore_last_used[user_id] = now
+        get_expiry_scheduler().schedule_in(
+            EXPLORE_COOLDOWN, expire_explore_cooldown, user_id, key=('explore_cooldown', user_id)
+        )
         
         # Remove message owner tracking after successful use
-        explore_message_owners.pop(message_id, None)
-        explore_message_timestamps.pop(message_id, None)
-        explore_message_chats.pop(message_id, None)
+        forget_explore_message(message_id)
         
         # Get planet data
         planet_data = PLANETS[planet_id]
@@ -908,19 +807,10 @@ async def explore_callback(client: Client, callback_query: CallbackQuery):
             
             # Update user's balance
             db = get_database()
-            user = await db.get_user(user_id)
-            if not user:
+            if await db.credit_many(user_id, {'wallet': tokens_earned, 'shards': shards_earned}) is None:
                 await callback_query.answer("❌ You need an account to receive rewards!", show_alert=True)
                 return
             
-            current_tokens = user.get('wallet', 0)
-            current_shards = user.get('shards', 0)
-            
-            await db.update_user(user_id, {
-                'wallet': current_tokens + tokens_earned,
-                'shards': current_shards + shards_earned
-            })
-            
             # Log transaction
             await db.log_user_transaction(user_id, "explore_success", {
                 "planet": planet_name,
@@ -8,7 +8,9 @@ import os
 
 # Import database based on configuration
 from modules.postgres_database import get_database
-import time
+from modules.leaderboard import get_leaderboard_service
+from modules.group_membership import get_membership_snapshots
+from modules.daily_counters import get_daily_counters
 
 # Helper for markdown v2 escaping (minimal)
 def escape_markdown(text, version=2):
@@ -30,26 +32,25 @@ REWARDS = {
     10: 175000  # 10th place: 175K tokens
 }
 
-# Simple in-memory cache for leaderboard results
-_leaderboard_cache = {}
-_CACHE_TTL = 60  # seconds
+leaderboards = get_leaderboard_service()
 
-def get_cached_leaderboard(key):
-    entry = _leaderboard_cache.get(key)
-    if entry and time.time() - entry['time'] < _CACHE_TTL:
-        return entry['data']
-    return None
-
-def set_cached_leaderboard(key, data):
-    _leaderboard_cache[key] = {'data': data, 'time': time.time()}
+async def my_rank_line(db, board, user_id, unit):
+    """Footer line with the caller's own position on a global board"""
+    try:
+        score, rank = await leaderboards.user_rank(db, board, user_id)
+    except Exception:
+        return ""
+    if not score:
+        return ""
+    return f"\n<b>📍 ʏᴏᴜʀ ʀᴀɴᴋ:</b> <b>#{rank:,}</b> ➣ <b>{score:,} {unit}</b>"
 
 async def distribute_daily_rewards(client: Client):
     """Distribute rewards to top collectors based on UTC daily reset"""
     try:
         db = get_database()
         
-        # Use the optimized database method
-        top_collectors = await db.get_todays_top_collectors(10)
+        # Runs at the reset, so pay the board of the day that just finished
+        top_collectors = get_daily_counters().previous_top(10)
         
         if not top_collectors:
             return
@@ -95,14 +96,13 @@ async def tdtop_command(client: Client, message: Message):
     # Show fetching message
     fetching_msg = await client.send_message(message.chat.id, "🔄 Fetching Today's Leaderboard Details")
     try:
-        db = get_database()
         # Use UTC timezone for consistency
         now_utc = datetime.utcnow()
         today_utc = now_utc.replace(hour=0, minute=0, second=0, microsecond=0)
         tomorrow_utc = today_utc + timedelta(days=1)
         
-        # Use the optimized database method
-        top_collectors = await db.get_todays_top_collectors(10)
+        # Today's board comes from the in-memory daily counters
+        top_collectors = get_daily_counters().top(10)
         
         if not top_collectors:
             await fetching_msg.delete()
@@ -153,31 +153,8 @@ async def gtop_command(client: Client, message: Message):
     # Show fetching message
     fetching_msg = await client.send_message(message.chat.id, "🔄 Fetching Global Leaderboard Details")
     db = get_database()
-    cache_key = 'gtop'
-    cached = get_cached_leaderboard(cache_key)
-    if cached:
-        await fetching_msg.delete()
-        await client.send_message(message.chat.id, cached, disable_web_page_preview=True)
-        return
     try:
-        collectors = []
-        cursor = await db.users.find({})
-        users = await cursor.to_list(length=None)
-        for user in users:
-            try:
-                characters = user.get('characters', [])
-                if characters:
-                    unique_chars = len(set(characters))
-                    total_chars = len(characters)
-                    collectors.append({
-                        'first_name': user.get('first_name', 'Unknown'),
-                        'user_id': user['user_id'],
-                        'total_count': total_chars,
-                        'unique_count': unique_chars
-                    })
-            except Exception:
-                continue
-        top_collectors = sorted(collectors, key=lambda x: x['total_count'], reverse=True)[:10]
+        top_collectors = await leaderboards.top(db, 'total', 10)
         if not top_collectors:
             await fetching_msg.delete()
             await client.send_message(
@@ -189,12 +166,12 @@ async def gtop_command(client: Client, message: Message):
         medals = ["🥇", "🥈", "🥉"]
         for idx, collector in enumerate(top_collectors, 1):
             user_link = f"tg://user?id={collector['user_id']}"
-            escaped_name = escape_markdown(collector['first_name'], version=2)
+            escaped_name = escape_markdown(collector['first_name'] or 'Unknown', version=2)
             prefix = medals[idx-1] if idx <= 3 else f"{idx}"
             message_text += (
                 f"<b>{prefix}</b> <a href='{user_link}'>{escaped_name}</a> ➣ <b>{collector['total_count']} | ({collector['unique_count']})</b>\n"
             )
-        set_cached_leaderboard(cache_key, message_text)
+        message_text += await my_rank_line(db, 'total', message.from_user.id, "Characters")
         await fetching_msg.delete()
         await client.send_message(
             message.chat.id,
@@ -225,48 +202,9 @@ async def top_command(client: Client, message: Message):
         # First, ensure the current user is added to this group
         await db.add_user_to_group(message.from_user.id, chat.id)
         
-        # Get all users who are members of this specific group
-        cursor = await db.users.find({"groups": chat.id})
-        group_users = await cursor.to_list(length=None)
-
-        # Get actual current group members from Telegram
-        current_members = set()
-        try:
-            async for member in client.get_chat_members(chat.id):
-                if hasattr(member, 'user') and hasattr(member.user, 'id'):
-                    current_members.add(member.user.id)
-        except Exception as e:
-            # If we can't fetch members, fallback to old behavior
-            current_members = None
-
-        # Filter group_users to only those who are still in the group
-        if current_members is not None:
-            group_users = [user for user in group_users if user.get('user_id') in current_members]
-        
-        if not group_users:
-            await fetching_msg.delete()
-            await client.send_message(
-                message.chat.id,
-                "<b>❌ ɴᴏ ᴄᴏʟʟᴇᴄᴛᴏʀs ғᴏᴜɴᴅ ɪɴ ᴛʜɪs ɢʀᴏᴜᴘ!</b>"
-            )
-            return
-        
-        # Process users and their collections
-        collectors = []
-        for user in group_users:
-            characters = user.get('characters', [])
-            if characters:
-                unique_chars = len(set(characters))
-                total_chars = len(characters)
-                collectors.append({
-                    'first_name': user.get('first_name', 'Unknown'),
-                    'user_id': user['user_id'],
-                    'total_count': total_chars,
-                    'unique_count': unique_chars
-                })
-        
-        # Sort by total characters collected and take top 10
-        top_collectors = sorted(collectors, key=lambda x: x['total_count'], reverse=True)[:10]
+        # Members from the group_members index, filtered by the cached Telegram member list
+        current_members = await get_membership_snapshots().get(client, chat.id)
+        top_collectors = await db.get_group_top_collectors(chat.id, 10, current_members)
         
         if not top_collectors:
             await fetching_msg.delete()
@@ -280,7 +218,7 @@ async def top_command(client: Client, message: Message):
         medals = ["🥇", "🥈", "🥉"]
         for idx, collector in enumerate(top_collectors, 1):
             user_link = f"tg://user?id={collector['user_id']}"
-            escaped_name = escape_markdown(collector['first_name'], version=2)
+            escaped_name = escape_markdown(collector['first_name'] or 'Unknown', version=2)
             prefix = medals[idx-1] if idx <= 3 else f"{idx}"
             message_text += (
                 f"<b>{prefix}</b> <a href='{user_link}'>{escaped_name}</a> ➣ <b>{collector['total_count']} | ({collector['unique_count']})</b>\n"
@@ -303,18 +241,7 @@ async def rgtop_command(client: Client, message: Message):
     # Show fetching message
     fetching_msg = await client.send_message(message.chat.id, "🔄 Fetching Richest Collectors Leaderboard")
     db = get_database()
-    rich_users = []
-    cursor = await db.users.find({})
-    users = await cursor.to_list(length=None)
-    for user in users:
-        wallet = user.get('wallet', 0)
-        if wallet > 0:
-            rich_users.append({
-                'first_name': user['first_name'],
-                'user_id': user['user_id'],
-                'wallet': wallet
-            })
-    top_rich = sorted(rich_users, key=lambda x: x['wallet'], reverse=True)[:10]
+    top_rich = await leaderboards.top(db, 'wallet', 10)
     if not top_rich:
         await fetching_msg.delete()
         await client.send_message(
@@ -328,10 +255,11 @@ async def rgtop_command(client: Client, message: Message):
         user_link = f"tg://user?id={user['user_id']}"
         escaped_name = escape_markdown(user['first_name'], version=2)
         prefix = medals[idx-1] if idx <= 3 else f"{idx}"
-        wallet = f"{user['wallet']:,}"
+        wallet = f"{user['score']:,}"
         message_text += (
             f"<b>{prefix}</b> <a href='{user_link}'>{escaped_name}</a> ➣ <b>{wallet} Tokens</b>\n"
         )
+    message_text += await my_rank_line(db, 'wallet', message.from_user.id, "Tokens")
     await fetching_msg.delete()
     await client.send_message(
         message.chat.id,
@@ -352,18 +280,7 @@ async def btop_command(client: Client, message: Message):
             "<b>❌ ᴛʜɪs ᴄᴏᴍᴍᴀɴᴅ ɪs ʀᴇsᴛʀɪᴄᴛᴇᴅ ᴛᴏ ᴏᴡɴᴇʀ ᴀɴᴅ ᴏɢs ᴏɴʟʏ!</b>"
         )
         return
-    bank_users = []
-    cursor = await db.users.find({})
-    users = await cursor.to_list(length=None)
-    for user in users:
-        bank = user.get('bank') or 0
-        if bank > 0:
-            bank_users.append({
-                'first_name': user['first_name'],
-                'user_id': user['user_id'],
-                'bank': bank
-            })
-    top_bank = sorted(bank_users, key=lambda x: x['bank'], reverse=True)[:25]
+    top_bank = await leaderboards.top(db, 'bank', 25)
     if not top_bank:
         await fetching_msg.delete()
         await client.send_message(
@@ -377,10 +294,11 @@ async def btop_command(client: Client, message: Message):
         user_link = f"tg://user?id={user['user_id']}"
         escaped_name = escape_markdown(user['first_name'], version=2)
         prefix = medals[idx-1] if idx <= 3 else f"{idx}"
-        bank = f"{user['bank']:,}"
+        bank = f"{user['score']:,}"
         message_text += (
             f"<b>{prefix}</b> <a href='{user_link}'>{escaped_name}</a> ➣ <b>{bank} Tokens</b>\n"
         )
+    message_text += await my_rank_line(db, 'bank', user_id, "Tokens")
     await fetching_msg.delete()
     await client.send_message(
         message.chat.id,
@@ -393,18 +311,7 @@ async def sgtop_command(client: Client, message: Message):
     # Show fetching message
     fetching_msg = await client.send_message(message.chat.id, "🔄 Fetching Top Shards Collectors Leaderboard")
     db = get_database()
-    shard_users = []
-    cursor = await db.users.find({})
-    users = await cursor.to_list(length=None)
-    for user in users:
-        shards = user.get('shards', 0)
-        if shards > 0:
-            shard_users.append({
-                'first_name': user['first_name'],
-                'user_id': user['user_id'],
-                'shards': shards
-            })
-    top_shards = sorted(shard_users, key=lambda x: x['shards'], reverse=True)[:10]
+    top_shards = await leaderboards.top(db, 'shards', 10)
     if not top_shards:
         await fetching_msg.delete()
         await client.send_message(
@@ -418,10 +325,11 @@ async def sgtop_command(client: Client, message: Message):
         user_link = f"tg://user?id={user['user_id']}"
         escaped_name = escape_markdown(user['first_name'], version=2)
         prefix = medals[idx-1] if idx <= 3 else f"{idx}"
-        shards = f"{user['shards']:,}"
+        shards = f"{user['score']:,}"
         message_text += (
             f"<b>{prefix}</b> <a href='{user_link}'>{escaped_name}</a> ➣ <b>{shards} Shards</b>\n"
         )
+    message_text += await my_rank_line(db, 'shards', message.from_user.id, "Shards")
     await fetching_msg.delete()
     await client.send_message(
         message.chat.id,
@@ -440,8 +348,8 @@ async def test_leaderboard_command(client: Client, message: Message):
     try:
         db = get_database()
         
-        # Use the optimized database method
-        top_collectors = await db.get_todays_top_collectors(10)
+        # Today's board comes from the in-memory daily counters
+        top_collectors = get_daily_counters().top(10)
         
         if not top_collectors:
             await message.reply_text(
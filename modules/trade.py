@@ -410,11 +410,13 @@ async def handle_trade_callback(client: Client, callback_query: CallbackQuery):
             )
             await db.add_character_to_user(
                 trade['to_user'].id,
-                trade['from_char']['character_id']
+                trade['from_char']['character_id'],
+                source='trade'
             )
             await db.add_character_to_user(
                 trade['from_user'].id,
-                trade['to_char']['character_id']
+                trade['to_char']['character_id'],
+                source='trade'
             )
             # Log transaction for both users
             now_str = datetime.now().strftime('%Y-%m-%d')
@@ -712,11 +714,7 @@ async def handle_massgift_callback(client: Client, callback_query: CallbackQuery
                         target_data = await db.get_user(target_id)
                         if target_data:
                             target_chars = target_data.get('characters', []) + char_ids
-                            target_history = target_data.get('collection_history', []) + collection_history
-                            await db.update_user(target_id, {
-                                'characters': target_chars,
-                                'collection_history': target_history
-                            })
+                            await db.update_user(target_id, {'characters': target_chars})
                         else:
                             # Create new user if doesn't exist
                             await db.add_user({
@@ -727,7 +725,6 @@ async def handle_massgift_callback(client: Client, callback_query: CallbackQuery
                                 'wallet': 0,
                                 'bank': 0,
                                 'characters': char_ids,
-                                'collection_history': collection_history,
                                 'last_daily': None,
                                 'last_weekly': None,
                                 'last_monthly': None,
@@ -738,6 +735,7 @@ async def handle_massgift_callback(client: Client, callback_query: CallbackQuery
                                     'filter': None
                                 }
                             })
+                        await db.log_collection_events(target_id, collection_history)
                         # Log transaction for sender
                         await db.log_user_transaction(user_id, "gift_sent", {
                             "to_user_id": target_id,
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('user_id', 'action_type', 'details', 'created_at')
+
+
+class TransactionLogWriter:
+    """Write-behind logger for the user_transactions table.
+
+    Commands enqueue rows and return immediately; a single worker drains the
+    queue and writes a batch whenever `batch_size` rows are waiting or
+    `flush_interval` seconds have passed since the first row of the batch.
+    Batches go out with COPY, falling back to executemany. The queue is
+    bounded: when it is full, callers wait for room (counted in
+    `backpressure_waits`) instead of the backlog growing without limit.
+    """
+
+    def __init__(self, max_queue: int = 10000, batch_size: int = 500, flush_interval: float = 0.25):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._pool = None
+        self._worker: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'failed': 0,
+            'batches': 0,
+            'backpressure_waits': 0,
+            'max_depth': 0,
+            'last_batch_size': 0,
+            'last_flush_ms': 0.0,
+        }
+
+    def start(self, pool):
+        """Point the writer at a connection pool and start the flush worker"""
+        self._pool = pool
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def log(self, user_id: int, action_type: str, details: dict):
+        """Queue one transaction row; only waits when the queue is full"""
+        row = (user_id, action_type, json.dumps(details, default=str), datetime.utcnow())
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self._stats['backpressure_waits'] += 1
+            await self._queue.put(row)
+        self._stats['enqueued'] += 1
+        depth = self._queue.qsize()
+        if depth > self._stats['max_depth']:
+            self._stats['max_depth'] = depth
+
+    async def flush(self):
+        """Write everything queued so far"""
+        while not self._queue.empty():
+            batch = []
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._write(batch)
+
+    async def close(self):
+        """Stop the worker and write whatever is still queued"""
+        self._stopping = True
+        try:
+            if self._worker is not None:
+                await self._worker
+                self._worker = None
+            await self.flush()
+        finally:
+            self._stopping = False
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        return stats
+
+    async def _run(self):
+        while not self._stopping:
+            batch = await self._collect()
+            await self._write(batch)
+
+    async def _collect(self) -> List[tuple]:
+        # Wait for a first row, then keep filling the batch until it is full or
+        # `flush_interval` has passed; idle waits wake up to notice close()
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size and not self._stopping:
+            timeout = self.flush_interval if deadline is None else deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                row = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                if batch:
+                    break
+                continue
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            batch.append(row)
+        return batch
+
+    async def _write(self, batch: List[tuple]):
+        if not batch:
+            return
+        if self._pool is None:
+            self._stats['failed'] += len(batch)
+            logger.error(f"Dropped {len(batch)} transaction log rows: no database pool")
+            return
+        started = time.perf_counter()
+        try:
+            async with self._pool.acquire() as conn:
+                try:
+                    await conn.copy_records_to_table('user_transactions', records=batch, columns=COLUMNS)
+                except Exception as e:
+                    logger.warning(f"COPY into user_transactions failed, retrying with INSERT: {e}")
+                    await conn.executemany("""
+                        INSERT INTO user_transactions (user_id, action_type, details, created_at)
+                        VALUES ($1, $2, $3, $4)
+                    """, batch)
+            self._stats['written'] += len(batch)
+        except Exception as e:
+            self._stats['failed'] += len(batch)
+            logger.error(f"Error writing {len(batch)} transaction log rows: {e}")
+        self._stats['batches'] += 1
+        self._stats['last_batch_size'] = len(batch)
+        self._stats['last_flush_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+
+_transaction_log = TransactionLogWriter()
+
+
+def get_transaction_log() -> TransactionLogWriter:
+    """Get the process-wide transaction log writer"""
+    return _transaction_log
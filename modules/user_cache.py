@@ -0,0 +1,103 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from cachetools import TTLCache
+
+
+class UserCache:
+    """Short-lived cache of full users rows with single-flight loading.
+
+    Only whole rows are cached; projected reads are answered from a cached
+    row when there is one and otherwise go to the database. Concurrent
+    lookups for the same (user, fields) share one query. Writers call
+    `invalidate` (or `set_field` when they already know the new value); a
+    load that overlaps an invalidation is returned to its callers but never
+    stored, so a stale row can't land in the cache after a write.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: int = 120):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: Dict[Tuple[int, Optional[tuple]], asyncio.Future] = {}
+        self._loading: Dict[int, int] = {}
+        self._stale: set = set()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    async def get(self, user_id: int, fields, loader: Callable[[], Awaitable[Any]]):
+        """Cached row (or projection of it), loading it with `loader` on a miss"""
+        fields = tuple(fields) if fields is not None else None
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self.hits += 1
+            return entry.clone() if fields is None else entry.project(fields)
+        key = (user_id, fields)
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            row = await asyncio.shield(pending)
+            return row.clone() if row is not None else None
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self._loading[user_id] = self._loading.get(user_id, 0) + 1
+        try:
+            row = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # waiters re-raise it; don't warn when there are none
+            raise
+        finally:
+            self._inflight.pop(key, None)
+            stale = user_id in self._stale
+            self._loading[user_id] -= 1
+            if not self._loading[user_id]:
+                del self._loading[user_id]
+                self._stale.discard(user_id)
+        if fields is None and row is not None and not stale:
+            self._entries[user_id] = row
+        future.set_result(row)
+        return row.clone() if row is not None else None
+
+    def invalidate(self, user_id: int = None):
+        """Forget one user (or everyone, when `user_id` is None)"""
+        self.invalidations += 1
+        if user_id is None:
+            self._entries.clear()
+            self._stale.update(self._loading)
+            return
+        self._entries.pop(user_id, None)
+        if user_id in self._loading:
+            self._stale.add(user_id)
+
+    def set_field(self, user_id: int, **values):
+        """Write known new column values into a cached row"""
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            for column, value in values.items():
+                entry[column] = value
+        if user_id in self._loading:
+            self._stale.add(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'invalidations': self.invalidations,
+            'hit_rate': round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
+
+
+_user_cache = UserCache()
+
+
+def get_user_cache() -> UserCache:
+    """Get the process-wide user profile cache"""
+    return _user_cache
@@ -0,0 +1,84 @@
+import time
+from datetime import date, datetime
+from typing import Any, Dict, List
+
+
+def estimate_bytes(value: Any) -> int:
+    """Rough wire size of one column value as asyncpg hands it back"""
+    if value is None:
+        return 0
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, (bool, int, float, datetime, date)):
+        return 8
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_bytes(v) for v in value) + 4
+    if isinstance(value, dict):
+        return sum(len(str(k)) + estimate_bytes(v) for k, v in value.items())
+    return len(str(value))
+
+
+class UserFetchReport:
+    """Per-call-site bytes and latency of user row fetches.
+
+    Each get_user call is attributed to the first frame outside the database
+    module. Full-row (SELECT *) fetches set the baseline row size; projected
+    fetches are credited with the bytes they did not pull.
+    """
+
+    def __init__(self):
+        self._sites: Dict[str, dict] = {}
+        self._full_rows = 0
+        self._full_bytes = 0
+        self.started_at = time.time()
+
+    def record(self, site: str, row, elapsed: float, projected: bool):
+        size = sum(estimate_bytes(v) for v in row.values()) if row else 0
+        entry = self._sites.get(site)
+        if entry is None:
+            entry = self._sites[site] = {'calls': 0, 'projected': 0, 'bytes': 0, 'projected_bytes': 0, 'seconds': 0.0}
+        entry['calls'] += 1
+        entry['bytes'] += size
+        entry['seconds'] += elapsed
+        if projected:
+            entry['projected'] += 1
+            entry['projected_bytes'] += size
+        elif row:
+            self._full_rows += 1
+            self._full_bytes += size
+
+    @property
+    def full_row_bytes(self) -> float:
+        """Average size of a full users row seen so far"""
+        return self._full_bytes / self._full_rows if self._full_rows else 0.0
+
+    def summary(self, limit: int = 15) -> List[dict]:
+        """Call sites ordered by bytes fetched, with estimated savings"""
+        baseline = self.full_row_bytes
+        rows = []
+        for site, entry in self._sites.items():
+            saved = max(baseline * entry['projected'] - entry['projected_bytes'], 0)
+            rows.append({
+                'site': site,
+                'calls': entry['calls'],
+                'projected': entry['projected'],
+                'avg_bytes': entry['bytes'] / entry['calls'],
+                'avg_ms': entry['seconds'] * 1000 / entry['calls'],
+                'saved_bytes': int(saved),
+            })
+        rows.sort(key=lambda r: r['avg_bytes'] * r['calls'], reverse=True)
+        return rows[:limit]
+
+    def reset(self):
+        self._sites.clear()
+        self._full_rows = 0
+        self._full_bytes = 0
+        self.started_at = time.time()
+
+
+_user_fetch_report = UserFetchReport()
+
+
+def get_user_fetch_report() -> UserFetchReport:
+    """Get the process-wide user fetch report"""
+    return _user_fetch_report
@@ -145,10 +145,9 @@ async def vidlist_command(client: Client, message: Message):
         db = get_database()
     try:
         # Get all video characters from the database
-        if hasattr(db, 'pool'):  # PostgreSQL
-            async with db.pool.acquire() as conn:
-                video_chars_result = await conn.fetch("SELECT * FROM characters WHERE is_video = TRUE")
-                video_chars = [dict(char) for char in video_chars_result]
+        if hasattr(db, 'pool'):  # PostgreSQL (in-memory catalog)
+            catalog = await db.get_catalog()
+            video_chars = [dict(char) for char in catalog.videos()]
         else:  # MongoDB
             video_chars = await db.characters.find({'is_video': True}).to_list(length=None)
         